@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+# Offline measurement scripts; run from the repository root, e.g. `python -m benchmarks.rectification_report`
@@ -0,0 +1,70 @@
+# band_benchmark.py
+# Throughput and height accuracy of band-mode matching against the full-frame matcher.
+# Run from the repository root:
+#   python -m benchmarks.band_benchmark [--map-file stereoMap.xml] [--margins 0 8 16 32]
+import argparse
+import json
+import os
+
+import numpy as np
+
+from modules.depth_map.band_matching import zone_bands, compute_band_disparity
+from modules.depth_map.zones import ZoneSet, zone_statistics
+from modules.edge_detection.calibration import Rectification
+from .common import ROOT_DIR, load_rectification_pairs, load_q, sgbm_from_params, time_calls, summarize
+
+
+def run_benchmark(map_file=None, zones=(40, 200, 400), margins=(0, 8, 16, 32), repeat=5):
+    with open(os.path.join(ROOT_DIR, 'modules', 'depth_map', 'depth_map_params.json')) as file:
+        matcher = sgbm_from_params(json.load(file))
+    Q = load_q()
+    pairs = load_rectification_pairs()
+    if map_file:
+        rectification = Rectification(map_file)
+        pairs = [rectification.undistortrectify(left, right) for left, right in pairs]
+    zone_set = ZoneSet(list(zones), pairs[0][0].shape)
+    zones = list(zones)
+
+    # Mean zone distance, as measure_zones computes it
+    def heights(disparity_raw):
+        return zone_statistics(disparity_raw, zone_set, Q)['mean'].tolist()
+
+    full_times, reference = [], []
+    for left, right in pairs:
+        full_times += time_calls(lambda: matcher.compute(left, right), repeat=repeat, warmup=1)
+        reference.append(heights(matcher.compute(left, right)))
+    results = {'full': {'rows': pairs[0][0].shape[0], **summarize(full_times)}}
+
+    for margin in margins:
+        times, errors = [], []
+        for (left, right), expected in zip(pairs, reference):
+            bands = zone_bands(zones, left.shape[0], matcher.getBlockSize(), margin)
+            times += time_calls(lambda: compute_band_disparity(matcher, left, right, bands), repeat=repeat, warmup=1)
+            actual = heights(compute_band_disparity(matcher, left, right, bands))
+            errors += [abs(h - e) / e for h, e in zip(actual, expected) if np.isfinite(h) and np.isfinite(e)]
+        rows = sum(y1 - y0 for y0, y1 in bands)
+        results[f'bands_margin_{margin}'] = {'rows': rows, **summarize(times),
+                                             'speedup': results['full']['p50_ms'] / summarize(times)['p50_ms'],
+                                             'mean_rel_height_error': float(np.mean(errors)) if errors else None,
+                                             'max_rel_height_error': float(np.max(errors)) if errors else None}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare band-mode and full-frame SGBM.")
+    parser.add_argument('--map-file', help="Rectify the recorded pairs with this stereoMap.xml first")
+    parser.add_argument('--margins', type=int, nargs='+', default=[0, 8, 16, 32])
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.map_file, margins=args.margins)
+    for name, result in results.items():
+        line = f"{name:<18} rows {result['rows']:>4}  p50 {result['p50_ms']:7.2f} ms"
+        if 'speedup' in result:
+            error = result['mean_rel_height_error']
+            line += f"  x{result['speedup']:.1f}  height error " + (f"{100 * error:.2f}%" if error is not None
+                                                                   else "n/a (no valid heights)")
+        print(line)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
@@ -0,0 +1,70 @@
+# common.py
+import glob
+import os
+import re
+import time
+
+import cv2 as cv
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RECTIFICATION_IMAGES = os.path.join(ROOT_DIR, 'modules', 'edge_detection', 'StereoVisionCalibration',
+                                    'RectificationImages')
+
+
+# Sort imageL0, imageL1, ..., imageL10 numerically
+def _image_number(path):
+    return int(re.findall(r'\d+', os.path.basename(path))[-1])
+
+
+# Load the recorded calibration pairs as (left, right) grayscale images
+def load_rectification_pairs(directory=RECTIFICATION_IMAGES):
+    lefts = sorted(glob.glob(os.path.join(directory, 'stereoLeft', '*.png')), key=_image_number)
+    rights = sorted(glob.glob(os.path.join(directory, 'stereoRight', '*.png')), key=_image_number)
+    pairs = []
+    for left, right in zip(lefts, rights):
+        pairs.append((cv.imread(left, cv.IMREAD_GRAYSCALE), cv.imread(right, cv.IMREAD_GRAYSCALE)))
+    return pairs
+
+
+# Run fn repeatedly and return the per-call times in milliseconds
+def time_calls(fn, repeat=20, warmup=2):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000.0)
+    return times
+
+
+# Percentile summary of a list of millisecond timings
+def summarize(times):
+    values = np.asarray(times, dtype=np.float64)
+    return {'mean_ms': float(values.mean()), 'p50_ms': float(np.percentile(values, 50)),
+            'p95_ms': float(np.percentile(values, 95)), 'p99_ms': float(np.percentile(values, 99))}
+
+
+# Peak signal-to-noise ratio between two 8-bit images (inf when identical)
+def psnr(reference, image):
+    mse = np.mean((reference.astype(np.float64) - image.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else float(10.0 * np.log10(255.0 ** 2 / mse))
+
+
+# StereoSGBM matcher built from a depth_map_params.json dict (trackbar encoding)
+def sgbm_from_params(params):
+    return cv.StereoSGBM_create(minDisparity=params['minDisparity'], numDisparities=params['numDisparities'] * 16,
+                                blockSize=params['blockSize'] * 2 + 5, P1=params['P1'], P2=params['P2'],
+                                disp12MaxDiff=params['disp12MaxDiff'], uniquenessRatio=params['uniquenessRatio'],
+                                speckleWindowSize=params['speckleWindowSize'], speckleRange=params['speckleRange'],
+                                preFilterCap=params['preFilterCap'],
+                                mode=params.get('mode', cv.STEREO_SGBM_MODE_SGBM_3WAY))
+
+
+# Q matrix as written by stereo_calibration.py
+def load_q(path=os.path.join(ROOT_DIR, 'Q.xml')):
+    cv_file = cv.FileStorage(path, cv.FILE_STORAGE_READ)
+    Q = cv_file.getNode('Q').mat()
+    cv_file.release()
+    return Q
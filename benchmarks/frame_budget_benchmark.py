@@ -0,0 +1,127 @@
+# frame_budget_benchmark.py
+# Frame-budget controller (modules/pipeline/frame_budget.py). First ranks candidate ladder rungs by their
+# frame cost (rectify + preprocess + disparity + zones) and height change against full quality, then runs
+# the frame loop with a competing CPU load in the middle third of the run ("throttling"), with and without
+# the controller, and reports frame times, frames over budget and the level changes. Run from the repository
+# root:
+#   python -m benchmarks.frame_budget_benchmark [--frames 300 --target-ms 0 (auto)]
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from config import config
+from modules.depth_map import Preprocessor, DepthMapProcessorSGBM
+from modules.depth_map.synthetic import synthetic_stereo_pair
+from modules.edge_detection.calibration import Rectification, identity_maps
+from modules.pipeline import FrameBudgetController, build_ladder
+from .common import ROOT_DIR
+
+# Single-setting rungs, each on top of full quality
+CANDIDATE_RUNGS = [{'name': 'full'}, {'name': 'linear', 'interpolation': 'linear'},
+                   {'name': 'nearest', 'interpolation': 'nearest'}, {'name': 'disparities96', 'numDisparities': 6},
+                   {'name': 'disparities64', 'numDisparities': 4}, {'name': 'mode_sgbm', 'mode': 'sgbm'},
+                   {'name': 'mode_hh4', 'mode': 'hh4'}, {'name': 'half_resolution', 'match_scale': 2},
+                   {'name': 'quarter_resolution', 'match_scale': 4}]
+ZONES = [200, 240, 280]  # Rows on the synthetic cable
+
+
+def create_components(shape):
+    rectification = Rectification(maps=identity_maps(shape), interpolation=config.RECTIFICATION_INTERPOLATION,
+                                  fixed_point=True)
+    preprocessor = Preprocessor(headless=True)
+    processor = DepthMapProcessorSGBM(q_file_path=os.path.join(ROOT_DIR, 'Q.xml'), headless=True)
+    return rectification, preprocessor, processor
+
+
+# One frame through the stages at the given quality level; returns (heights, ms)
+def process(components, budget, level, left, right):
+    rectification, preprocessor, processor = components
+    start = time.perf_counter()
+    budget.apply_rectification(rectification, level)
+    budget.apply_matcher(processor, level)
+    left, right = rectification.undistortrectify(left, right)
+    left, right = preprocessor.preprocess_pair(left, right)
+    heights = processor.compute_heights(left, right, ZONES)
+    return heights, (time.perf_counter() - start) * 1000.0
+
+
+def rank_rungs(pairs, repeat=5):
+    components = create_components(pairs[0][0].shape)
+    budget = FrameBudgetController(None, interpolation=config.RECTIFICATION_INTERPOLATION)
+    results, reference = [], None
+    for level in [build_ladder([rung], config.RECTIFICATION_INTERPOLATION)[0] for rung in CANDIDATE_RUNGS]:
+        process(components, budget, level, *pairs[0])  # Warm-up: matcher build and buffers
+        times, heights = [], []
+        for left, right in pairs:
+            frame_heights, _ = process(components, budget, level, left, right)
+            heights.append(frame_heights)
+            times.append(min(process(components, budget, level, left, right)[1] for _ in range(repeat)))
+        heights = np.array(heights)
+        reference = heights if reference is None else reference
+        change = np.nanmean(np.abs(heights - reference) / np.abs(reference)) * 100.0
+        results.append((level.name, float(np.mean(times)), float(change)))
+    return results
+
+
+# Competing CPU load, standing in for a throttled board
+def burn(stop):
+    while not stop.is_set():
+        sum(range(10000))
+
+
+# The controller retries a level it left after retry_after seconds; the run is short, so that is shortened too
+def run_loop(pairs, frames, target_ms, controlled, retry_after=3.0):
+    components = create_components(pairs[0][0].shape)
+    budget = FrameBudgetController(target_ms if controlled else None, config.QUALITY_LADDER,
+                                   interpolation=config.RECTIFICATION_INTERPOLATION,
+                                   window=config.FRAME_BUDGET_WINDOW, headroom=config.FRAME_BUDGET_HEADROOM,
+                                   retry_after=retry_after)
+    stop = multiprocessing.Event()
+    load = None
+    phases = {'before': [], 'load': [], 'after': []}
+    trace = []
+    for i in range(frames):
+        phase = 'before' if i < frames // 3 else 'load' if i < 2 * frames // 3 else 'after'
+        if phase == 'load' and load is None:
+            load = multiprocessing.Process(target=burn, args=(stop,), daemon=True)
+            load.start()
+        elif phase == 'after' and load is not None and load.is_alive():
+            stop.set()
+            load.join()
+        level = budget.level
+        _, ms = process(components, budget, level, *pairs[i % len(pairs)])
+        budget.observe(ms)
+        phases[phase].append(ms)
+        if not trace or trace[-1][1] != level.name:
+            trace.append((i, level.name))
+    stop.set()
+    if load is not None:
+        load.join()
+    return phases, trace
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Frame-budget controller: rung costs and behaviour under load.")
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--target-ms', type=float, default=0.0, help="0: 1.5 x the full-quality frame time")
+    args = parser.parse_args()
+
+    pairs = [synthetic_stereo_pair(seed=seed)[:2] for seed in range(3)]
+    ranked = rank_rungs(pairs)
+    print("Rung costs (one setting on top of full quality, 640x480, this machine):")
+    for name, ms, change in sorted(ranked, key=lambda r: -r[1]):
+        print(f"  {name:20s} {ms:7.1f} ms  height change {change:5.2f} %")
+
+    target_ms = args.target_ms or ranked[0][1] * 1.5
+    print(f"Target {target_ms:.1f} ms, ladder {[rung.get('name') for rung in config.QUALITY_LADDER]}")
+    for controlled in (False, True):
+        phases, trace = run_loop(pairs, args.frames, target_ms, controlled)
+        summary = "  ".join(f"{phase}: mean {np.mean(times):6.1f} ms, over budget "
+                            f"{np.mean(np.array(times) > target_ms) * 100:5.1f} %"
+                            for phase, times in phases.items())
+        print(f"{'Controller' if controlled else 'No controller':14s} {summary}")
+        if controlled:
+            print("  Levels: " + ", ".join(f"frame {i}: {name}" for i, name in trace))
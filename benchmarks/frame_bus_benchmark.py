@@ -0,0 +1,212 @@
+# frame_bus_benchmark.py
+# Shared-memory frame bus: throughput against a pickling multiprocessing.Queue, and a demo in which a
+# capture process keeps draining a simulated camera at full rate while the compute process stalls.
+# Run from the repository root:
+#   python -m benchmarks.frame_bus_benchmark [--pairs 2000]
+#   python -m benchmarks.frame_bus_benchmark --demo [--fps 30 --seconds 10 --stall-ms 500]
+import argparse
+import collections
+import multiprocessing
+import threading
+import time
+
+import numpy as np
+
+from modules.camera.frame_bus import FrameBus, capture_to_bus
+
+SHAPE = (480, 640)
+
+
+def test_frames(count=4, shape=SHAPE):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, shape, dtype=np.uint8) for _ in range(count)]
+
+
+# Reader for the throughput run: touch one pixel of every pair it gets to (zero-copy views)
+def bus_reader(name, pairs, result):
+    bus = FrameBus.attach(name)
+    seen, skipped, last = 0, 0, -1
+    while last < pairs - 1:
+        head = bus.wait(last, timeout=5.0)
+        if head is None:
+            break
+        for sequence in range(last + 1, head + 1):
+            pair = bus.read(sequence)
+            if pair is None:
+                skipped += 1
+                continue
+            int(pair[0][0, 0]) + int(pair[1][-1, -1])
+            seen += bool(bus.valid(sequence))
+        last = head
+    result.put((seen, skipped))
+    bus.close()
+
+
+def queue_reader(frames, pairs, result):
+    seen = 0
+    for _ in range(pairs):
+        left, right = frames.get()
+        int(left[0, 0]) + int(right[-1, -1])
+        seen += 1
+    result.put((seen, 0))
+
+
+def throughput(pairs=2000, slots=8):
+    context = multiprocessing.get_context('spawn')
+    left, right = test_frames(2)
+    pair_bytes = left.nbytes + right.nbytes
+    results = {}
+
+    bus = FrameBus.create(SHAPE, slots)
+    result = context.Queue()
+    reader = context.Process(target=bus_reader, args=(bus.name, pairs, result))
+    reader.start()
+    time.sleep(1.0)  # Let the reader attach before timing
+    start = time.perf_counter()
+    for _ in range(pairs):
+        bus.publish(left, right, time.monotonic(), time.monotonic())
+    elapsed = time.perf_counter() - start
+    seen, skipped = result.get()
+    reader.join()
+    bus.close()
+    results['frame_bus'] = {'pairs_per_s': pairs / elapsed, 'gb_per_s': pairs * pair_bytes / elapsed / 1e9,
+                            'reader_seen': seen, 'reader_overwritten': skipped}
+
+    frames = context.Queue(slots)
+    reader = context.Process(target=queue_reader, args=(frames, pairs, result))
+    reader.start()
+    time.sleep(1.0)
+    start = time.perf_counter()
+    for _ in range(pairs):
+        frames.put((left, right))
+    seen, _ = result.get()
+    elapsed = time.perf_counter() - start
+    reader.join()
+    results['pickled_queue'] = {'pairs_per_s': pairs / elapsed, 'gb_per_s': pairs * pair_bytes / elapsed / 1e9,
+                                'reader_seen': seen}
+    return results
+
+
+# Camera stand-in: a driver thread produces pairs at a fixed rate into a small buffer, like V4L2/USB
+# buffers; when nobody drains it in time, the oldest frame is lost and counted as a drop
+class SimulatedStereoCamera:
+    def __init__(self, fps=30.0, buffers=4):
+        self.frames = test_frames()
+        self.interval = 1.0 / fps
+        self.buffer = collections.deque()
+        self.buffers = buffers
+        self.condition = threading.Condition()
+        self.produced = 0
+        self.drops = 0
+        self.stopped = False
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        next_frame = time.monotonic()
+        while not self.stopped:
+            next_frame += self.interval
+            time.sleep(max(0.0, next_frame - time.monotonic()))
+            frame = self.frames[self.produced % len(self.frames)]
+            with self.condition:
+                if len(self.buffer) >= self.buffers:
+                    self.buffer.popleft()
+                    self.drops += 1
+                self.buffer.append((frame, frame, time.monotonic(), time.monotonic()))
+                self.produced += 1
+                self.condition.notify()
+
+    def read_pair(self, timeout=1.0):
+        with self.condition:
+            if not self.buffer and not self.condition.wait(timeout):
+                return None
+            return self.buffer.popleft() if self.buffer else None
+
+    def stop(self):
+        self.stopped = True
+
+
+def capture_process(name, fps, stop, result):
+    camera = SimulatedStereoCamera(fps)
+    bus = FrameBus.attach(name)
+    published = capture_to_bus(camera, bus, stop, timeout=0.1)
+    camera.stop()
+    result.put({'produced': camera.produced, 'drops': camera.drops, 'published': published})
+    bus.close()
+
+
+# Compute stand-in: work_ms per pair, and a stall_ms pause (GC, OPC UA callback, ...) every stall_every pairs
+def compute(pair, processed, work_ms, stall_ms, stall_every):
+    int(pair[0][0, 0])
+    time.sleep(work_ms / 1000.0)
+    if processed % stall_every == stall_every - 1:
+        time.sleep(stall_ms / 1000.0)
+
+
+def compute_process(name, seconds, work_ms, stall_ms, stall_every, result):
+    bus = FrameBus.attach(name)
+    processed, skipped, last = 0, 0, -1
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        head = bus.wait(last, timeout=0.5)
+        if head is None:
+            continue
+        skipped += max(0, head - last - 1)  # Latest-frame policy: older pairs are skipped, never queued
+        pair = bus.read(head)
+        if pair is not None:
+            compute(pair, processed, work_ms, stall_ms, stall_every)
+            processed += 1
+        last = head
+    result.put({'processed': processed, 'skipped': skipped})
+    bus.close()
+
+
+def demo(fps=30.0, seconds=10.0, work_ms=20.0, stall_ms=500.0, stall_every=10):
+    results = {}
+
+    # Baseline: capture and compute in one loop, as in main.py today
+    camera = SimulatedStereoCamera(fps)
+    processed, end = 0, time.monotonic() + seconds
+    while time.monotonic() < end:
+        pair = camera.read_pair()
+        if pair is not None:
+            compute(pair, processed, work_ms, stall_ms, stall_every)
+            processed += 1
+    camera.stop()
+    results['single_process'] = {'produced': camera.produced, 'drops': camera.drops, 'processed': processed}
+
+    # Frame bus: a capture process drains the camera, the compute process takes the latest pair
+    context = multiprocessing.get_context('spawn')
+    bus = FrameBus.create(SHAPE, 8)
+    stop, capture_result, compute_result = context.Event(), context.Queue(), context.Queue()
+    capture = context.Process(target=capture_process, args=(bus.name, fps, stop, capture_result))
+    worker = context.Process(target=compute_process,
+                             args=(bus.name, seconds, work_ms, stall_ms, stall_every, compute_result))
+    capture.start()
+    worker.start()
+    results['frame_bus'] = compute_result.get()
+    stop.set()
+    results['frame_bus'].update(capture_result.get())
+    capture.join()
+    worker.join()
+    bus.close()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Shared-memory frame bus benchmark and stall demo.")
+    parser.add_argument('--pairs', type=int, default=2000, help="Pairs for the throughput run")
+    parser.add_argument('--demo', action='store_true', help="Run the stalled-compute demo instead")
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--work-ms', type=float, default=20.0)
+    parser.add_argument('--stall-ms', type=float, default=500.0)
+    args = parser.parse_args()
+
+    if args.demo:
+        for name, result in demo(args.fps, args.seconds, args.work_ms, args.stall_ms).items():
+            print(f"{name:<15} {result}")
+    else:
+        for name, result in throughput(args.pairs).items():
+            print(f"{name:<14} {result['pairs_per_s']:8.0f} pairs/s  {result['gb_per_s']:.2f} GB/s  "
+                  f"reader saw {result['reader_seen']}" + (f", {result['reader_overwritten']} overwritten"
+                                                          if 'reader_overwritten' in result else ""))
@@ -0,0 +1,82 @@
+# instrumentation_overhead.py
+# Cost of the stage timing hooks relative to frame time. The per-frame hook cost (six now()/record() pairs
+# plus the counters) is measured directly, and the real depth pipeline is run on the recorded pairs with
+# instrumentation on and off, interleaved. Run from the repository root:
+#   python -m benchmarks.instrumentation_overhead
+import argparse
+import os
+import time
+
+from modules.depth_map import Preprocessor, DepthMapProcessorSGBM
+from modules.diagnostics import create_instrumentation
+from modules.diagnostics.instrumentation import STAGES
+from modules.edge_detection.calibration import Rectification, identity_maps
+from .common import ROOT_DIR, load_rectification_pairs, summarize
+
+ZONES = [40, 200, 400]
+
+
+# Microseconds spent in the hooks for one frame
+def hook_cost_us(instrumentation, frames=20000):
+    heights = [1.0, float('nan'), 2.0]
+    start = time.perf_counter()
+    for _ in range(frames):
+        for stage in STAGES:
+            stage_start = instrumentation.now()
+            instrumentation.record(stage, stage_start)
+        instrumentation.count('frames')
+        instrumentation.count_nan(heights)
+    return (time.perf_counter() - start) / frames * 1e6
+
+
+# Production path with the same hooks as main.main()
+def run_frame(left, right, rectification, preprocessor, sgbm, instrumentation):
+    start = instrumentation.now()
+    left, right = rectification.undistortrectify(left, right)
+    instrumentation.record('rectify', start)
+    start = instrumentation.now()
+    left, right = preprocessor.preprocess_pair(left, right)
+    instrumentation.record('preprocess', start)
+    start = instrumentation.now()
+    disparity_raw = sgbm.compute_disparity(left, right, ZONES)
+    instrumentation.record('disparity', start)
+    start = instrumentation.now()
+    heights = sgbm.compute_heights_from_disparity(disparity_raw, ZONES)
+    instrumentation.record('reprojection', start)
+    instrumentation.count('frames')
+    instrumentation.count_nan(heights)
+
+
+def run_benchmark(repeat=3):
+    pairs = load_rectification_pairs()
+    rectification = Rectification(fixed_point=True, maps=identity_maps(pairs[0][0].shape[:2]))
+    preprocessor = Preprocessor(config_file=os.path.join(ROOT_DIR, 'modules', 'depth_map', 'preprocess_params.json'),
+                                headless=True)
+    sgbm = DepthMapProcessorSGBM(config_file=os.path.join(ROOT_DIR, 'modules', 'depth_map', 'depth_map_params.json'),
+                                 q_file_path=os.path.join(ROOT_DIR, 'Q.xml'), headless=True)
+    variants = {'on': create_instrumentation(True), 'off': create_instrumentation(False)}
+    times = {name: [] for name in variants}
+
+    run_frame(*pairs[0], rectification, preprocessor, sgbm, variants['off'])  # Warm-up
+    for _ in range(repeat):
+        for left, right in pairs:
+            # Alternate the order so drift in machine load hits both variants equally
+            for name in (('on', 'off') if len(times['on']) % 2 else ('off', 'on')):
+                start = time.perf_counter()
+                run_frame(left, right, rectification, preprocessor, sgbm, variants[name])
+                times[name].append((time.perf_counter() - start) * 1000.0)
+
+    frame_ms = summarize(times['off'])['p50_ms']
+    hook_us = hook_cost_us(create_instrumentation(True))
+    print(f"Frame time p50: off {frame_ms:.2f} ms, on {summarize(times['on'])['p50_ms']:.2f} ms "
+          f"({len(times['off'])} frames each)")
+    print(f"Hook cost: {hook_us:.2f} us/frame enabled, {hook_cost_us(create_instrumentation(False)):.2f} us/frame "
+          f"disabled = {hook_us / (frame_ms * 10.0):.4f} % of frame time")
+    print(f"Diagnostics snapshot: {variants['on'].snapshot()['stages']['disparity']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Instrumentation overhead on the depth pipeline.")
+    parser.add_argument('--repeat', type=int, default=3, help="Passes over the recorded pairs")
+    args = parser.parse_args()
+    run_benchmark(args.repeat)
@@ -0,0 +1,117 @@
+# live_parameters_benchmark.py
+# Live parameter control (modules/pipeline/live_parameters.py): hot-path cost of picking up the frame's
+# snapshot, frames that see parameters change mid-frame with a shared dict vs snapshots, and the apply
+# latency from an OPC UA client write to the first frame using it. Run from the repository root:
+#   python -m benchmarks.live_parameters_benchmark [--fps 30 --writes 20]
+import argparse
+import threading
+import time
+
+from opcua import Client, ua
+
+from modules.opc_server import OpcuaServer
+from modules.pipeline import LiveParameters
+
+PREPROCESS = {'NOISE_THRESHOLD': 0.26, 'GAMMA': 0.9, 'CONTRAST_LEVEL': 4.81}
+SGBM = {'numDisparities': 10, 'blockSize': 5, 'uniquenessRatio': 75}
+ZONES = [40, 200, 400]
+
+
+def hot_path_ns(frames=200000):
+    parameters = LiveParameters(PREPROCESS, SGBM, ZONES)
+    start = time.perf_counter()
+    for _ in range(frames):
+        snapshot = parameters.acquire()
+        snapshot.preprocess['GAMMA']
+    acquire_ns = (time.perf_counter() - start) / frames * 1e9
+
+    # The usual alternative: copy the shared parameters under a lock every frame
+    params, lock = dict(PREPROCESS), threading.Lock()
+    start = time.perf_counter()
+    for _ in range(frames):
+        with lock:
+            copy = dict(params)
+        copy['GAMMA']
+    return acquire_ns, (time.perf_counter() - start) / frames * 1e9
+
+
+# A writer changes GAMMA and CONTRAST_LEVEL together while frames read them at the start of preprocessing
+# and again in a later stage; a frame is torn when the two reads differ
+def torn_frames(frames=300, frame_s=0.002):
+    stop = threading.Event()
+    shared = dict(PREPROCESS)
+    parameters = LiveParameters(PREPROCESS, SGBM, ZONES).start()
+
+    def writer():
+        value = 100
+        while not stop.is_set():
+            value += 1
+            shared['GAMMA'] = value / 100.0  # What writing processor params from the OPC UA callback does
+            shared['CONTRAST_LEVEL'] = value / 100.0
+            parameters.stage('gamma', value)
+            parameters.stage('contrast', value)
+            time.sleep(0.0007)
+
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    torn_shared, torn_snapshot = 0, 0
+    for _ in range(frames):
+        first = (shared['GAMMA'], shared['CONTRAST_LEVEL'])
+        snapshot = parameters.acquire()
+        first_snapshot = (snapshot.preprocess['GAMMA'], snapshot.preprocess['CONTRAST_LEVEL'])
+        time.sleep(frame_s)
+        torn_shared += (shared['GAMMA'], shared['CONTRAST_LEVEL']) != first
+        torn_snapshot += (snapshot.preprocess['GAMMA'], snapshot.preprocess['CONTRAST_LEVEL']) != first_snapshot
+    stop.set()
+    thread.join()
+    parameters.stop()
+    return torn_shared, torn_snapshot, parameters.snapshot.version
+
+
+# Client writes to the real OPC UA server; a frame loop at the given rate picks up the snapshots
+def opcua_apply_latency(subscription_period, fps=30.0, writes=20, port=48510):
+    parameters = LiveParameters(PREPROCESS, SGBM, ZONES).start()
+    endpoint = f"opc.tcp://127.0.0.1:{port}/cablelay/benchmark/"
+    server = OpcuaServer(endpoint, "http://cablelay.com", parameters=parameters,
+                         subscription_period=subscription_period)
+    stop = threading.Event()
+
+    def frame_loop():
+        while not stop.is_set():
+            parameters.acquire()
+            time.sleep(1.0 / fps)
+
+    thread = threading.Thread(target=frame_loop, daemon=True)
+    thread.start()
+    client = Client(endpoint)
+    client.connect()
+    try:
+        gamma = client.get_objects_node().get_child(["2:Cablelay", "2:Filters", "2:gamma"])
+        for value in range(writes):
+            gamma.set_value(ua.Variant(100 + value, ua.VariantType.Int32))
+            time.sleep(0.3)
+    finally:
+        client.disconnect()
+        stop.set()
+        thread.join()
+        server.stop()
+        parameters.stop()
+    return parameters.stats()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Live parameter snapshots: hot-path cost, torn frames, latency.")
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--writes', type=int, default=20)
+    args = parser.parse_args()
+
+    acquire_ns, locked_ns = hot_path_ns()
+    print(f"Hot path per frame: acquire() {acquire_ns:.0f} ns, locked dict copy {locked_ns:.0f} ns")
+    torn_shared, torn_snapshot, versions = torn_frames()
+    print(f"Torn frames out of 300 ({versions} parameter versions): shared dict {torn_shared}, snapshots {torn_snapshot}")
+    for period in (1000, 100):
+        stats = opcua_apply_latency(period, args.fps, args.writes)
+        apply, build = stats['apply_latency'], stats['build_latency']
+        print(f"Subscription period {period:4d} ms: write -> frame p50 {apply['p50_ms']:.1f} ms  "
+              f"p99 {apply['p99_ms']:.1f} ms  max {apply['max_ms']:.1f} ms  (write -> snapshot p50 "
+              f"{build['p50_ms']:.2f} ms)  versions {stats['version']}")
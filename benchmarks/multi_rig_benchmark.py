@@ -0,0 +1,71 @@
+# multi_rig_benchmark.py
+# Per-rig and aggregate throughput of the rig supervisor for 1..N rigs replaying the same recording in
+# a loop, plus a crash/restart check. Run from the repository root:
+#   python -m benchmarks.multi_rig_benchmark --recording field.stereo [--rigs 1 2 4] [--seconds 10]
+import argparse
+import json
+import os
+import time
+
+from modules.rig import RigSupervisor
+from .common import ROOT_DIR
+
+
+def rig_settings(recording, calibration):
+    return {'replay': recording, 'replay_speed': 0, 'replay_loop': True, 'calibration': calibration,
+            'map_file': calibration, 'q_file': os.path.join(ROOT_DIR, 'Q.xml'), 'threads': 1,
+            'depth_map_params': os.path.join(ROOT_DIR, 'modules', 'depth_map', 'depth_map_params.json'),
+            'preprocess_params': os.path.join(ROOT_DIR, 'modules', 'depth_map', 'preprocess_params.json')}
+
+
+def run_case(count, recording, calibration, seconds):
+    rigs = {f"rig{i + 1}": rig_settings(recording, calibration) for i in range(count)}
+    supervisor = RigSupervisor(rigs).start()
+    try:
+        supervisor.run(duration=2.0)  # Worker start-up (spawn, imports, calibration) is not measured
+        start_frames = {name: worker.frames for name, worker in supervisor.workers.items()}
+        start = time.monotonic()
+        supervisor.run(duration=seconds)
+        elapsed = time.monotonic() - start
+    finally:
+        supervisor.stop()
+    per_rig = {name: (worker.frames - start_frames[name]) / elapsed for name, worker in supervisor.workers.items()}
+    return {'rigs': count, 'per_rig_fps': per_rig, 'aggregate_fps': sum(per_rig.values())}
+
+
+# Kill a worker and check that it comes back
+def restart_check(recording, calibration):
+    supervisor = RigSupervisor({'rig1': rig_settings(recording, calibration)}, restart_delay=0.2).start()
+    try:
+        supervisor.run(duration=2.0)
+        supervisor.workers['rig1'].process.kill()
+        frames = supervisor.workers['rig1'].frames
+        supervisor.run(duration=4.0)
+        worker = supervisor.workers['rig1']
+        return {'restarts': worker.restarts, 'frames_after_restart': worker.frames - frames}
+    finally:
+        supervisor.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Multi-rig supervisor throughput.")
+    parser.add_argument('--recording', required=True, help="Stereo recording every rig replays")
+    parser.add_argument('--calibration', default='calibration.bin', help="Calibration bundle or stereoMap.xml")
+    parser.add_argument('--rigs', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {'cpus': os.cpu_count(), 'cases': []}
+    for count in args.rigs:
+        case = run_case(count, args.recording, args.calibration, args.seconds)
+        results['cases'].append(case)
+        single = results['cases'][0]['aggregate_fps'] / results['cases'][0]['rigs']
+        print(f"{count} rig(s): aggregate {case['aggregate_fps']:6.1f} fps  per rig "
+              + " ".join(f"{fps:5.1f}" for fps in case['per_rig_fps'].values())
+              + f"  scaling {case['aggregate_fps'] / single:.2f}x of {count}")
+    results['restart'] = restart_check(args.recording, args.calibration)
+    print(f"Restart check: {results['restart']} ({results['cpus']} CPUs)")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
@@ -0,0 +1,155 @@
+# network_capture_benchmark.py
+# Network stereo ingest (modules/camera/network_capture.py) against the loopback MJPEG server: pairs per
+# second, per-stream fps and decode time, and recovery from an outage of the left stream (clients dropped and
+# connections refused), both on NetworkCapture directly and through main.py's capture (next_pair) in the
+# sequential loop and the pipeline, which must wait the outage out instead of exiting. The old Pi_stream.py
+# pattern (one VideoCapture read loop, no reconnect) runs through the same outage for comparison.
+# Run from the repository root:
+#   python -m benchmarks.network_capture_benchmark [--seconds 12 --outage 3]
+import argparse
+import threading
+import time
+
+import cv2 as cv
+
+from main import next_pair, to_gray
+from modules.camera import CameraInterface, LoopbackStreamServer
+from modules.depth_map.synthetic import synthetic_stereo_pair
+from modules.pipeline import PipelineExecutor
+
+
+# Pairs delivered per second and the time from the end of the outage to the next pair
+def network_capture(server, seconds, outage_at, outage):
+    camera = CameraInterface((640, 480), server.urls[0], server.urls[1], stream_timeout=1.0, reconnect_delay=0.25,
+                             max_reconnect_delay=2.0)
+    capture = camera.start_capture(max_skew=0.015, ring_size=4, max_age=0.5)
+    start = time.monotonic()
+    outage_end, recovered, pairs = None, None, 0
+    try:
+        while time.monotonic() - start < seconds:
+            if outage_end is None and time.monotonic() - start >= outage_at:
+                server.outage(outage, stream=0)
+                outage_end = time.monotonic() + outage
+            if capture.read_pair(timeout=0.5) is None:
+                continue
+            pairs += 1
+            if outage_end is not None and recovered is None and time.monotonic() > outage_end:
+                recovered = time.monotonic() - outage_end
+        return pairs / seconds, recovered, capture.stats()
+    finally:
+        capture.stop()
+
+
+# main.py's capture through the same outage, in the sequential loop or as the pipeline source: pairs before and
+# after the outage and whether the loop was still running at the end
+def main_loop(server, seconds, outage_at, outage, pipelined):
+    camera = CameraInterface((640, 480), server.urls[0], server.urls[1], stream_timeout=1.0, reconnect_delay=0.25,
+                             max_reconnect_delay=2.0)
+    capture = camera.start_capture(max_skew=0.015, ring_size=4, max_age=0.5)
+    stopped = threading.Event()
+    times = []
+
+    def sink(sequence, frame):
+        times.append(time.monotonic())
+
+    def sequential():
+        while not stopped.is_set():
+            pair = next_pair(capture, True, stopped)
+            if pair is None:
+                break
+            sink(None, (to_gray(pair[0]), to_gray(pair[1])))
+
+    if pipelined:
+        executor = PipelineExecutor(lambda: next_pair(capture, True, executor.stopped),
+                                    [('gray', lambda pair: (to_gray(pair[0]), to_gray(pair[1])))], sink)
+        stopped = executor.stopped
+        executor.start()
+    else:
+        thread = threading.Thread(target=sequential, daemon=True)
+        thread.start()
+    start = time.monotonic()
+    try:
+        time.sleep(outage_at)
+        server.outage(outage, stream=0)
+        outage_end = time.monotonic() + outage
+        time.sleep(seconds - outage_at)
+        running = not stopped.is_set()
+    finally:
+        if pipelined:
+            executor.stop()
+        else:
+            stopped.set()
+            thread.join(timeout=3.0)
+        capture.stop()
+    before = sum(1 for t in times if t < start + outage_at)
+    after = [t for t in times if t > outage_end]
+    return before, len(after), (after[0] - outage_end if after else None), running
+
+
+# Pi_stream.py's CameraStream: a read loop sharing the latest frame, stopping on the first failure
+def pi_stream_pattern(server, seconds, outage_at, outage):
+    state = {'frames': 0, 'stopped': False}
+
+    def update():
+        capture = cv.VideoCapture(server.urls[0], cv.CAP_FFMPEG)
+        while not state['stopped']:
+            if capture.isOpened():
+                ret, frame = capture.read()
+                if ret:
+                    state['frames'] += 1
+                else:
+                    state['stopped'] = True  # The script only logs and spins; nothing ever reopens the stream
+            else:
+                state['stopped'] = True
+        capture.release()
+
+    thread = threading.Thread(target=update, daemon=True)
+    thread.start()
+    time.sleep(outage_at)
+    before = state['frames']
+    server.outage(outage, stream=0)
+    time.sleep(seconds - outage_at)
+    after = state['frames'] - before
+    state['stopped'] = True
+    thread.join(timeout=3.0)
+    return before, after
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Network stereo ingest against a loopback MJPEG server.")
+    parser.add_argument('--seconds', type=float, default=12.0)
+    parser.add_argument('--outage', type=float, default=3.0, help="Seconds the left stream is down")
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--port', type=int, default=5556)
+    args = parser.parse_args()
+    outage_at = args.seconds / 3
+
+    pairs = [synthetic_stereo_pair(seed=seed)[:2] for seed in range(5)]
+    server = LoopbackStreamServer([[cv.cvtColor(left, cv.COLOR_GRAY2BGR) for left, _ in pairs],
+                                   [cv.cvtColor(right, cv.COLOR_GRAY2BGR) for _, right in pairs]],
+                                  args.port, fps=args.fps).start()
+    try:
+        rate, recovered, stats = network_capture(server, args.seconds, outage_at, args.outage)
+        print(f"NetworkCapture: {rate:.1f} pairs/s over {args.seconds:g} s with a {args.outage:g} s outage, "
+              f"first pair {recovered * 1000 if recovered is not None else float('nan'):.0f} ms after it ended")
+        for side in ('left', 'right'):
+            stream = stats[f'stream_{side}']
+            print(f"  {side}: fps {stream['fps']:.1f}  decode p50 {stream['decode_ms_p50']:.2f} ms "
+                  f"p99 {stream['decode_ms_p99']:.2f} ms  reconnects {stream['reconnects']}  "
+                  f"failures {stream['failures']}  frames {stream['frames']}")
+        print(f"  skew rejects {stats['skew_rejects']}  stale rejects {stats['stale_rejects']}  "
+              f"dropped {stats['dropped_left']}/{stats['dropped_right']}")
+        for pipelined in (False, True):
+            server.outage(0.0)
+            time.sleep(0.5)
+            before, after, recovered, running = main_loop(server, args.seconds, outage_at, args.outage, pipelined)
+            print(f"main.py {'pipeline' if pipelined else 'sequential loop'}: {before} pairs before the outage, "
+                  f"{after} after it, first "
+                  f"{recovered * 1000 if recovered is not None else float('nan'):.0f} ms after it ended, "
+                  f"{'still running' if running else 'exited'}")
+        server.outage(0.0)
+        time.sleep(0.5)
+        before, after = pi_stream_pattern(server, args.seconds, outage_at, args.outage)
+        print(f"Pi_stream.py pattern: {before} frames before the outage, {after} after it")
+    finally:
+        server.stop()
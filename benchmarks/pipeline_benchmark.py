@@ -0,0 +1,196 @@
+# pipeline_benchmark.py
+# Offline replay benchmark for the full depth pipeline: stored and synthetic stereo pairs go through the
+# real Rectification, Preprocessor, DepthMapProcessorSGBM and DepthMapProcessor code paths, headless.
+# Reports per-stage and end-to-end p50/p95/p99, frames per second and peak memory for a matrix of
+# resolutions and SGBM parameter sets as JSON. Run from the repository root:
+#   python -m benchmarks.pipeline_benchmark --output bench.json
+#   python -m benchmarks.pipeline_benchmark --output new.json --baseline bench.json   # regression check
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import time
+import tracemalloc
+
+import cv2 as cv
+import numpy as np
+
+from modules.camera import StereoRecording
+from modules.depth_map import Preprocessor, DepthMapProcessor, DepthMapProcessorSGBM
+from modules.depth_map.synthetic import synthetic_stereo_pair
+from modules.edge_detection.calibration import Rectification, identity_maps
+from .common import ROOT_DIR, load_rectification_pairs, summarize
+
+RESOLUTIONS = ((640, 480), (320, 240), (1280, 720))
+
+# Overrides on top of depth_map_params.json (trackbar encoding: numDisparities x16, blockSize*2+5)
+PARAM_SETS = {'stored': {}, 'fast': {'numDisparities': 4, 'blockSize': 1},
+              'wide': {'numDisparities': 10, 'blockSize': 5}}
+
+STAGES = ('rectify', 'preprocess', 'disparity', 'reprojection', 'bm_depth')
+
+
+# Stored pairs, single test images with a synthetic right view, fully synthetic pairs and optionally
+# up to max_pairs pairs of a field recording
+def load_sources(resolution, recording=None, max_pairs=50):
+    width, height = resolution
+    sources = {}
+
+    pairs = load_rectification_pairs()
+    sources['recorded'] = [(cv.resize(left, resolution), cv.resize(right, resolution)) for left, right in pairs]
+
+    test_pairs = []
+    for path in sorted(glob.glob(os.path.join(ROOT_DIR, 'images', 'Test_Images', '*.jpg'))):
+        left = cv.resize(cv.imread(path, cv.IMREAD_GRAYSCALE), resolution)
+        shift = np.float32([[1, 0, -width // 40], [0, 1, 0]])  # Constant disparity of width/40 pixels
+        test_pairs.append((left, cv.warpAffine(left, shift, resolution, borderMode=cv.BORDER_REFLECT)))
+    sources['test_images'] = test_pairs
+
+    sources['synthetic'] = [synthetic_stereo_pair((height, width), seed=seed)[:2] for seed in range(3)]
+
+    if recording is not None:
+        replay = StereoRecording(recording)
+        step = max(1, len(replay) // max_pairs)
+        sources['recording'] = [(cv.resize(replay[i][0], resolution), cv.resize(replay[i][1], resolution))
+                                for i in range(0, len(replay), step)][:max_pairs]
+    return sources
+
+
+# Real calibration maps at their own resolution, identity maps (same remap cost) elsewhere
+def build_rectification(resolution, map_file, interpolation):
+    if map_file and os.path.exists(map_file):
+        rectification = Rectification(map_file, interpolation=interpolation, fixed_point=True)
+        if rectification.stereoMapL_x.shape[:2] == resolution[::-1]:
+            return rectification, 'calibration'
+    return Rectification(interpolation=interpolation, fixed_point=True,
+                         maps=identity_maps(resolution[::-1])), 'identity'
+
+
+def build_processors(params):
+    preprocessor = Preprocessor(config_file=os.path.join(ROOT_DIR, 'modules', 'depth_map', 'preprocess_params.json'),
+                                headless=True)
+    sgbm = DepthMapProcessorSGBM(config_file=os.path.join(ROOT_DIR, 'modules', 'depth_map', 'depth_map_params.json'),
+                                 q_file_path=os.path.join(ROOT_DIR, 'Q.xml'), headless=True)
+    sgbm.params.update(params)
+    bm = DepthMapProcessor(headless=True)
+    bm.params.update({'numDisparities': sgbm.params['numDisparities'], 'blockSize': sgbm.params['blockSize']})
+    return preprocessor, sgbm, bm
+
+
+# end_to_end covers the production path (rectify .. reprojection); the StereoBM path is timed alongside it
+def run_frames(pairs, rectification, preprocessor, sgbm, bm, zones, repeat, times=None):
+    for _ in range(repeat):
+        for left, right in pairs:
+            start = time.perf_counter()
+            rectified = rectification.undistortrectify(left, right)
+            t_rectify = time.perf_counter()
+            preprocessed = preprocessor.preprocess_pair(*rectified)
+            t_preprocess = time.perf_counter()
+            disparity = sgbm.compute_disparity(*preprocessed, zones)
+            t_disparity = time.perf_counter()
+            sgbm.measure_heights(disparity, zones)
+            t_reprojection = time.perf_counter()
+            bm.compute_depth_map(*preprocessed)
+            t_bm = time.perf_counter()
+
+            if times is not None:
+                times['rectify'].append((t_rectify - start) * 1000.0)
+                times['preprocess'].append((t_preprocess - t_rectify) * 1000.0)
+                times['disparity'].append((t_disparity - t_preprocess) * 1000.0)
+                times['reprojection'].append((t_reprojection - t_disparity) * 1000.0)
+                times['bm_depth'].append((t_bm - t_reprojection) * 1000.0)
+                times['end_to_end'].append((t_reprojection - start) * 1000.0)
+
+
+def run_case(pairs, resolution, params, map_file, interpolation, repeat):
+    rectification, maps = build_rectification(resolution, map_file, interpolation)
+    preprocessor, sgbm, bm = build_processors(params)
+    height = resolution[1]
+    zones = [height // 12, height * 5 // 12, height * 5 // 6]  # Same relative rows as 40/200/400 at 480
+
+    # Warm-up builds the matchers and buffers; then time without tracing, then trace once for peak memory
+    run_frames(pairs[:1], rectification, preprocessor, sgbm, bm, zones, 1)
+    times = {name: [] for name in STAGES + ('end_to_end',)}
+    run_frames(pairs, rectification, preprocessor, sgbm, bm, zones, repeat, times)
+
+    tracemalloc.start()
+    run_frames(pairs, rectification, preprocessor, sgbm, bm, zones, 1)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    end_to_end = summarize(times['end_to_end'])
+    return {'maps': maps, 'frames': len(times['end_to_end']),
+            'stages': {name: summarize(times[name]) for name in STAGES}, 'end_to_end': end_to_end,
+            'fps': 1000.0 / end_to_end['mean_ms'], 'peak_python_mb': peak / 2 ** 20}
+
+
+def run_benchmark(resolutions=RESOLUTIONS, param_sets=PARAM_SETS, map_file='stereoMap.xml',
+                  interpolation='lanczos', repeat=2, recording=None):
+    results = {'meta': {'machine': platform.platform(), 'processor': platform.machine(), 'cpus': os.cpu_count(),
+                        'opencv': cv.__version__, 'numpy': np.__version__, 'opencv_threads': cv.getNumThreads(),
+                        'interpolation': interpolation, 'repeat': repeat}, 'cases': []}
+    for resolution in resolutions:
+        for source, pairs in load_sources(resolution, recording).items():
+            if not pairs:
+                continue
+            for name, params in param_sets.items():
+                case = run_case(pairs, resolution, params, map_file, interpolation, repeat)
+                results['cases'].append({'resolution': list(resolution), 'source': source, 'params': name, **case})
+                print(f"{resolution[0]}x{resolution[1]:<5} {source:<12} {name:<7} "
+                      f"e2e p50 {case['end_to_end']['p50_ms']:7.2f} ms  p99 {case['end_to_end']['p99_ms']:7.2f} ms"
+                      f"  {case['fps']:6.1f} fps  peak {case['peak_python_mb']:.1f} MB")
+    results['meta']['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return results
+
+
+# Cases whose p50 got slower than the baseline by more than the tolerance
+def find_regressions(results, baseline, tolerance=0.15):
+    def key(case):
+        return tuple(case['resolution']), case['source'], case['params']
+
+    def p50(case, name):
+        return case['end_to_end']['p50_ms'] if name == 'end_to_end' else case['stages'][name]['p50_ms']
+
+    previous = {key(case): case for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        old = previous.get(key(case))
+        if old is None:
+            continue
+        for name in STAGES + ('end_to_end',):
+            new_ms, old_ms = p50(case, name), p50(old, name)
+            if new_ms > old_ms * (1 + tolerance):
+                regressions.append({'case': key(case), 'stage': name, 'baseline_p50_ms': old_ms, 'p50_ms': new_ms})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline replay benchmark for the depth pipeline.")
+    parser.add_argument('--map-file', default='stereoMap.xml', help="Calibration maps (identity maps if missing)")
+    parser.add_argument('--interpolation', default='lanczos')
+    parser.add_argument('--resolutions', nargs='+', help="e.g. 640x480 320x240")
+    parser.add_argument('--params', nargs='+', choices=list(PARAM_SETS), help="SGBM parameter sets to run")
+    parser.add_argument('--recording', help="Also replay pairs from this stereo recording (main.py --record)")
+    parser.add_argument('--repeat', type=int, default=2, help="Passes over each source")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--baseline', help="Compare against a previous JSON result and fail on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="Allowed p50 slowdown vs the baseline")
+    args = parser.parse_args()
+
+    resolutions = [tuple(int(v) for v in r.split('x')) for r in args.resolutions] if args.resolutions else RESOLUTIONS
+    param_sets = {name: PARAM_SETS[name] for name in args.params} if args.params else PARAM_SETS
+    results = run_benchmark(resolutions, param_sets, args.map_file, args.interpolation, args.repeat,
+                            args.recording)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = find_regressions(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            raise SystemExit(1)
@@ -0,0 +1,84 @@
+# point_cloud_export_benchmark.py
+# Point cloud export (modules/depth_map/point_cloud_export.py): the voxel downsampling and writer cost per frame,
+# points and bytes per exported frame against the full-resolution cloud, and the frame loop (disparity + zones)
+# with and without the exporter: its frame times and the time record() adds to the loop; a burst shows the drops.
+# Run from the repository root:
+#   python -m benchmarks.point_cloud_export_benchmark [--frames 150 --fps 1 --voxel 0.01]
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from modules.depth_map import DepthMapProcessorSGBM, PointCloudExporter
+from modules.depth_map.point_cloud_export import VERTEX_DTYPE, reproject_valid, voxel_downsample
+from modules.depth_map.synthetic import synthetic_stereo_pair
+from .common import ROOT_DIR, time_calls
+
+ZONES = [200, 240, 280]  # Rows on the synthetic cable
+
+
+def frame_loop(processor, pairs, frames, exporter=None):
+    times, record_times = [], []
+    for i in range(frames):
+        left, right = pairs[i % len(pairs)]
+        start = time.perf_counter()
+        disparity_raw = processor.compute_disparity(left, right, ZONES)
+        processor.compute_heights_from_disparity(disparity_raw, ZONES)
+        if exporter is not None:
+            record_start = time.perf_counter()
+            exporter.record(disparity_raw, left)
+            record_times.append((time.perf_counter() - record_start) * 1000.0)
+        times.append((time.perf_counter() - start) * 1000.0)
+    return times, record_times
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Point cloud export cost and its effect on the frame loop.")
+    parser.add_argument('--frames', type=int, default=150)
+    parser.add_argument('--fps', type=float, default=1.0, help="Exporter max_fps in the frame loop")
+    parser.add_argument('--voxel', type=float, default=0.01, help="Voxel edge length (Q.xml units)")
+    args = parser.parse_args()
+
+    pairs = [synthetic_stereo_pair(seed=seed)[:2] for seed in range(3)]
+    processor = DepthMapProcessorSGBM(q_file_path=os.path.join(ROOT_DIR, 'Q.xml'), headless=True)
+    disparity_raw = processor.compute_disparity(*pairs[0], ZONES)
+
+    points, intensities = reproject_valid(disparity_raw, processor.Q, pairs[0][0])
+    reproject_ms = np.median(time_calls(lambda: reproject_valid(disparity_raw, processor.Q, pairs[0][0]), 10))
+    print(f"Full cloud: {points.shape[0]} points, {points.shape[0] * VERTEX_DTYPE.itemsize / 2 ** 20:.2f} MB "
+          f"per frame, reprojection {reproject_ms:.1f} ms")
+    for voxel in (args.voxel / 2, args.voxel, args.voxel * 2):
+        downsampled = voxel_downsample(points, voxel, intensities)[0]
+        ms = np.median(time_calls(lambda: voxel_downsample(points, voxel, intensities), 10))
+        print(f"  voxel {voxel:g}: {downsampled.shape[0]} points "
+              f"({points.shape[0] / max(downsampled.shape[0], 1):.1f}x fewer), "
+              f"{downsampled.shape[0] * VERTEX_DTYPE.itemsize / 2 ** 10:.0f} kB per frame, downsampling {ms:.1f} ms")
+
+    directory = tempfile.mkdtemp()
+    try:
+        frame_loop(processor, pairs, 5)  # Warm-up
+        baseline, _ = frame_loop(processor, pairs, args.frames)
+        exporter = PointCloudExporter(directory, processor.Q, voxel_size=args.voxel, max_fps=args.fps).start()
+        exported, record_times = frame_loop(processor, pairs, args.frames, exporter)
+        exporter.close()
+        stats = exporter.stats()
+        print(f"Frame loop without export: mean {np.mean(baseline):.1f} ms, p99 {np.percentile(baseline, 99):.1f} ms")
+        print(f"Frame loop with export at {args.fps:g} fps: mean {np.mean(exported):.1f} ms, "
+              f"p99 {np.percentile(exported, 99):.1f} ms; record() p50 {np.median(record_times):.3f} ms, "
+              f"max {np.max(record_times):.3f} ms")
+        print(f"  exported {stats['frames']} frames, dropped {stats['dropped']}, writer {stats['write_ms']:.1f} ms "
+              f"per frame, {stats['megabytes']:.2f} MB in {stats['chunks']} chunk(s)")
+
+        # A burst faster than the writer (e.g. replay as fast as possible with no rate limit): the queue fills
+        # and the surplus frames are dropped instead of waited for
+        exporter = PointCloudExporter(directory, processor.Q, voxel_size=args.voxel, max_fps=0).start()
+        burst = time_calls(lambda: exporter.record(disparity_raw, pairs[0][0]), repeat=30, warmup=0)
+        exporter.close()
+        stats = exporter.stats()
+        print(f"Burst of 30 frames: record() max {np.max(burst):.3f} ms; exported {stats['frames']}, "
+              f"dropped {stats['dropped']}")
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,110 @@
+# pyramid_benchmark.py
+# Speed and accuracy of the coarse-to-fine pyramid mode against full-resolution SGBM.
+# Height error is measured against the full-resolution heights on the recorded (checkerboard) pairs and on
+# synthetic pairs; on the synthetic pairs the zone-row disparity error is also measured against the ground truth. Run from the repository root:
+#   python -m benchmarks.pyramid_benchmark [--map-file stereoMap.xml] [--tolerance 0.02]
+import argparse
+import json
+import os
+
+import numpy as np
+
+from modules.depth_map import DepthMapProcessorSGBM
+from modules.depth_map.synthetic import synthetic_stereo_pair
+from modules.edge_detection.calibration import Rectification
+from .common import ROOT_DIR, load_rectification_pairs, time_calls, summarize
+
+ZONES = [40, 200, 400]
+SYNTHETIC_ZONES = [96, 240, 400]  # Background, cable band, background
+
+# Name: (match_mode, pyramid_scale, pyramid_refine)
+MODES = {'full': ('full', 2, 'zones'), 'bands': ('bands', 2, 'zones'),
+         'pyramid_x2_zones': ('pyramid', 2, 'zones'), 'pyramid_x4_zones': ('pyramid', 4, 'zones'),
+         'pyramid_x2_full': ('pyramid', 2, 'full'), 'pyramid_x4_full': ('pyramid', 4, 'full')}
+
+
+def build_processor(match_mode, scale, refine):
+    return DepthMapProcessorSGBM(config_file=os.path.join(ROOT_DIR, 'modules', 'depth_map', 'depth_map_params.json'),
+                                 q_file_path=os.path.join(ROOT_DIR, 'Q.xml'), match_mode=match_mode, headless=True,
+                                 pyramid_scale=scale, pyramid_refine=refine)
+
+
+# Mean absolute disparity error (pixels) on the zone rows, over pixels both maps consider valid
+def zone_disparity_error(disparity_raw, ground_truth, zones, num_disparities):
+    errors = []
+    for row in zones:
+        measured = disparity_raw[row, num_disparities:].astype(np.float32) / 16.0
+        valid = measured > 0
+        errors.append(np.abs(measured[valid] - ground_truth[row, num_disparities:][valid]))
+    errors = np.concatenate(errors)
+    return float(errors.mean()) if errors.size else None
+
+
+# Disparity time and height error against the full-resolution processor on one set of pairs
+def measure(processor, reference, pairs, zones, repeat):
+    times, errors, lost = [], [], 0
+    for left, right in pairs:
+        expected = reference.measure_heights(reference.compute_disparity(left, right, zones), zones)
+        times += time_calls(lambda: processor.compute_disparity(left, right, zones), repeat=repeat, warmup=1)
+        heights = processor.measure_heights(processor.compute_disparity(left, right, zones), zones)
+        for height, expected_height in zip(heights, expected):
+            if np.isfinite(expected_height) and not np.isfinite(height):
+                lost += 1
+            elif np.isfinite(height) and np.isfinite(expected_height):
+                errors.append(abs(height - expected_height) / expected_height)
+    return {**summarize(times), 'median_rel_height_error': float(np.median(errors)) if errors else None,
+            'p95_rel_height_error': float(np.percentile(errors, 95)) if errors else None, 'lost_heights': lost}
+
+
+def run_benchmark(map_file=None, modes=MODES, repeat=5):
+    pairs = load_rectification_pairs()
+    if map_file:
+        rectification = Rectification(map_file)
+        pairs = [rectification.undistortrectify(left, right) for left, right in pairs]
+    # Fractional disparities so sub-pixel errors show up
+    synthetic = [synthetic_stereo_pair(pairs[0][0].shape[:2], 23.4, 47.7, seed=seed) for seed in range(3)]
+    datasets = {'recorded': (pairs, ZONES), 'synthetic': ([pair[:2] for pair in synthetic], SYNTHETIC_ZONES)}
+
+    reference = build_processor(*modes['full'])
+    results = {}
+    for name, mode in modes.items():
+        processor = build_processor(*mode)
+        results[name] = {dataset: measure(processor, reference, data, zones, repeat)
+                         for dataset, (data, zones) in datasets.items()}
+        num_disparities = processor.matcher_settings()['numDisparities']
+        errors = [zone_disparity_error(processor.compute_disparity(left, right, SYNTHETIC_ZONES), truth,
+                                       SYNTHETIC_ZONES, num_disparities) for left, right, truth in synthetic]
+        errors = [error for error in errors if error is not None]
+        results[name]['synthetic']['disparity_mae_px'] = float(np.mean(errors)) if errors else None
+    for result in results.values():
+        for dataset in datasets:
+            result[dataset]['speedup'] = results['full'][dataset]['p50_ms'] / result[dataset]['p50_ms']
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare pyramid-mode and full-resolution SGBM.")
+    parser.add_argument('--map-file', help="Rectify the recorded pairs with this stereoMap.xml first")
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), help="Modes to run (full is always included)")
+    parser.add_argument('--tolerance', type=float, default=0.02,
+                        help="Median relative height error allowed against full resolution")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    modes = {name: MODES[name] for name in ['full'] + (args.modes or list(MODES)[1:])}
+    results = run_benchmark(args.map_file, modes, args.repeat)
+    for name, result in results.items():
+        for dataset, data in result.items():
+            error = data['median_rel_height_error']
+            line = (f"{name:<17} {dataset:<9} p50 {data['p50_ms']:7.2f} ms  x{data['speedup']:.1f}  height error "
+                    + (f"{100 * error:.2f}% (p95 {100 * data['p95_rel_height_error']:.2f}%)" if error is not None
+                       else "n/a") + f"  lost {data['lost_heights']}")
+            if 'disparity_mae_px' in data:
+                line += f"  MAE {data['disparity_mae_px']:.2f} px"
+            if name != 'full':
+                line += "  ok" if error is not None and error <= args.tolerance else "  OUT OF TOLERANCE"
+            print(line)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
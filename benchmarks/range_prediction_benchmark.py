@@ -0,0 +1,82 @@
+# range_prediction_benchmark.py
+# Adaptive disparity-range prediction against the fixed full range on a frame sequence: a synthetic cable
+# drifting slowly and then jumping (which must trigger a fallback), or a stereo recording.
+# Run from the repository root:
+#   python -m benchmarks.range_prediction_benchmark [--recording field.stereo] [--mode full|bands]
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from modules.camera import StereoRecording
+from modules.depth_map import DepthMapProcessorSGBM
+from modules.depth_map.synthetic import synthetic_stereo_pair
+from .common import ROOT_DIR, summarize
+
+SYNTHETIC_ZONES = [96, 240, 400]
+
+
+# Cable disparity drifting from 40 to 60 px, then jumping to 100 px for the last frames
+def synthetic_sequence(frames=60, shape=(480, 640)):
+    sequence = []
+    for frame in range(frames):
+        cable = 40.0 + 20.0 * frame / frames if frame < frames * 3 // 4 else 100.0
+        sequence.append(synthetic_stereo_pair(shape, 30.0 + 0.1 * frame, cable, seed=frame)[:2])
+    return sequence
+
+
+def build_processor(match_mode, adaptive):
+    return DepthMapProcessorSGBM(config_file=os.path.join(ROOT_DIR, 'modules', 'depth_map', 'depth_map_params.json'),
+                                 q_file_path=os.path.join(ROOT_DIR, 'Q.xml'), match_mode=match_mode, headless=True,
+                                 adaptive_range=adaptive)
+
+
+def run_sequence(processor, sequence, zones):
+    times, heights = [], []
+    for left, right in sequence:
+        start = time.perf_counter()
+        disparity = processor.compute_disparity(left, right, zones)
+        times.append((time.perf_counter() - start) * 1000.0)
+        heights.append(processor.measure_heights(disparity, zones))
+    return times, np.asarray(heights, dtype=np.float64)
+
+
+def run_benchmark(sequence, zones, match_mode='full'):
+    fixed_times, expected = run_sequence(build_processor(match_mode, False), sequence, zones)
+    processor = build_processor(match_mode, True)
+    times, heights = run_sequence(processor, sequence, zones)
+
+    both = np.isfinite(heights) & np.isfinite(expected)
+    errors = np.abs(heights[both] - expected[both]) / np.abs(expected[both])
+    return {'frames': len(sequence), 'fixed': summarize(fixed_times), 'adaptive': summarize(times),
+            'speedup': float(np.mean(fixed_times) / np.mean(times)),
+            'median_rel_height_error': float(np.median(errors)) if errors.size else None,
+            'max_rel_height_error': float(np.max(errors)) if errors.size else None,
+            'lost_heights': int(np.count_nonzero(np.isfinite(expected) & ~np.isfinite(heights))),
+            'range': processor.range_stats()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Adaptive vs fixed disparity range on a frame sequence.")
+    parser.add_argument('--recording', help="Stereo recording to replay instead of the synthetic sequence")
+    parser.add_argument('--zones', type=int, nargs='+', help="Zone rows (default: 40 200 400 for recordings)")
+    parser.add_argument('--mode', default='full', choices=['full', 'bands'])
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.recording:
+        recording = StereoRecording(args.recording)
+        sequence, zones = [recording[i][:2] for i in range(len(recording))], args.zones or [40, 200, 400]
+    else:
+        sequence, zones = synthetic_sequence(), args.zones or SYNTHETIC_ZONES
+    result = run_benchmark(sequence, zones, args.mode)
+    print(f"{result['frames']} frames  fixed mean {result['fixed']['mean_ms']:.2f} ms  adaptive mean "
+          f"{result['adaptive']['mean_ms']:.2f} ms  x{result['speedup']:.2f}")
+    print(f"Height error vs full range: median {100 * (result['median_rel_height_error'] or 0):.2f}%  "
+          f"max {100 * (result['max_rel_height_error'] or 0):.2f}%  lost {result['lost_heights']}")
+    print(f"Range stats: {result['range']}")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent=4)
@@ -0,0 +1,84 @@
+# rectification_report.py
+# Quality-vs-speed report for the rectification modes, compared against the Lanczos output
+# on the RectificationImages pairs. Run from the repository root:
+#   python -m benchmarks.rectification_report --map-file stereoMap.xml --output rectification_report.json
+import argparse
+import json
+import platform
+
+import cv2 as cv
+import numpy as np
+
+from modules.edge_detection.calibration import Rectification, INTERPOLATIONS
+from .common import load_rectification_pairs, time_calls, summarize, psnr
+
+
+# Baseline for the fixed-point modes, whatever format the map file happens to contain
+def to_float_maps(rectification):
+    for side in ('L', 'R'):
+        map_x = getattr(rectification, f'stereoMap{side}_x')
+        map_y = getattr(rectification, f'stereoMap{side}_y')
+        if map_x.dtype != np.float32:
+            map_x, map_y = cv.convertMaps(map_x, map_y, cv.CV_32FC1)
+        setattr(rectification, f'stereoMap{side}_x', map_x)
+        setattr(rectification, f'stereoMap{side}_y', map_y)
+
+
+def run_report(map_file, repeat=20, band=None):
+    pairs = load_rectification_pairs()
+    if not pairs:
+        raise FileNotFoundError("No RectificationImages pairs found.")
+
+    # Reference: Lanczos on the maps exactly as stored in the map file
+    reference = Rectification(map_file, interpolation='lanczos')
+    reference_outputs = [reference.undistortrectify(left, right) for left, right in pairs]
+
+    results = []
+    for fixed_point in (False, True):
+        for name in INTERPOLATIONS:
+            rectification = Rectification(map_file, interpolation=name, fixed_point=fixed_point)
+            if not fixed_point:
+                to_float_maps(rectification)
+            rectification.set_roi(band)
+            x, y, w, h = rectification.roi if rectification.roi else (0, 0, pairs[0][0].shape[1],
+                                                                        pairs[0][0].shape[0])
+            errors, scores = [], []
+            for (left, right), expected in zip(pairs, reference_outputs):
+                outputs = rectification.undistortrectify(left, right)
+                for output, target in zip(outputs, expected):
+                    diff = cv.absdiff(output[y:y + h, x:x + w], target[y:y + h, x:x + w])
+                    errors.append(float(diff.mean()))
+                    scores.append(psnr(target[y:y + h, x:x + w], output[y:y + h, x:x + w]))
+
+            left, right = pairs[0]
+            times = time_calls(lambda: rectification.undistortrectify(left, right), repeat=repeat)
+            results.append({'interpolation': name, 'fixed_point': fixed_point, 'roi': rectification.roi,
+                            'map_type': str(rectification.stereoMapL_x.dtype),
+                            'mean_abs_error': float(np.mean(errors)), 'max_abs_error_mean': float(np.max(errors)),
+                            'psnr_db': float(np.min(scores)), **summarize(times)})
+
+    return {'machine': platform.platform(), 'processor': platform.machine(), 'opencv': cv.__version__,
+            'pairs': len(pairs), 'resolution': list(pairs[0][0].shape[::-1]), 'results': results}
+
+
+def print_report(report):
+    print(f"{report['pairs']} pairs at {report['resolution']} on {report['machine']} (OpenCV {report['opencv']})")
+    print(f"{'mode':<10}{'fixed':>7}{'p50 ms':>9}{'p95 ms':>9}{'MAE':>8}{'PSNR dB':>9}")
+    for result in report['results']:
+        print(f"{result['interpolation']:<10}{str(result['fixed_point']):>7}{result['p50_ms']:>9.2f}"
+              f"{result['p95_ms']:>9.2f}{result['mean_abs_error']:>8.3f}{result['psnr_db']:>9.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare rectification modes against Lanczos output.")
+    parser.add_argument('--map-file', default='stereoMap.xml')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--band', type=int, nargs=2, metavar=('Y0', 'Y1'), help="Only rectify this row band")
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = run_report(args.map_file, args.repeat, tuple(args.band) if args.band else None)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=4)
@@ -0,0 +1,77 @@
+# reprojection_equivalence.py
+# Checks that the production zone measurement (DepthMapProcessorSGBM.measure_zones, mean statistic) returns the
+# same row heights as the full-frame cv.reprojectImageTo3D path on recorded frames, and times both.
+# Run from the repository root:
+#   python -m benchmarks.reprojection_equivalence [--map-file stereoMap.xml]
+import argparse
+import json
+import os
+
+import cv2 as cv
+import numpy as np
+
+from modules.depth_map import DepthMapProcessorSGBM
+from modules.edge_detection.calibration import Rectification
+from .common import ROOT_DIR, load_rectification_pairs, load_q, sgbm_from_params, time_calls, summarize
+
+
+# The full-frame implementation this replaces, kept as the reference
+def reference_heights(disparity_raw, zones, Q, min_distance=0, max_distance=5000, disparity_threshold=1.0):
+    disparity = disparity_raw.astype(np.float32) / 16.0
+    min_disp, max_disp = cv.minMaxLoc(disparity)[:2]
+    disparity_visual = cv.convertScaleAbs(disparity, alpha=255 / (max_disp - min_disp),
+                                          beta=-min_disp * (255 / (max_disp - min_disp)))
+    object_mask = (disparity > disparity_threshold) & (disparity_visual > 0)
+    points_3D = cv.reprojectImageTo3D(disparity, Q, ddepth=cv.CV_32F)
+    distances = np.linalg.norm(points_3D, axis=2)
+
+    avg_heights = [np.nan] * len(zones)
+    for idx, zone_row in enumerate(zones):
+        if zone_row < 0 or zone_row >= distances.shape[0]:
+            continue
+        valid_distances = distances[zone_row, :][object_mask[zone_row, :]]
+        valid_distances = valid_distances[
+            np.isfinite(valid_distances) & (valid_distances >= min_distance) & (valid_distances <= max_distance)]
+        avg_heights[idx] = valid_distances.mean() if valid_distances.size > 0 else np.nan
+    return avg_heights
+
+
+def check_equivalence(map_file=None, zone_sets=((40, 200, 400), (120, 240, 360), (0, 239, 479)), rtol=1e-6):
+    params_file = os.path.join(ROOT_DIR, 'modules', 'depth_map', 'depth_map_params.json')
+    with open(params_file) as file:
+        matcher = sgbm_from_params(json.load(file))
+    Q = load_q()
+    processor = DepthMapProcessorSGBM(config_file=params_file, q_file_path=os.path.join(ROOT_DIR, 'Q.xml'),
+                                      headless=True, zone_statistic='mean')
+    rectification = Rectification(map_file) if map_file else None
+
+    compared, mismatches = 0, []
+    for index, (left, right) in enumerate(load_rectification_pairs()):
+        if rectification is not None:
+            left, right = rectification.undistortrectify(left, right)
+        disparity_raw = matcher.compute(left, right)
+        for zones in zone_sets:
+            expected = reference_heights(disparity_raw, list(zones), Q)
+            actual = processor.measure_heights(disparity_raw, list(zones))
+            compared += 1
+            if not np.allclose(actual, expected, rtol=rtol, equal_nan=True):
+                mismatches.append({'pair': index, 'zones': zones, 'expected': expected, 'actual': actual})
+
+    timings = {'full_frame': summarize(time_calls(lambda: reference_heights(disparity_raw, [40, 200, 400], Q))),
+               'zones': summarize(time_calls(lambda: processor.measure_heights(disparity_raw, [40, 200, 400])))}
+    return compared, mismatches, timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare measure_zones and full-frame reprojection heights.")
+    parser.add_argument('--map-file', help="Rectify the recorded pairs with this stereoMap.xml first")
+    args = parser.parse_args()
+
+    compared, mismatches, timings = check_equivalence(args.map_file)
+    for name, timing in timings.items():
+        print(f"{name:<12} p50 {timing['p50_ms']:.3f} ms  p95 {timing['p95_ms']:.3f} ms")
+    for mismatch in mismatches:
+        print(f"Mismatch: {mismatch}")
+    print(f"{compared - len(mismatches)}/{compared} zone sets match")
+    if mismatches:
+        raise SystemExit(1)
@@ -0,0 +1,95 @@
+# zone_statistics_benchmark.py
+# Single-pass zone statistics (modules/depth_map/zones.py) against a per-zone loop that reprojects every
+# pixel: agreement of mean/median heights on the recorded pairs, robustness to outlier pixels, and timing
+# for the three row zones and for a set of rectangles and polylines. Run from the repository root:
+#   python -m benchmarks.zone_statistics_benchmark
+import argparse
+import json
+import os
+
+import cv2 as cv
+import numpy as np
+
+from modules.depth_map.synthetic import synthetic_stereo_pair
+from modules.depth_map.zones import ZoneSet, zone_statistics
+from .common import ROOT_DIR, load_rectification_pairs, load_q, sgbm_from_params, time_calls, summarize
+
+ROW_ZONES = [40, 200, 400]
+SHAPE_ZONES = [[x, y, 60, 40] for y in (40, 200, 400) for x in range(100, 600, 100)] + \
+              [{'polyline': [[0, 120], [320, 160], [639, 120]], 'thickness': 5},
+               {'polyline': [[0, 300], [320, 340], [639, 300]], 'thickness': 5},
+               {'polygon': [[200, 420], [440, 420], [400, 470], [240, 470]]}]
+
+
+# Per-zone boolean masks over the full-frame reprojection: exact per-pixel mean and median distances (nearest
+# rank, as zone_statistics defines it: np.median averages the two middle pixels, across the gap of a bimodal zone)
+def reference_statistics(disparity_raw, zone_set, Q, min_distance=0, max_distance=5000, disparity_threshold=1.0):
+    disparity = disparity_raw.astype(np.float32) / 16.0
+    min_disp, max_disp = cv.minMaxLoc(disparity)[:2]
+    alpha = 255 / (max_disp - min_disp)
+    object_mask = (disparity > disparity_threshold) & (cv.convertScaleAbs(disparity, alpha=alpha,
+                                                                          beta=-min_disp * alpha) > 0)
+    distances = np.linalg.norm(cv.reprojectImageTo3D(disparity, Q, ddepth=cv.CV_32F), axis=2)
+
+    means, medians = [], []
+    for index in range(len(zone_set)):
+        values = distances[(zone_set.labels == index + 1) & object_mask]
+        values = values[np.isfinite(values) & (values >= min_distance) & (values <= max_distance)]
+        means.append(values.mean() if values.size else np.nan)
+        medians.append(np.sort(values)[max(1, int(np.ceil(values.size * 0.5))) - 1] if values.size else np.nan)
+    return np.array(means), np.array(medians)
+
+
+def relative_error(actual, expected):
+    both = np.isfinite(actual) & np.isfinite(expected)
+    return float(np.max(np.abs(actual[both] - expected[both]) / np.abs(expected[both]))) if both.any() else 0.0
+
+
+def run(outlier_fraction=0.02):
+    with open(os.path.join(ROOT_DIR, 'modules', 'depth_map', 'depth_map_params.json')) as file:
+        matcher = sgbm_from_params(json.load(file))
+    Q = load_q()
+    disparities = [matcher.compute(left, right) for left, right in load_rectification_pairs()]
+    shape = disparities[0].shape
+    results = {}
+
+    for name, zones in (('rows', ROW_ZONES), ('shapes', SHAPE_ZONES)):
+        zone_set = ZoneSet(zones, shape)
+        mean_error, median_error = 0.0, 0.0
+        for disparity_raw in disparities:
+            stats = zone_statistics(disparity_raw, zone_set, Q)
+            means, medians = reference_statistics(disparity_raw, zone_set, Q)
+            mean_error = max(mean_error, relative_error(stats['mean'], means))
+            median_error = max(median_error, relative_error(stats['median'], medians))
+        disparity_raw = disparities[0]
+        timings = {'per_zone_loop': summarize(time_calls(lambda: reference_statistics(disparity_raw, zone_set, Q))),
+                   'single_pass': summarize(time_calls(lambda: zone_statistics(disparity_raw, zone_set, Q)))}
+        results[name] = {'zones': len(zones), 'pixels': int(zone_set.pixels.size),
+                         'max_mean_error': mean_error, 'max_median_error': median_error, 'timings': timings}
+
+    # Synthetic pairs (flat surfaces, so one height per zone): a share of the measured pixels of every row
+    # turned into wrong matches at the largest disparity (something right in front of the camera)
+    rng = np.random.default_rng(0)
+    zone_set = ZoneSet(ROW_ZONES, shape)
+    shifts = {'mean': [], 'median': []}
+    for seed in range(3):
+        left, right = synthetic_stereo_pair(shape, seed=seed)[:2]
+        disparity_raw = matcher.compute(left, right)
+        clean = zone_statistics(disparity_raw, zone_set, Q)
+        noisy_raw = disparity_raw.copy()
+        measured = zone_set.pixels[disparity_raw.ravel()[zone_set.pixels] > 16]
+        pixels = rng.choice(measured, int(outlier_fraction * measured.size), replace=False)
+        noisy_raw.ravel()[pixels] = matcher.getNumDisparities() * 16 - 16
+        noisy = zone_statistics(noisy_raw, zone_set, Q)
+        for stat in shifts:
+            shifts[stat].append(relative_error(noisy[stat], clean[stat]))
+    results['outliers'] = {'fraction': outlier_fraction, 'max_mean_shift': max(shifts['mean']),
+                           'max_median_shift': max(shifts['median'])}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Single-pass zone statistics against a per-zone loop.")
+    parser.add_argument('--outliers', type=float, default=0.02, help="Fraction of zone pixels made outliers")
+    args = parser.parse_args()
+    print(json.dumps(run(args.outliers), indent=4))
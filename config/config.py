@@ -2,11 +2,70 @@
 
 # Camera configuration
 CAMERA_RESOLUTION = (640,480)
+# Local camera indices, or stream URLs such as the Pi's 'tcp://192.168.1.10:5556' or 'rtsp://...'
+# (python -m modules.camera.loopback_stream serves a test pair on tcp://127.0.0.1:5556 and :5557)
+CAMERA_LEFT = 2
+CAMERA_RIGHT = 0
+STREAM_TIMEOUT = 2.0           # A network stream without frames for this long (s) is reconnected
+STREAM_RECONNECT_DELAY = 0.5   # First reconnect delay (s), doubling up to STREAM_MAX_RECONNECT_DELAY
+STREAM_MAX_RECONNECT_DELAY = 10.0
+CAPTURE_RING_SIZE = 4          # Preallocated frame slots per camera
+CAPTURE_MAX_SKEW = 0.015       # Max left/right capture time difference (s) for a stereo pair
+CAPTURE_MAX_AGE = 0.5          # Pairs older than this (s) are dropped as stale
+RECORD_PATH = None             # Write every captured pair to this stereo recording (also `main.py --record`)
+RECORD_COMPRESSION = None      # None (raw, zero-copy replay), 'zlib' or 'png' (both lossless)
+
+# Voxel-downsampled point clouds of measured frames for offline cable-profile analysis, written as chunked binary
+# PLY files by a background thread (also `main.py --export-cloud DIR`); None disables the export
+POINT_CLOUD_PATH = None
+POINT_CLOUD_FPS = 1.0          # Frames exported per second at most
+POINT_CLOUD_VOXEL = 0.01       # Voxel edge length (Q.xml units, metres); one point per occupied voxel
+POINT_CLOUD_QUEUE_SIZE = 2     # Frames waiting for the writer; a full queue drops the frame
+POINT_CLOUD_CHUNK_FRAMES = 100  # Frames per PLY file
+
+# Calibration: the binary bundle written by the calibration module (or converted once from the XML files with
+# `python -m modules.edge_detection.calibration_bundle`); stereoMap.xml/Q.xml are used if it does not exist
+CALIBRATION_BUNDLE = 'calibration.bin'
+
+# Rectification (see Documentation/rectification_report.md for the quality/speed trade-off)
+RECTIFICATION_INTERPOLATION = 'lanczos'  # nearest, linear, cubic or lanczos
+RECTIFICATION_FIXED_POINT = True         # Convert the maps once to fixed-point form
+RECTIFICATION_ROI = None                 # None for the full frame, (y0, y1) row band or (x, y, w, h)
+
+# Run without windows/trackbars (display-less production box); also available as `main.py --headless`
+HEADLESS = False
+
+# Headless mode runs each stage (capture, rectify, preprocess, disparity, reprojection, publish) on its own worker
+PIPELINED = True
+PIPELINE_QUEUE_SIZE = 1        # Frames queued per stage; a full queue drops its oldest frame
+PIPELINE_STATS_INTERVAL = 10   # Seconds between pipeline stats printouts
+
+# Stage latency histograms and frame counters, exported as the OPC UA Diagnostics object
+DIAGNOSTICS = True             # False removes every timing hook and the Diagnostics object
+DIAGNOSTICS_INTERVAL = 1.0     # Seconds between Diagnostics updates on the OPC UA server
+
+# Several stereo rigs in one service, each in its own worker process with its own OPC UA subtree
+# (Cablelay/<rig>/Height Data, Cablelay/<rig>/Status). None runs the single rig configured above.
+# Per rig: camera indices or stream URLs 'left'/'right' (or 'replay': recording path), optional 'calibration'
+# bundle, 'zones', 'match_mode', 'matcher_backend' (a backend name; the rigs' workers would time each other, so
+# there is no 'auto'), 'depth_map_params', 'preprocess_params' and 'threads' (OpenCV threads per worker).
+RIGS = None
+# RIGS = {'rig1': {'left': 2, 'right': 0, 'calibration': 'calibration_rig1.bin'},
+#         'rig2': {'left': 6, 'right': 4, 'calibration': 'calibration_rig2.bin'}}
+RIG_RESTART_DELAY = 1.0        # First restart delay (s) after a worker crash, doubling up to RIG_MAX_RESTART_DELAY
+RIG_MAX_RESTART_DELAY = 30.0
 
 # Siemens PLC OPC UA port
 PLC_IP_ADDRESS = "192.168.0.10"
 PLC_PORT = 4840
 
+# Height publishing to the PLC
+PUBLISH_DEADBAND = 0.005       # Suppress height changes smaller than this (Q.xml units, metres)
+PUBLISH_MAX_RATE = 10          # Max height batches per second, independent of the frame rate
+PUBLISH_KEEPALIVE = 1.0        # Republish unchanged heights at least this often (s)
+# Delay (ms) before client writes (filters, matcher, zones) are noticed; they reach the next frame after that
+OPCUA_SUBSCRIPTION_PERIOD = 100
+
 
 # Preprocessing Configuration
 NOISE_THRESHOLD = 0.7
@@ -22,6 +81,43 @@ uniquenessRatio = 10           # Set to 10 for balanced filtering of incorrect m
 speckleWindowSize = 100        # Use 100 to filter out small noise regions
 speckleRange = 32              # Set to 32 to handle disparity variations within noisy areas
 disp12MaxDiff = 1              # Set to 1 to ensure left-right consistency while allowing minor disparity variations
+ZONE_ROWS = (40, 200, 400)     # Image rows where height1..3 are measured
+# Measurement zones, any number: image rows, (x, y, w, h) rectangles or {'polyline': [[x, y], ...], 'thickness': 5}
+# / {'polygon': [[x, y], ...]}. Writable at runtime as JSON through the OPC UA Zones object ('definitions').
+ZONES = list(ZONE_ROWS)
+ZONE_STATISTIC = 'median'      # Zone statistic published as height1..3: 'median' (robust to outliers) or 'mean'
+ZONE_PERCENTILES = (10, 90)    # Published per zone alongside median and mean
+MATCH_MODE = 'full'            # 'full' frame (tuning/visualization), 'bands' around the zone rows (production)
+                               # or 'pyramid' (coarse pass narrows the disparity search, see pyramid_benchmark)
+BAND_MARGIN = 16               # Extra rows above/below each zone band for SGBM path aggregation
+PYRAMID_SCALE = 2              # Coarse pass at 1/2 or 1/4 resolution
+PYRAMID_REFINE = 'zones'       # Refine at full resolution around the 'zones' only, or over the 'full' frame
+PYRAMID_MARGIN = 8             # Disparity pixels added on each side of the coarse disparity window
+ADAPTIVE_RANGE = False         # 'full'/'bands' modes: search only the disparity range predicted from recent frames
+ADAPTIVE_RANGE_MARGIN = 8      # Disparity pixels added on each side of the predicted range
+ADAPTIVE_RANGE_HISTORY = 8     # Frames the predicted range is built from
+# Stereo matcher backend (modules/edge_detection/matcher_backends.py): None for SGBM in the 'mode' of the matcher
+# parameters, a backend name ('bm', 'sgbm', 'hh', 'hh4', '3way'), or 'auto' to time and score every backend at
+# startup (`python -m modules.depth_map.backend_selection` prints the table) and use the most accurate one whose
+# frame time fits FRAME_BUDGET_MS (the most accurate one if there is no budget)
+MATCHER_BACKEND = None
+MATCHER_SELECTION_PAIRS = 4    # Pairs each backend is timed and scored on at startup
+MATCHER_SELECTION_RECORDING = None  # Recording from the deployment cameras to select on; None: synthetic pairs
+
+# Frame budget: step down QUALITY_LADDER when frames take longer than the target, back up when they fit again
+FRAME_BUDGET_MS = None         # Target frame time (ms), e.g. 33 for 30 fps; None keeps full quality always
+FRAME_BUDGET_HEADROOM = 0.7    # Step back up once frames take less than this fraction of the target
+FRAME_BUDGET_WINDOW = 30       # Frames per decision; their 90th percentile is compared with the target
+FRAME_BUDGET_RETRY = 30.0      # Seconds before a level that was over budget is tried again
+# Best quality first; each rung adds to the ones above it. Settings: 'interpolation' (rectification),
+# 'numDisparities' (x16, only ever lowers the configured value), 'blockSize', 'mode' ('3way', 'sgbm', 'hh4',
+# 'hh') and 'match_scale' (2 or 4 matches at reduced resolution). Rank rungs on the target board with
+# benchmarks/frame_budget_benchmark.py: HH4 is slower than 3WAY single-threaded and not a cheaper rung there.
+QUALITY_LADDER = [{'name': 'full'},
+                  {'name': 'linear', 'interpolation': 'linear'},
+                  {'name': 'disparities96', 'numDisparities': 6},
+                  {'name': 'half_resolution', 'match_scale': 2},
+                  {'name': 'quarter_resolution', 'match_scale': 4}]
 
 
 
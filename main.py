@@ -1,5 +1,7 @@
 # main.py
+import argparse
 import math
+import time
 from time import sleep
 
 import cv2 as cv
@@ -9,10 +11,15 @@ import schedule
 import asyncio
 
 from config import config
-from modules.depth_map import Preprocessor, DepthMapProcessorSGBM
-from modules.camera import CameraInterface
+from modules.depth_map import Preprocessor, DepthMapProcessorSGBM, PointCloudExporter
+from modules.depth_map.backend_selection import select_backend, describe_backend
+from modules.camera import CameraInterface, ReplayCapture, is_stream_url
+from modules.diagnostics import create_instrumentation
 from modules.edge_detection.calibration import Rectification
+from modules.edge_detection.calibration_bundle import calibration_sources
 from modules.opc_server import OpcuaServer
+from modules.pipeline import PipelineExecutor, LiveParameters, FrameBudgetController
+from modules.rig import RigSupervisor
 
 # Constants
 CAMERA_RESOLUTION = config.CAMERA_RESOLUTION
@@ -20,10 +27,46 @@ OPCUA_SERVER_URL = "opc.tcp://0.0.0.0:4840/cablelay/server/"
 OPCUA_NAMESPACE = "http://cablelay.com"
 
 
-# To PLC
-async def send_to_plc(opcua_server, name, value):
-    if not math.isnan(value):
-        opcua_server.update_variable(name, value)
+# To PLC (one batch, deadband and rate limited; NaN heights keep their last value)
+async def send_to_plc(opcua_server, heights):
+    opcua_server.publish_heights(heights)
+
+
+# Frames lost before reaching the publisher: unpaired camera frames plus frames dropped between stages
+def dropped_frames(capture, executor=None):
+    stats = capture.stats()
+    dropped = max(stats['dropped_left'], stats['dropped_right'])
+    if executor is not None:
+        dropped += sum(stage.input.dropped for stage in executor.stages)
+    return dropped
+
+
+# Recordings are already grayscale; camera frames are BGR
+def to_gray(frame):
+    return cv.cvtColor(frame, cv.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+
+# Next timestamp-matched pair, or None to stop: at the end of a recording, when stopped is set, or when local
+# cameras stop delivering. Network streams reconnect on their own grab threads, so with streaming a timeout only
+# means the streams are down and the wait goes on.
+def next_pair(capture, streaming, stopped=None, timeout=1.0):
+    outage_start = None
+    while stopped is None or not stopped.is_set():
+        pair = capture.read_pair(timeout=timeout)
+        if pair is not None:
+            if outage_start is not None:
+                print(f"Camera streams delivering after {time.monotonic() - outage_start:.1f} s without frames.")
+            return pair
+        if isinstance(capture, ReplayCapture):
+            print("End of recording. Exiting.")
+            return None
+        if not streaming:
+            print("Error capturing frames. Exiting.")
+            return None
+        if outage_start is None:
+            outage_start = time.monotonic() - timeout
+            print("No frames from the camera streams, waiting for them to (re)connect.")
+    return None
 
 
 # Callback function for subscription notifications
@@ -36,57 +79,234 @@ def run_opcua_server(opcua_server):
     opcua_server.run()
 
 
-async def main():
-    # Initialize camera interface
-    camera = CameraInterface(CAMERA_RESOLUTION)
-    vid_left, vid_right = camera.getcamera()
+# Run capture -> rectify -> preprocess -> disparity -> reprojection -> publish with one worker per stage
+# Every frame takes one parameter snapshot and its quality level at capture and carries them through the
+# stages as (snapshot, level, data...); the busiest stage of each frame is what the frame budget sees
+def run_pipeline(capture, rectification, preprocessor, depth_map_processor, opcua_server, instrumentation,
+                 parameters, budget, exporter=None, streaming=False):
+    def capture_frames():
+        pair = next_pair(capture, streaming, executor.stopped)
+        if pair is None:
+            return None
+        frame_left, frame_right, _, _ = pair
+        return parameters.acquire(), budget.level, to_gray(frame_left), to_gray(frame_right)
+
+    def rectify(frame):
+        budget.apply_rectification(rectification, frame[1])
+        return (frame[0], frame[1], *rectification.undistortrectify(frame[2], frame[3]))
+
+    # The preprocessing engine writes into a ring of reused buffers, and this stage keeps running while the
+    # disparity stage matches an earlier frame, so the frame passed on gets its own copy
+    def preprocess(frame):
+        preprocessor.apply_params(frame[0].preprocess)
+        left, right = preprocessor.preprocess_pair(frame[2], frame[3])
+        return frame[0], frame[1], left.copy(), right.copy()
+
+    def disparity(frame):
+        snapshot = frame[0]
+        depth_map_processor.apply_params(snapshot.sgbm)
+        budget.apply_matcher(depth_map_processor, frame[1])
+        disparity_raw = depth_map_processor.compute_disparity(frame[2], frame[3], snapshot.zones)
+        if exporter is not None:
+            exporter.record(disparity_raw, frame[2])
+        return snapshot, disparity_raw
+
+    def publish(sequence, stats):
+        opcua_server.publish_heights(stats['height'])
+        opcua_server.publish_zones(stats)
+        instrumentation.count('frames')
+        instrumentation.count_nan(stats['height'])
+
+    wrap = instrumentation.wrap
+    stages = [('rectify', wrap('rectify', rectify)),
+              ('preprocess', wrap('preprocess', preprocess)),
+              ('disparity', wrap('disparity', disparity)),
+              ('reprojection', wrap('reprojection',
+                                    lambda frame: depth_map_processor.measure_zones(frame[1], frame[0].zones)))]
+    executor = PipelineExecutor(wrap('capture', capture_frames), stages, wrap('publish', publish),
+                                queue_size=config.PIPELINE_QUEUE_SIZE,
+                                monitor=lambda frame: budget.observe(frame.busiest_ms))
+    instrumentation.gauge('dropped_frames', lambda: dropped_frames(capture, executor))
+    executor.start()
+    try:
+        while not executor.wait(config.PIPELINE_STATS_INTERVAL):
+            print(f"Pipeline stats: {executor.stats()}")
+    finally:
+        executor.stop()
+        print(f"Pipeline stats: {executor.stats()}")
+
+
+# Every rig of config.RIGS in its own worker process, supervised and published from this process
+def run_rigs(rigs):
+    opcua_server = OpcuaServer(OPCUA_SERVER_URL, OPCUA_NAMESPACE, callback=opc_callback,
+                               publish_deadband=config.PUBLISH_DEADBAND, publish_max_rate=config.PUBLISH_MAX_RATE,
+                               publish_keepalive=config.PUBLISH_KEEPALIVE)
+    opcua_thread = threading.Thread(target=run_opcua_server, args=(opcua_server,), daemon=True)
+    opcua_thread.start()
+
+    supervisor = RigSupervisor(rigs, opcua_server, restart_delay=config.RIG_RESTART_DELAY,
+                               max_restart_delay=config.RIG_MAX_RESTART_DELAY).start()
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        print("Stopping rigs.")
+    finally:
+        supervisor.stop()
+        print(f"Rig stats: {supervisor.stats()}")
+        opcua_server.stop()
+
+
+async def main(headless=config.HEADLESS, diagnostics=config.DIAGNOSTICS, record_path=config.RECORD_PATH,
+               replay_path=None, replay_speed=1.0, point_cloud_path=config.POINT_CLOUD_PATH):
+    if replay_path is not None:
+        # Replay a stereo recording instead of the cameras
+        capture = ReplayCapture(replay_path, speed=replay_speed).start()
+    else:
+        # Initialize camera interface
+        camera = CameraInterface(CAMERA_RESOLUTION, config.CAMERA_LEFT, config.CAMERA_RIGHT,
+                                 stream_timeout=config.STREAM_TIMEOUT,
+                                 reconnect_delay=config.STREAM_RECONNECT_DELAY,
+                                 max_reconnect_delay=config.STREAM_MAX_RECONNECT_DELAY)
+        capture = camera.start_capture(max_skew=config.CAPTURE_MAX_SKEW, ring_size=config.CAPTURE_RING_SIZE,
+                                       max_age=config.CAPTURE_MAX_AGE, record_path=record_path,
+                                       record_compression=config.RECORD_COMPRESSION)
+
+    pipelined = headless and config.PIPELINED
+    streaming = replay_path is None and (is_stream_url(config.CAMERA_LEFT) or is_stream_url(config.CAMERA_RIGHT))
 
     # Initialize processors
-    preprocessor = Preprocessor()
-    rectification = Rectification()
-    depth_map_processor = DepthMapProcessorSGBM()
+    map_file, q_file = calibration_sources(config.CALIBRATION_BUNDLE)
+    preprocessor = Preprocessor(headless=headless)
+    rectification = Rectification(map_file, interpolation=config.RECTIFICATION_INTERPOLATION,
+                                  fixed_point=config.RECTIFICATION_FIXED_POINT, roi=config.RECTIFICATION_ROI)
+    depth_map_processor = DepthMapProcessorSGBM(q_file_path=q_file, match_mode=config.MATCH_MODE,
+                                                band_margin=config.BAND_MARGIN, headless=headless,
+                                                pyramid_scale=config.PYRAMID_SCALE,
+                                                pyramid_refine=config.PYRAMID_REFINE,
+                                                pyramid_margin=config.PYRAMID_MARGIN,
+                                                adaptive_range=config.ADAPTIVE_RANGE,
+                                                range_margin=config.ADAPTIVE_RANGE_MARGIN,
+                                                range_history=config.ADAPTIVE_RANGE_HISTORY,
+                                                zone_statistic=config.ZONE_STATISTIC,
+                                                zone_percentiles=config.ZONE_PERCENTILES,
+                                                matcher_backend=None if config.MATCHER_BACKEND == 'auto'
+                                                else config.MATCHER_BACKEND)
+    if config.MATCHER_BACKEND == 'auto':
+        # Time and score every matcher backend on this machine and keep the most accurate one within the budget
+        chosen, results = select_backend(depth_map_processor, config.ZONES, config.FRAME_BUDGET_MS,
+                                         CAMERA_RESOLUTION[::-1], config.MATCHER_SELECTION_PAIRS, rectification,
+                                         preprocessor, config.MATCHER_SELECTION_RECORDING)
+        for result in sorted(results, key=lambda r: r['frame_ms']):
+            print(f"Matcher backend {describe_backend(result, config.FRAME_BUDGET_MS)}")
+        print(f"Matcher backend: {depth_map_processor.backend_name()}"
+              f"{'' if chosen is not None else ' (no backend worked, kept the configured one)'}")
+
+    # Stage timings and counters (no-op hooks when diagnostics are off)
+    instrumentation = create_instrumentation(diagnostics)
+
+    # Filter, matcher and zone parameters written over OPC UA, picked up as one snapshot per frame
+    parameters = LiveParameters(preprocessor.params, depth_map_processor.params, config.ZONES, instrumentation,
+                                check_preprocess=preprocessor.check_params,
+                                check_sgbm=lambda params: depth_map_processor.check_params(
+                                    params, CAMERA_RESOLUTION[::-1])).start()
+    instrumentation.gauge('dropped_frames', lambda: dropped_frames(capture))
+
+    # Steps down config.QUALITY_LADDER while frames take longer than config.FRAME_BUDGET_MS
+    budget = FrameBudgetController(config.FRAME_BUDGET_MS, config.QUALITY_LADDER,
+                                   interpolation=config.RECTIFICATION_INTERPOLATION,
+                                   headroom=config.FRAME_BUDGET_HEADROOM, window=config.FRAME_BUDGET_WINDOW,
+                                   retry_after=config.FRAME_BUDGET_RETRY)
+    # Point clouds of some frames for offline analysis; record() only queues a copy for the writer thread
+    exporter = None
+    if point_cloud_path is not None:
+        exporter = PointCloudExporter(point_cloud_path, depth_map_processor.Q, voxel_size=config.POINT_CLOUD_VOXEL,
+                                      max_fps=config.POINT_CLOUD_FPS, queue_size=config.POINT_CLOUD_QUEUE_SIZE,
+                                      chunk_frames=config.POINT_CLOUD_CHUNK_FRAMES).start()
+        instrumentation.gauge('dropped_point_clouds', lambda: exporter.dropped)
+    if depth_map_processor.range_predictor is not None:
+        predictor = depth_map_processor.range_predictor
+        instrumentation.gauge('reduced_range_frames', lambda: predictor.reduced_frames)
+        instrumentation.gauge('full_range_frames', lambda: predictor.full_frames)
 
     # Initialize OPC UA server
-    opcua_server = OpcuaServer(OPCUA_SERVER_URL, OPCUA_NAMESPACE, callback=opc_callback)
+    opcua_server = OpcuaServer(OPCUA_SERVER_URL, OPCUA_NAMESPACE, callback=opc_callback,
+                               publish_deadband=config.PUBLISH_DEADBAND, publish_max_rate=config.PUBLISH_MAX_RATE,
+                               publish_keepalive=config.PUBLISH_KEEPALIVE, instrumentation=instrumentation,
+                               diagnostics_interval=config.DIAGNOSTICS_INTERVAL, parameters=parameters,
+                               subscription_period=config.OPCUA_SUBSCRIPTION_PERIOD,
+                               quality=budget if budget.enabled else None)
 
     # Run OPC UA server in a separate thread
     opcua_thread = threading.Thread(target=run_opcua_server, args=(opcua_server,), daemon=True)
     opcua_thread.start()
 
     try:
-        while True:
-            # Capture frames from left and right cameras
-            ret_left, frame_left = vid_left.read()
-            ret_right, frame_right = vid_right.read()
+        if pipelined:
+            run_pipeline(capture, rectification, preprocessor, depth_map_processor, opcua_server, instrumentation,
+                         parameters, budget, exporter, streaming)
+            return
 
-            if not ret_left or not ret_right:
-                print("Error capturing frames. Exiting.")
+        while True:
+            # Capture a timestamp-matched pair from the left and right grab threads
+            start = instrumentation.now()
+            pair = next_pair(capture, streaming)
+            if pair is None:
                 break
+            frame_left, frame_right, _, _ = pair
+            frame_start = time.perf_counter()  # The frame budget counts processing, not waiting for the cameras
 
             # Convert frames to grayscale
-            gray_left = cv.cvtColor(frame_left, cv.COLOR_BGR2GRAY)
-            gray_right = cv.cvtColor(frame_right, cv.COLOR_BGR2GRAY)
+            gray_left = to_gray(frame_left)
+            gray_right = to_gray(frame_right)
+            instrumentation.record('capture', start)
+
+            # Parameters for this frame: the latest OPC UA writes, on top of any trackbar changes
+            snapshot = parameters.acquire()
+            preprocessor.apply_params(snapshot.preprocess)
+            depth_map_processor.apply_params(snapshot.sgbm)
+            level = budget.level
+            budget.apply_rectification(rectification, level)
+            budget.apply_matcher(depth_map_processor, level)
 
             # Rectify images
+            start = instrumentation.now()
             gray_left, gray_right = rectification.undistortrectify(gray_left, gray_right)
+            instrumentation.record('rectify', start)
 
             # Preprocess images
-            preprocessed_left = preprocessor.preprocess(gray_left)
-            preprocessed_right = preprocessor.preprocess(gray_right)
+            start = instrumentation.now()
+            preprocessed_left, preprocessed_right = preprocessor.preprocess_pair(gray_left, gray_right)
+            instrumentation.record('preprocess', start)
+
+            # Compute heights (numeric outputs only)
+            zones = snapshot.zones
+            start = instrumentation.now()
+            disparity_raw = depth_map_processor.compute_disparity(preprocessed_left, preprocessed_right, zones)
+            instrumentation.record('disparity', start)
+            start = instrumentation.now()
+            heights = depth_map_processor.compute_heights_from_disparity(disparity_raw, zones)
+            instrumentation.record('reprojection', start)
+            if exporter is not None:
+                exporter.record(disparity_raw, preprocessed_left)
+
+            # Update OPC UA variables
+            start = instrumentation.now()
+            await send_to_plc(opcua_server, heights)
+            opcua_server.publish_zones(depth_map_processor.last_zone_stats)
+            instrumentation.record('publish', start)
+            instrumentation.count('frames')
+            instrumentation.count_nan(heights)
+            budget.observe((time.perf_counter() - frame_start) * 1000.0)
+
+            if headless:
+                continue
 
             # Display preprocessed images side by side
             combined_preprocessed = np.hstack((preprocessed_left, preprocessed_right))
             cv.imshow(preprocessor.window_name, combined_preprocessed)
 
-            # Compute depth map
-            depth_map, height1, height2, height3 = depth_map_processor.compute_disparity_map(preprocessed_left,
-                preprocessed_right)
-            cv.imshow(depth_map_processor.window_name, depth_map)
-
-            # Update OPC UA variables
-            await send_to_plc(opcua_server, "height1", height1)
-            await send_to_plc(opcua_server, "height2", height2)
-            await send_to_plc(opcua_server, "height3", height3)
+            # Display the depth map, rendered only because a window is showing it
+            cv.imshow(depth_map_processor.window_name, depth_map_processor.render_depth_map())
 
             # Handle key press events
             key = cv.waitKey(1) & 0xFF
@@ -100,11 +320,43 @@ async def main():
 
     finally:
         # Release resources
-        vid_left.release()
-        vid_right.release()
-        cv.destroyAllWindows()
+        capture.stop()
+        print(f"Capture stats: {capture.stats()}")
+        if getattr(capture, 'recorder', None) is not None:
+            print(f"Recording stats: {capture.recorder.stats()}")
+        print(f"Matcher stats ({depth_map_processor.backend_name()}): {depth_map_processor.matcher_stats()}")
+        if depth_map_processor.range_predictor is not None:
+            print(f"Disparity range stats: {depth_map_processor.range_stats()}")
+        print(f"Publish stats: {opcua_server.height_publisher.stats()}")
+        print(f"Parameter stats: {parameters.stats()}")
+        if budget.enabled:
+            print(f"Frame budget stats: {budget.stats()}")
+        if exporter is not None:
+            exporter.close()
+            print(f"Point cloud stats: {exporter.stats()}")
+        parameters.stop()
+        if instrumentation.enabled:
+            print(f"Diagnostics: {instrumentation.snapshot()}")
+        if not headless:
+            cv.destroyAllWindows()
         opcua_server.stop()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Cable-lay stereo height measurement service.")
+    parser.add_argument('--headless', action=argparse.BooleanOptionalAction, default=config.HEADLESS,
+                        help="Run without windows, trackbars or visualization (default: config.HEADLESS)")
+    parser.add_argument('--no-diagnostics', dest='diagnostics', action='store_false', default=config.DIAGNOSTICS,
+                        help="Disable stage timing and the OPC UA Diagnostics object")
+    parser.add_argument('--record', default=config.RECORD_PATH, help="Record every captured pair to this file")
+    parser.add_argument('--replay', help="Run on a stereo recording instead of the cameras")
+    parser.add_argument('--replay-speed', type=float, default=1.0, help="Playback speed, 0 for as fast as possible")
+    parser.add_argument('--export-cloud', default=config.POINT_CLOUD_PATH,
+                        help="Write voxel-downsampled point clouds of some frames to this directory")
+    args = parser.parse_args()
+    if config.RIGS:
+        run_rigs(config.RIGS)
+    else:
+        asyncio.run(main(headless=args.headless, diagnostics=args.diagnostics, record_path=args.record,
+                         replay_path=args.replay, replay_speed=args.replay_speed,
+                         point_cloud_path=args.export_cloud))
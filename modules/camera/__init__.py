@@ -1,5 +1,11 @@
 # camera/__init__.py
 
 from .camera_interface import CameraInterface
+from .stereo_capture import StereoCapture, CameraGrabber, FrameRing
+from .frame_bus import FrameBus, capture_to_bus
+from .stereo_recording import StereoRecorder, StereoRecording, ReplayCapture
+from .network_capture import NetworkCapture, is_stream_url
+from .loopback_stream import LoopbackStreamServer
 
-__all__ = ['CameraInterface']
+__all__ = ['CameraInterface', 'StereoCapture', 'CameraGrabber', 'FrameRing', 'StereoRecorder', 'StereoRecording',
+           'ReplayCapture', 'FrameBus', 'capture_to_bus', 'NetworkCapture', 'is_stream_url', 'LoopbackStreamServer']
@@ -1,15 +1,29 @@
 # camera_interface.py
 import cv2 as cv
 
+from .network_capture import NetworkCapture, is_stream_url
+from .stereo_capture import StereoCapture
+from .stereo_recording import StereoRecorder
+
 
 class CameraInterface:
-    def __init__(self, resolution):
+    # left_index/right_index: local camera indices or stream URLs (tcp://, rtsp://, http://), e.g. the Pi streams
+    def __init__(self, resolution, left_index=2, right_index=0, stream_timeout=2.0, reconnect_delay=0.5,
+                 max_reconnect_delay=10.0):
         self.resolution = resolution  # Camera initialization logic here
+        self.left_index = left_index
+        self.right_index = right_index
+        self.stream_settings = {'read_timeout': stream_timeout, 'reconnect_delay': reconnect_delay,
+                                'max_reconnect_delay': max_reconnect_delay}
 
     def getcamera(self):
+        # Network streams connect (and reconnect) on their grab threads
+        if is_stream_url(self.left_index) or is_stream_url(self.right_index):
+            return self.open_source(self.left_index), self.open_source(self.right_index)
+
         # Open cameras
-        frame_left = cv.VideoCapture(2)
-        frame_right = cv.VideoCapture(0)
+        frame_left = cv.VideoCapture(self.left_index)
+        frame_right = cv.VideoCapture(self.right_index)
 
         # Set resolution (should match the calibration resolution)
 
@@ -23,3 +37,19 @@ class CameraInterface:
         frame_right.set(cv.CAP_PROP_AUTOFOCUS, 0)
         frame_right.set(cv.CAP_PROP_FOCUS, 1)
         return frame_left, frame_right
+
+    def open_source(self, source):
+        if is_stream_url(source):
+            return NetworkCapture(source, **self.stream_settings)
+        return cv.VideoCapture(source)
+
+    # Open both cameras and start one grab thread per camera, pairing frames by timestamp
+    # With record_path set, every delivered pair is also written to a grayscale stereo recording
+    def start_capture(self, max_skew=0.015, ring_size=4, max_age=0.5, record_path=None, record_compression=None):
+        frame_left, frame_right = self.getcamera()
+        width, height = self.resolution
+        capture = StereoCapture(frame_left, frame_right, max_skew=max_skew, ring_size=ring_size,
+                                shape=(height, width, 3), max_age=max_age)
+        if record_path is not None:
+            capture.set_recorder(StereoRecorder(record_path, (height, width), record_compression).start())
+        return capture.start()
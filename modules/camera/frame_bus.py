@@ -0,0 +1,145 @@
+# frame_bus.py
+import time
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2 as cv
+import numpy as np
+
+MAGIC = 0x5355424d41524653  # 'SFRAMBUS'
+CONTROL_DTYPE = np.dtype([('magic', '<u8'), ('slots', '<i8'), ('height', '<i8'), ('width', '<i8'),
+                          ('head', '<i8')])  # head: sequence number of the newest committed pair
+SLOT_DTYPE = np.dtype([('sequence', '<i8'), ('ts_left', '<f8'), ('ts_right', '<f8'), ('writing', '<i8')])
+CONTROL_SIZE = 64
+
+
+# Shared-memory ring of fixed-size grayscale stereo pairs between one capture process and any number of
+# compute processes. Pair n lives in slot n % slots and is overwritten slots pairs later (overwrite-oldest,
+# the writer never waits). Frames are never pickled: readers get NumPy views straight into the segment.
+# Each slot's sequence number doubles as a seqlock: it is cleared while the slot is written and set on
+# commit, so readers can tell whether a view they hold has since been overwritten (valid()).
+class FrameBus:
+    def __init__(self, memory, owner=False):
+        self.memory = memory
+        self.owner = owner  # The creating process unlinks the segment
+        self.control = np.ndarray(1, CONTROL_DTYPE, memory.buf, 0)
+        slots = int(self.control['slots'][0])
+        self.shape = (int(self.control['height'][0]), int(self.control['width'][0]))
+        self.slots = slots
+        self.meta = np.ndarray(slots, SLOT_DTYPE, memory.buf, CONTROL_SIZE)
+        data_offset = data_start(slots)
+        self.frames = np.ndarray((slots, 2) + self.shape, np.uint8, memory.buf, data_offset)
+        self.pending = None
+
+    @classmethod
+    def create(cls, shape=(480, 640), slots=8, name=None):
+        height, width = shape
+        size = data_start(slots) + slots * 2 * height * width
+        memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        control = np.ndarray(1, CONTROL_DTYPE, memory.buf, 0)
+        control[0] = (MAGIC, slots, height, width, -1)
+        meta = np.ndarray(slots, SLOT_DTYPE, memory.buf, CONTROL_SIZE)
+        meta['sequence'] = -1
+        del control, meta  # No views may outlive close()
+        return cls(memory, owner=True)
+
+    # Open a bus created by another process
+    @classmethod
+    def attach(cls, name):
+        memory = shared_memory.SharedMemory(name=name)
+        # Only the creator should unlink the segment. An unrelated process has its own resource tracker,
+        # which would unlink it at exit; children started by multiprocessing share the creator's tracker.
+        if multiprocessing.parent_process() is None:
+            resource_tracker.unregister(memory._name, 'shared_memory')
+        if np.ndarray(1, CONTROL_DTYPE, memory.buf, 0)['magic'][0] != MAGIC:
+            memory.close()
+            raise ValueError(f"Shared memory {name} is not a frame bus")
+        return cls(memory)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    # Writer side: views of the next slot to write the pair into (e.g. cv.cvtColor(frame, dst=left))
+    def begin(self):
+        sequence = int(self.control['head'][0]) + 1
+        index = sequence % self.slots
+        self.meta['sequence'][index] = -1  # Readers holding the old pair now see it as overwritten
+        self.meta['writing'][index] = sequence
+        self.pending = (sequence, index)
+        return self.frames[index, 0], self.frames[index, 1]
+
+    def commit(self, ts_left, ts_right):
+        sequence, index = self.pending
+        self.meta['ts_left'][index] = ts_left
+        self.meta['ts_right'][index] = ts_right
+        self.meta['sequence'][index] = sequence
+        self.control['head'] = sequence
+        self.pending = None
+        return sequence
+
+    # Copy a pair in (converting BGR to grayscale on the way) and commit it
+    def publish(self, left, right, ts_left=0.0, ts_right=0.0):
+        slot_left, slot_right = self.begin()
+        for frame, slot in ((left, slot_left), (right, slot_right)):
+            if frame.ndim == 3:
+                cv.cvtColor(frame, cv.COLOR_BGR2GRAY, dst=slot)
+            else:
+                slot[...] = frame
+        return self.commit(ts_left, ts_right)
+
+    # Reader side
+    def head(self):
+        return int(self.control['head'][0])
+
+    def valid(self, sequence):
+        return sequence >= 0 and int(self.meta['sequence'][sequence % self.slots]) == sequence
+
+    # (left, right, ts_left, ts_right) views of a pair, or None if it was already overwritten.
+    # Views stay valid until the writer comes around to the slot again; check valid() after using them.
+    def read(self, sequence, copy=False):
+        if not self.valid(sequence):
+            return None
+        index = sequence % self.slots
+        left, right = self.frames[index, 0], self.frames[index, 1]
+        ts_left, ts_right = float(self.meta['ts_left'][index]), float(self.meta['ts_right'][index])
+        if copy:
+            left, right = left.copy(), right.copy()
+            if not self.valid(sequence):  # Overwritten while copying
+                return None
+        return left, right, ts_left, ts_right
+
+    # Block until a pair newer than after is committed; returns the newest sequence or None on timeout.
+    # Polls, so no lock is shared with the writer and a stalled reader can never block it.
+    def wait(self, after=-1, timeout=1.0, poll=0.0005):
+        deadline = time.monotonic() + timeout
+        while True:
+            head = self.head()
+            if head > after:
+                return head
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+
+    def close(self):
+        self.control = self.meta = self.frames = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+# Offset of the frame data: control block and slot table, rounded up to a page
+def data_start(slots):
+    return -(-(CONTROL_SIZE + slots * SLOT_DTYPE.itemsize) // 4096) * 4096
+
+
+# Capture-process loop: drain a StereoCapture-like source (read_pair) into the bus as fast as it delivers
+def capture_to_bus(capture, bus, stop, timeout=1.0):
+    published = 0
+    while not stop.is_set():
+        pair = capture.read_pair(timeout=timeout)
+        if pair is None:
+            continue
+        bus.publish(*pair)
+        published += 1
+    return published
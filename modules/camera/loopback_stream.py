@@ -0,0 +1,133 @@
+# loopback_stream.py
+# Raw MJPEG-over-TCP stream server, the kind of stream the Pi serves (opened as tcp://<host>:<port> through
+# FFmpeg), for running NetworkCapture and the whole service without cameras. Stream i is served on port + i
+# and all streams send their frame of each tick together, like a synchronized stereo pair. outage() drops the
+# clients and refuses connections for a while to exercise reconnects. Run from the repository root:
+#   python -m modules.camera.loopback_stream --port 5556 [--recording run.stereo] [--fps 30]
+# then e.g. CAMERA_LEFT = 'tcp://127.0.0.1:5556', CAMERA_RIGHT = 'tcp://127.0.0.1:5557'.
+import argparse
+import socket
+import threading
+import time
+
+import cv2 as cv
+
+
+class LoopbackStreamServer:
+    def __init__(self, streams, port, host='127.0.0.1', fps=30.0, quality=90):
+        # streams: one list of frames per stream, encoded once up front and then sent in a loop
+        self.packets = [[cv.imencode('.jpg', frame, [cv.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+                         for frame in frames] for frames in streams]
+        self.urls = [f"tcp://{host}:{port + i}" for i in range(len(streams))]
+        self.listeners = []
+        for i in range(len(streams)):
+            listener = socket.create_server((host, port + i))
+            listener.settimeout(0.2)
+            self.listeners.append(listener)
+        self.interval = 1.0 / fps
+        self.clients = [[] for _ in streams]
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.down_until = [0.0] * len(streams)
+        self.threads = []
+        self.sent = 0
+        self.connections = 0
+
+    def start(self):
+        for i in range(len(self.listeners)):
+            self.threads.append(threading.Thread(target=self.accept, args=(i,), name=f"loopback-accept-{i}",
+                                                 daemon=True))
+        self.threads.append(threading.Thread(target=self.send, name="loopback-send", daemon=True))
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def accept(self, stream):
+        while not self.stopped.is_set():
+            try:
+                client, _ = self.listeners[stream].accept()
+            except (socket.timeout, OSError):
+                continue
+            with self.lock:
+                if time.monotonic() < self.down_until[stream]:
+                    client.close()  # Refused during an outage
+                    continue
+                self.clients[stream].append(client)
+                self.connections += 1
+
+    # One frame per stream per tick, paced at the configured rate
+    def send(self):
+        tick = 0
+        next_time = time.monotonic()
+        while not self.stopped.is_set():
+            with self.lock:
+                for stream, clients in enumerate(self.clients):
+                    packet = self.packets[stream][tick % len(self.packets[stream])]
+                    for client in list(clients):
+                        try:
+                            client.sendall(packet)
+                        except OSError:
+                            clients.remove(client)
+                            client.close()
+            tick += 1
+            self.sent = tick
+            next_time += self.interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                self.stopped.wait(delay)
+            else:
+                next_time = time.monotonic()  # Fell behind: do not burst to catch up
+
+    # Drop the clients of a stream (all streams if None) and refuse new connections for the given seconds
+    def outage(self, seconds, stream=None):
+        streams = range(len(self.clients)) if stream is None else (stream,)
+        with self.lock:
+            for i in streams:
+                self.down_until[i] = time.monotonic() + seconds
+                for client in self.clients[i]:
+                    client.close()
+                self.clients[i] = []
+
+    def stop(self):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+        with self.lock:
+            for clients in self.clients:
+                for client in clients:
+                    client.close()
+        for listener in self.listeners:
+            listener.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a stereo pair as two MJPEG-over-TCP streams.")
+    parser.add_argument('--port', type=int, default=5556, help="Left stream port; the right one is port + 1")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--recording', help="Stereo recording to serve (default: synthetic pairs)")
+    parser.add_argument('--frames', type=int, default=100, help="Pairs taken from the recording")
+    args = parser.parse_args(argv)
+
+    if args.recording:
+        from .stereo_recording import StereoRecording
+        recording = StereoRecording(args.recording)
+        pairs = [recording[i][:2] for i in range(min(args.frames, len(recording)))]
+    else:
+        from modules.depth_map.synthetic import synthetic_stereo_pair
+        pairs = [synthetic_stereo_pair(seed=seed)[:2] for seed in range(10)]
+    server = LoopbackStreamServer([[left for left, _ in pairs], [right for _, right in pairs]], args.port,
+                                  args.host, args.fps).start()
+    print(f"Serving {len(pairs)} pairs at {args.fps:g} fps on {', '.join(server.urls)}")
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
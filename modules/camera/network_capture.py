@@ -0,0 +1,130 @@
+# network_capture.py
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+
+from modules.diagnostics import LatencyHistogram
+
+# Camera sources given as one of these URLs are network streams, everything else is a local camera index
+STREAM_SCHEMES = ('tcp://', 'udp://', 'rtsp://', 'http://', 'https://')
+
+
+def is_stream_url(source):
+    return isinstance(source, str) and source.lower().startswith(STREAM_SCHEMES)
+
+
+# A TCP/RTSP/HTTP camera stream (e.g. the Pi's `tcp://<pi>:5556`) behind the VideoCapture grab()/retrieve()/
+# release() interface, so a CameraGrabber thread drains the stream and decodes into its preallocated ring slots
+# exactly like a local camera. The connection is opened on the grab thread; a failed open or read drops it and
+# reconnects after a backoff delay that doubles up to max_reconnect_delay and is reset by the next frame.
+# MJPEG streams are read as raw JPEG packets and decoded in retrieve(), so decode time is measured on its own;
+# for other codecs (H.264 over RTSP) FFmpeg decodes inside grab() and decode time only covers the conversion.
+class NetworkCapture:
+    def __init__(self, url, open_timeout=3.0, read_timeout=2.0, reconnect_delay=0.5, max_reconnect_delay=10.0,
+                 backend=cv.CAP_FFMPEG):
+        self.url = url
+        self.open_timeout = open_timeout
+        self.read_timeout = read_timeout  # A stalled stream counts as lost after this many seconds
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.backend = backend
+        self.capture = None
+        self.raw = False  # Raw JPEG packets, decoded by retrieve()
+        self.lock = threading.Lock()  # release() must not free the capture while the grab thread reads it
+        self.released = threading.Event()
+        self.delay = reconnect_delay
+        self.connected = False
+        self.connects = 0
+        self.failures = 0
+        self.frames = 0
+        self.fps = 0.0
+        self.last_grab = None
+        self.last_error = None
+        self.decode_latency = LatencyHistogram()
+
+    def open(self):
+        params = [cv.CAP_PROP_OPEN_TIMEOUT_MSEC, int(self.open_timeout * 1000),
+                  cv.CAP_PROP_READ_TIMEOUT_MSEC, int(self.read_timeout * 1000)]
+        capture = cv.VideoCapture(self.url, self.backend, params)
+        if not capture.isOpened():
+            capture.release()
+            return False
+        fourcc = int(capture.get(cv.CAP_PROP_FOURCC)).to_bytes(4, 'little')
+        self.raw = fourcc == b'MJPG' and capture.set(cv.CAP_PROP_FORMAT, -1)
+        self.capture = capture
+        self.connected = True
+        self.connects += 1
+        if self.connects > 1:
+            print(f"Stream {self.url} reconnected")
+        return True
+
+    # Drop the connection; returns the backoff delay before the next attempt
+    def disconnect(self, reason):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+        if self.connected:
+            print(f"Stream {self.url} lost ({reason}), reconnecting")
+        self.connected = False
+        self.failures += 1
+        self.last_error = reason
+        self.last_grab = None
+        delay, self.delay = self.delay, min(self.delay * 2, self.max_reconnect_delay)
+        return delay
+
+    # Next frame from the stream (not decoded yet); False while the stream is down
+    def grab(self):
+        with self.lock:
+            if self.released.is_set():
+                return False
+            delay = None
+            if self.capture is None and not self.open():
+                delay = self.disconnect("open failed")
+            elif not self.capture.grab():
+                delay = self.disconnect("read failed")
+        if delay is not None:
+            self.released.wait(delay)  # Backoff, cut short by release()
+            return False
+
+        now = time.monotonic()
+        if self.last_grab is not None and now > self.last_grab:
+            self.fps += (1.0 / (now - self.last_grab) - self.fps) * (0.05 if self.frames > 1 else 1.0)
+        self.last_grab = now
+        self.delay = self.reconnect_delay
+        return True
+
+    # Decode the grabbed frame, into image if it has the stream's shape
+    def retrieve(self, image=None):
+        start = time.perf_counter()
+        with self.lock:
+            if self.capture is None:
+                return False, None
+            if not self.raw:
+                ret, frame = self.capture.retrieve(image)
+            else:
+                ret, packet = self.capture.retrieve()
+                frame = cv.imdecode(packet, cv.IMREAD_COLOR) if ret else None
+                ret = frame is not None
+                if ret and image is not None and image.shape == frame.shape:
+                    np.copyto(image, frame)
+                    frame = image
+        self.decode_latency.record((time.perf_counter() - start) * 1000.0)
+        if ret:
+            self.frames += 1
+        return ret, frame
+
+    def release(self):
+        self.released.set()
+        with self.lock:
+            if self.capture is not None:
+                self.capture.release()
+                self.capture = None
+        self.connected = False
+
+    def stats(self):
+        decode = self.decode_latency.snapshot()
+        return {'url': self.url, 'connected': self.connected, 'frames': self.frames, 'fps': self.fps,
+                'decode_ms_p50': decode['p50_ms'], 'decode_ms_p99': decode['p99_ms'],
+                'reconnects': max(0, self.connects - 1), 'failures': self.failures, 'last_error': self.last_error}
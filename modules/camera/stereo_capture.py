@@ -0,0 +1,217 @@
+# stereo_capture.py
+import threading
+import time
+
+import numpy as np
+
+
+# Fixed-size ring of preallocated frame slots filled by a single grab thread
+class FrameRing:
+    def __init__(self, size, shape=None, dtype=np.uint8):
+        self.size = size
+        self.frames = [np.empty(shape, dtype) if shape is not None else None for _ in range(size)]
+        self.timestamps = [0.0] * size
+        self.sequences = [-1] * size
+        self.head = -1  # Sequence number of the newest committed frame
+
+    # Return the slot index and buffer the next frame should be written into
+    def claim(self):
+        index = (self.head + 1) % self.size
+        self.sequences[index] = -1  # Mark the slot as being written
+        return index, self.frames[index]
+
+    # Publish a written slot together with its capture timestamp
+    def commit(self, index, frame, timestamp):
+        # The capture backend returns a new array when the slot shape does not match; keep it for reuse
+        self.frames[index] = frame
+        self.timestamps[index] = timestamp
+        self.sequences[index] = self.head + 1
+        self.head += 1
+
+    # Return (sequence, timestamp, frame) of the newest frame, or None
+    def latest(self):
+        head = self.head
+        if head < 0:
+            return None
+        index = head % self.size
+        return self.sequences[index], self.timestamps[index], self.frames[index]
+
+    # Return the frame newer than after_seq whose timestamp is closest to the given timestamp
+    def closest(self, timestamp, after_seq=-1):
+        best = None
+        for index in range(self.size):
+            sequence = self.sequences[index]
+            if sequence <= after_seq:
+                continue
+            skew = abs(self.timestamps[index] - timestamp)
+            if best is None or skew < best[0]:
+                best = (skew, sequence, self.timestamps[index], self.frames[index])
+        return best[1:] if best is not None else None
+
+    # Check that a slot still holds the given sequence (i.e. it was not overwritten)
+    def holds(self, sequence):
+        return sequence >= 0 and self.sequences[sequence % self.size] == sequence
+
+
+# One grab thread per camera, stamping each frame with a monotonic time right after grab()
+class CameraGrabber:
+    def __init__(self, name, capture, ring_size=4, shape=None, condition=None):
+        self.name = name
+        self.capture = capture
+        self.ring = FrameRing(ring_size, shape)
+        self.condition = condition or threading.Condition()
+        self.stopped = False
+        self.thread = None
+        self.grabbed = 0
+        self.failures = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.update, name=f"grab-{self.name}", daemon=True)
+        self.thread.start()
+        return self
+
+    def update(self):
+        while not self.stopped:
+            if not self.capture.grab():
+                self.failures += 1
+                time.sleep(0.005)
+                continue
+            timestamp = time.monotonic()
+
+            index, slot = self.ring.claim()
+            ret, frame = self.capture.retrieve(slot)
+            if not ret or frame is None:
+                self.failures += 1
+                continue
+
+            with self.condition:
+                self.ring.commit(index, frame, timestamp)
+                self.grabbed += 1
+                self.condition.notify_all()
+
+    def stop(self):
+        self.stopped = True
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        self.capture.release()
+
+
+# Pairs frames from two grab threads by timestamp
+class StereoCapture:
+    def __init__(self, capture_left, capture_right, max_skew=0.015, ring_size=4, shape=None, max_age=0.5):
+        self.max_skew = max_skew  # Seconds allowed between left and right capture times
+        self.max_age = max_age  # Pairs older than this (seconds) are considered stale
+        self.condition = threading.Condition()
+        self.left = CameraGrabber('left', capture_left, ring_size, shape, self.condition)
+        self.right = CameraGrabber('right', capture_right, ring_size, shape, self.condition)
+        self.last_left = -1
+        self.last_right = -1
+        self.pairs = 0
+        self.dropped_left = 0
+        self.dropped_right = 0
+        self.skew_rejects = 0
+        self.last_skew_reject = None  # (left, right) sequences of the last pair rejected for skew
+        self.stale_rejects = 0
+        self.torn_rejects = 0  # Pairs overwritten by a grab thread while read_pair copied them
+        self.last_skew = 0.0
+        self.recorder = None
+
+    # Also hand every delivered pair to a StereoRecorder (None stops recording)
+    def set_recorder(self, recorder):
+        self.recorder = recorder
+
+    def start(self):
+        self.left.start()
+        self.right.start()
+        return self
+
+    # Try to build a pair from the current ring contents; caller holds the condition lock
+    def _match(self):
+        newest_left = self.left.ring.latest()
+        newest_right = self.right.ring.latest()
+        if newest_left is None or newest_right is None:
+            return None
+        if newest_left[0] <= self.last_left or newest_right[0] <= self.last_right:
+            return None
+
+        # Match the newest frame of the lagging camera against the other camera's ring
+        if newest_left[1] >= newest_right[1]:
+            right = newest_right
+            left = self.left.ring.closest(right[1], self.last_left)
+        else:
+            left = newest_left
+            right = self.right.ring.closest(left[1], self.last_right)
+        if left is None or right is None:
+            return None
+
+        skew = abs(left[1] - right[1])
+        if skew > self.max_skew:
+            # Every wakeup re-evaluates the same heads until a new frame arrives; count each pair once
+            if self.last_skew_reject != (left[0], right[0]):
+                self.last_skew_reject = (left[0], right[0])
+                self.skew_rejects += 1
+            return None
+        if time.monotonic() - min(left[1], right[1]) > self.max_age:
+            self.stale_rejects += 1
+            self.last_left, self.last_right = newest_left[0], newest_right[0]
+            return None
+
+        # Frames skipped since the previous pair were never delivered
+        self.dropped_left += left[0] - self.last_left - 1
+        self.dropped_right += right[0] - self.last_right - 1
+        self.last_left, self.last_right = left[0], right[0]
+        self.last_skew = skew
+        self.pairs += 1
+        return left, right
+
+    # Block until a timestamp-matched (left, right) pair is available; returns None on timeout.
+    # The grab threads keep decoding into their ring slots, so a frame held for longer than ring_size frames
+    # would change underneath the caller: the pair is copied unless copy=False, for a caller that is done with
+    # the frames (or has converted them) before the next few frames arrive.
+    def read_pair(self, timeout=1.0, copy=True):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                match = self._match()
+                if match is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    self.condition.wait(remaining)
+                    continue
+
+                left, right = match
+                frame_left, frame_right = left[2], right[2]
+                if copy or self.recorder is not None:
+                    frame_left, frame_right = frame_left.copy(), frame_right.copy()
+                # The grab threads claim and write slots outside the lock: if either slot was claimed again while
+                # it was copied the copy may be torn, so drop the pair and match the newer frames instead
+                if self.left.ring.holds(left[0]) and self.right.ring.holds(right[0]):
+                    break
+                self.pairs -= 1
+                self.dropped_left += 1
+                self.dropped_right += 1
+                self.torn_rejects += 1
+
+            if self.recorder is not None:
+                self.recorder.record(frame_left, frame_right, left[1], right[1])
+        return frame_left, frame_right, left[1], right[1]
+
+    # Counters for grabbed, dropped and rejected frames, plus per-stream stats of network sources
+    def stats(self):
+        stats = {'pairs': self.pairs, 'grabbed_left': self.left.grabbed, 'grabbed_right': self.right.grabbed,
+                 'failures_left': self.left.failures, 'failures_right': self.right.failures,
+                 'dropped_left': self.dropped_left, 'dropped_right': self.dropped_right,
+                 'skew_rejects': self.skew_rejects, 'stale_rejects': self.stale_rejects,
+                 'torn_rejects': self.torn_rejects,
+                 'last_skew_ms': self.last_skew * 1000.0}
+        for side, grabber in (('left', self.left), ('right', self.right)):
+            if hasattr(grabber.capture, 'stats'):
+                stats[f'stream_{side}'] = grabber.capture.stats()
+        return stats
+
+    def stop(self):
+        self.left.stop()
+        self.right.stop()
+        if self.recorder is not None:
+            self.recorder.close()
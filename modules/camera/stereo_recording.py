@@ -0,0 +1,221 @@
+# stereo_recording.py
+import collections
+import os
+import threading
+import time
+import zlib
+
+import cv2 as cv
+import numpy as np
+
+# Container layout: a page-sized header, then one (left, right) record per pair appended back to back.
+# Uncompressed records are fixed-size raw slots, so the reader serves them as zero-copy memmap views.
+# The index lives in a sidecar file (<path>.idx) and is appended after the record it points to, so a
+# recording cut off mid-write still opens with every complete pair.
+MAGIC = b'STEREO1'
+HEADER_SIZE = 4096
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u2'), ('height', '<u4'), ('width', '<u4'),
+                         ('compression', 'S8')])
+INDEX_DTYPE = np.dtype([('sequence', '<i8'), ('ts_left', '<f8'), ('ts_right', '<f8'), ('offset', '<u8'),
+                        ('size_left', '<u4'), ('size_right', '<u4')])
+COMPRESSIONS = (None, 'zlib', 'png')
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+def encode_frame(frame, compression):
+    if compression is None:
+        return np.ascontiguousarray(frame).reshape(-1).data
+    if compression == 'zlib':
+        return zlib.compress(np.ascontiguousarray(frame).reshape(-1).data, 1)
+    return cv.imencode('.png', frame, [cv.IMWRITE_PNG_COMPRESSION, 1])[1].reshape(-1).data
+
+
+def decode_frame(data, compression, shape):
+    if compression is None:
+        return data.reshape(shape)
+    if compression == 'zlib':
+        return np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(shape)
+    return cv.imdecode(np.asarray(data), cv.IMREAD_GRAYSCALE)
+
+
+# Appends synchronized grayscale pairs to a recording. write() runs on the caller's thread;
+# record() hands pairs to a background writer so the capture path never waits on the disk.
+class StereoRecorder:
+    def __init__(self, path, shape, compression=None, queue_size=8):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression}, expected one of {COMPRESSIONS}")
+        self.path = path
+        self.shape = tuple(shape[:2])
+        self.compression = compression
+        self.sequence = 0
+        self.offset = HEADER_SIZE
+        self.written = 0
+        self.dropped = 0
+        self.bytes_written = 0
+
+        header = np.zeros(1, HEADER_DTYPE)
+        header['magic'], header['version'] = MAGIC, 1
+        header['height'], header['width'] = self.shape
+        header['compression'] = (compression or '').encode()
+        self.data_file = open(path, 'wb')
+        self.data_file.write(header.tobytes().ljust(HEADER_SIZE, b'\0'))
+        self.index_file = open(index_path(path), 'wb')
+
+        self.queue = collections.deque()
+        self.queue_size = queue_size
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+    def write(self, left, right, ts_left, ts_right):
+        if left.shape[:2] != self.shape or right.shape[:2] != self.shape:
+            raise ValueError(f"Frame shape {left.shape[:2]} does not match the recording shape {self.shape}")
+        data_left = encode_frame(left, self.compression)
+        data_right = encode_frame(right, self.compression)
+        self.data_file.write(data_left)
+        self.data_file.write(data_right)
+        self.data_file.flush()
+
+        entry = np.zeros(1, INDEX_DTYPE)
+        entry['sequence'], entry['ts_left'], entry['ts_right'] = self.sequence, ts_left, ts_right
+        entry['offset'], entry['size_left'], entry['size_right'] = self.offset, len(data_left), len(data_right)
+        self.index_file.write(entry.tobytes())
+        self.index_file.flush()
+
+        self.offset += len(data_left) + len(data_right)
+        self.bytes_written += len(data_left) + len(data_right)
+        self.sequence += 1
+        self.written += 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self.update, name="recorder", daemon=True)
+        self.thread.start()
+        return self
+
+    # Queue a pair for the writer thread; color frames are converted to grayscale here, which also copies
+    # them out of the capture ring. A full queue drops the pair instead of blocking the caller.
+    def record(self, left, right, ts_left, ts_right):
+        left = cv.cvtColor(left, cv.COLOR_BGR2GRAY) if left.ndim == 3 else left.copy()
+        right = cv.cvtColor(right, cv.COLOR_BGR2GRAY) if right.ndim == 3 else right.copy()
+        with self.condition:
+            if len(self.queue) >= self.queue_size:
+                self.dropped += 1
+                return False
+            self.queue.append((left, right, ts_left, ts_right))
+            self.condition.notify()
+        return True
+
+    def update(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.stopped:
+                    self.condition.wait()
+                if not self.queue:
+                    break
+                pair = self.queue.popleft()
+            self.write(*pair)
+
+    def stats(self):
+        return {'written': self.written, 'dropped': self.dropped, 'queued': len(self.queue),
+                'megabytes': self.bytes_written / 2 ** 20}
+
+    # Flush queued pairs and close the files
+    def close(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        self.data_file.close()
+        self.index_file.close()
+
+
+# Read-only view of a recording. The data file is memory-mapped; uncompressed pairs come back as
+# NumPy views into the map (no copy), compressed pairs are decoded on access.
+class StereoRecording:
+    def __init__(self, path):
+        self.path = path
+        header = np.fromfile(path, HEADER_DTYPE, count=1)
+        if header.size == 0 or header['magic'][0] != MAGIC:
+            raise ValueError(f"{path} is not a stereo recording")
+        self.shape = (int(header['height'][0]), int(header['width'][0]))
+        self.compression = header['compression'][0].decode() or None
+        self.data = None
+        self.index = None
+        self.refresh()
+
+    # Re-read the index and remap the data, e.g. while the recording is still being written
+    def refresh(self):
+        self.data = np.memmap(self.path, dtype=np.uint8, mode='r')
+        count = os.path.getsize(index_path(self.path)) // INDEX_DTYPE.itemsize
+        index = np.fromfile(index_path(self.path), INDEX_DTYPE, count=count)
+        # Only keep entries whose data is fully on disk
+        end = index['offset'] + index['size_left'] + index['size_right']
+        self.index = index[end <= self.data.size]
+
+    def __len__(self):
+        return len(self.index)
+
+    # (left, right, ts_left, ts_right) of the pair at position i
+    def __getitem__(self, i):
+        entry = self.index[i]
+        start = int(entry['offset'])
+        middle = start + int(entry['size_left'])
+        end = middle + int(entry['size_right'])
+        left = decode_frame(self.data[start:middle], self.compression, self.shape)
+        right = decode_frame(self.data[middle:end], self.compression, self.shape)
+        return left, right, float(entry['ts_left']), float(entry['ts_right'])
+
+    def timestamps(self):
+        return self.index['ts_left']
+
+    # Position of the first pair captured at or after the given timestamp
+    def seek(self, timestamp):
+        return int(np.searchsorted(self.index['ts_left'], timestamp))
+
+    # Yield pairs paced by their recorded timestamps; speed 2.0 plays twice as fast, 0 as fast as possible
+    def play(self, speed=1.0, start=0, stop=None, loop=False):
+        while True:
+            first_ts, first_time = None, None
+            for i in range(start, len(self) if stop is None else min(stop, len(self))):
+                pair = self[i]
+                if speed > 0:
+                    if first_ts is None:
+                        first_ts, first_time = pair[2], time.monotonic()
+                    delay = (pair[2] - first_ts) / speed - (time.monotonic() - first_time)
+                    if delay > 0:
+                        time.sleep(delay)
+                yield pair
+            if not loop:
+                return
+
+
+# Stands in for StereoCapture (start/read_pair/stats/stop) so the main loop can run on a recording
+class ReplayCapture:
+    def __init__(self, recording, speed=1.0, loop=False):
+        self.recording = recording if isinstance(recording, StereoRecording) else StereoRecording(recording)
+        self.player = self.recording.play(speed=speed, loop=loop)
+        self.pairs = 0
+
+    def start(self):
+        return self
+
+    # Next recorded pair, or None at the end of the recording
+    def read_pair(self, timeout=1.0, copy=False):
+        pair = next(self.player, None)
+        if pair is None:
+            return None
+        self.pairs += 1
+        left, right, ts_left, ts_right = pair
+        if copy:
+            left, right = left.copy(), right.copy()
+        return left, right, ts_left, ts_right
+
+    def stats(self):
+        return {'pairs': self.pairs, 'recorded_pairs': len(self.recording), 'dropped_left': 0, 'dropped_right': 0}
+
+    def stop(self):
+        self.player.close()
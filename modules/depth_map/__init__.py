@@ -1,5 +1,9 @@
 from .pre_processor import Preprocessor
 from .depth_map_processor import DepthMapProcessor
 from .depth_map_SGBM import DepthMapProcessorSGBM
+from .parameter_store import ParameterStore
+from .zones import ZoneSet, ZoneDefinitions
+from .point_cloud_export import PointCloudExporter
 
-__all__ = ['Preprocessor', 'DepthMapProcessor', 'DepthMapProcessorSGBM']
+__all__ = ['Preprocessor', 'DepthMapProcessor', 'DepthMapProcessorSGBM', 'ParameterStore', 'ZoneSet',
+           'ZoneDefinitions', 'PointCloudExporter']
@@ -0,0 +1,142 @@
+# backend_selection.py
+# Matcher backend selection on the deployment hardware. Every registered backend (matcher_backends.py) runs through
+# the processor's own matching path (match mode, bands, pyramid, zones) on synthetic or recorded pairs, and the
+# most accurate backend whose frame time fits the frame budget is used. main.py runs this at startup with
+# MATCHER_BACKEND = 'auto'; standalone it prints the table for this machine:
+#   python -m modules.depth_map.backend_selection [--budget-ms 100 --pairs 4 --match-mode bands]
+import argparse
+import time
+
+import cv2 as cv
+import numpy as np
+
+from modules.edge_detection.matcher_backends import MATCHER_BACKENDS
+from .sgbm_tuner import recorded_dataset, reference_data, select, synthetic_dataset, zone_errors
+from .zones import parse_zones
+
+
+# Frame time of every backend (90th percentile over all timed runs, plus the overhead of the other stages), its
+# relative height error against the reference heights and its zone coverage. Leaves the last backend selected.
+def benchmark_backends(processor, dataset, zones, names=None, repeat=3, overhead_ms=0.0):
+    results = []
+    for name in names or list(MATCHER_BACKENDS):
+        processor.set_backend(name)
+        frame_ms, errors, coverage = [], [], []
+        try:
+            for left, right, reference in dataset:
+                processor.compute_disparity(left, right, zones)  # Warm-up: matcher build and buffers
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    stats = processor.measure_zones(processor.compute_disparity(left, right, zones), zones)
+                    frame_ms.append((time.perf_counter() - start) * 1000.0 + overhead_ms)
+                errors.extend(zone_errors(stats['height'], reference))
+                coverage.extend(stats['coverage'].tolist())
+        except cv.error as e:
+            results.append({'name': name, 'frame_ms': float('inf'), 'height_error': float('inf'), 'coverage': 0.0,
+                            'error': str(e).strip()})
+            continue
+        results.append({'name': name, 'frame_ms': float(np.percentile(frame_ms, 90)),
+                        'height_error': float(np.mean(errors)) if errors else float('inf'),
+                        'coverage': float(np.mean(coverage)) if coverage else 0.0})
+    return results
+
+
+# Most accurate backend within the budget (None: no budget); if none fits, the fastest, and the frame-budget
+# controller's quality ladder takes it from there. None if no backend worked at all.
+def choose_backend(results, budget_ms=None):
+    chosen = select(results, budget_ms if budget_ms else float('inf'))
+    if chosen is None:
+        working = [r for r in results if np.isfinite(r['frame_ms'])]
+        chosen = min(working, key=lambda r: r['frame_ms']) if working else None
+    return chosen
+
+
+# Time of the stages around matching (rectification and preprocessing) per pair
+def stage_overhead_ms(pairs, rectification=None, preprocessor=None, repeat=3):
+    if rectification is None and preprocessor is None:
+        return 0.0
+    times = []
+    for left, right in pairs:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            if rectification is not None:
+                left, right = rectification.undistortrectify(left, right)
+            if preprocessor is not None:
+                left, right = preprocessor.preprocess_pair(left, right)
+            times.append((time.perf_counter() - start) * 1000.0)
+    return float(np.percentile(times, 90))
+
+
+# The startup step, on synthetic pairs with known disparity or on pairs of a recording from the deployment cameras
+# (scored, like the SGBM tuner does, against a full-DP HH match). Pairs get the production preprocessing;
+# recorded pairs are also rectified, synthetic ones are not (that would bend their known geometry) and only time
+# the rectification. Switches the processor to the chosen backend (back to its own if none worked) and returns
+# (chosen result, all results).
+def select_backend(processor, zones, budget_ms=None, shape=(480, 640), pairs=4, rectification=None,
+                   preprocessor=None, recording=None, names=None, repeat=3, seed=0):
+    original, mode = processor.backend_name(), processor.params.get('mode')
+    dataset = recorded_dataset(recording, pairs) if recording else synthetic_dataset(pairs, shape, seed)
+    overhead_ms = stage_overhead_ms([(left, right) for left, right, _ in dataset], rectification, preprocessor,
+                                    repeat)
+    prepared = []
+    for left, right, disparity in dataset:
+        if recording and rectification is not None:
+            left, right = rectification.undistortrectify(left, right)
+        if preprocessor is not None:
+            left, right = preprocessor.preprocess_pair(left, right)
+        prepared.append((left.copy(), right.copy(), disparity))
+    dataset = reference_data(prepared, zones, processor.Q, dict(processor.params), processor.zone_statistic)
+
+    results = benchmark_backends(processor, dataset, zones, names, repeat, overhead_ms)
+    chosen = choose_backend(results, budget_ms)
+    processor.params['mode'] = mode  # Trying the SGBM backends changed it
+    processor.set_backend(chosen['name'] if chosen is not None else original)
+    return chosen, results
+
+
+def describe_backend(result, budget_ms=None):
+    if 'error' in result:
+        return f"{result['name']:5s}  failed: {result['error']}"
+    fits = "" if not budget_ms else "  fits" if result['frame_ms'] <= budget_ms else "  over budget"
+    return (f"{result['name']:5s} {result['frame_ms']:8.1f} ms  error {result['height_error'] * 100:6.2f} %  "
+            f"coverage {result['coverage'] * 100:5.1f} %{fits}")
+
+
+def main(argv=None):
+    from modules.edge_detection.calibration import Rectification
+    from .depth_map_SGBM import DepthMapProcessorSGBM
+    from .pre_processor import Preprocessor
+    parser = argparse.ArgumentParser(description="Time and score every matcher backend on this machine.")
+    parser.add_argument('--budget-ms', type=float, help="Frame budget the chosen backend must fit (default: none)")
+    parser.add_argument('--pairs', type=int, default=4, help="Synthetic pairs, or pairs taken from the recording")
+    parser.add_argument('--recording', help="Stereo recording from the deployment cameras (main.py --record)")
+    parser.add_argument('--calibration', help="Rectify the recorded pairs with this bundle or stereoMap.xml")
+    parser.add_argument('--preprocess', help="Preprocess the pairs with this preprocess_params.json")
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--zones', default='[40, 200, 400]', help="Zone definitions as JSON (see config.ZONES)")
+    parser.add_argument('--match-mode', default='full', choices=('full', 'bands', 'pyramid'))
+    parser.add_argument('--params', default='./modules/depth_map/depth_map_params.json', help="Matcher parameters")
+    parser.add_argument('--q', default='Q.xml', help="Q matrix (calibration bundle or Q.xml)")
+    parser.add_argument('--backends', nargs='+', choices=sorted(MATCHER_BACKENDS), help="Default: all")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per pair")
+    args = parser.parse_args(argv)
+
+    processor = DepthMapProcessorSGBM(config_file=args.params, q_file_path=args.q, match_mode=args.match_mode,
+                                      headless=True)
+    rectification = Rectification(args.calibration, fixed_point=True) if args.calibration else None
+    preprocessor = Preprocessor(config_file=args.preprocess, headless=True) if args.preprocess else None
+    chosen, results = select_backend(processor, parse_zones(args.zones), args.budget_ms, (args.height, args.width),
+                                     args.pairs, rectification, preprocessor, args.recording, args.backends,
+                                     args.repeat)
+    for result in sorted(results, key=lambda r: r['frame_ms']):
+        print("  " + describe_backend(result, args.budget_ms))
+    if chosen is None:
+        print("No backend worked.")
+        return 1
+    print("Chosen: " + describe_backend(chosen, args.budget_ms))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
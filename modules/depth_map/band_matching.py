@@ -0,0 +1,28 @@
+# band_matching.py
+import numpy as np
+
+
+# Rows around each zone that the matcher needs: the block half-size plus a margin for the
+# SGBM path aggregation to settle. Overlapping bands are merged; returns sorted (y0, y1) pairs.
+def zone_bands(zones, height, block_size, margin=16):
+    pad = block_size // 2 + margin
+    bands = []
+    for row in sorted(zones):
+        if row < 0 or row >= height:
+            continue
+        y0, y1 = max(0, row - pad), min(height, row + pad + 1)
+        if bands and y0 <= bands[-1][1]:
+            bands[-1] = (bands[-1][0], max(bands[-1][1], y1))
+        else:
+            bands.append((y0, y1))
+    return bands
+
+
+# Run the matcher on each band only. Bands span the full width, so the left-image crop keeps
+# the numDisparities search margin. Rows outside the bands get the matcher's invalid value.
+def compute_band_disparity(matcher, left_image, right_image, bands):
+    invalid = (matcher.getMinDisparity() - 1) * 16
+    disparity = np.full(left_image.shape[:2], invalid, dtype=np.int16)
+    for y0, y1 in bands:
+        disparity[y0:y1] = matcher.compute(left_image[y0:y1], right_image[y0:y1])
+    return disparity
@@ -3,35 +3,81 @@ import numpy as np
 import os
 import json
 from modules.edge_detection.stereo_vision import StereoVision
+from modules.edge_detection.matcher_cache import MatcherCache, apply_settings
+from modules.edge_detection.matcher_backends import SGBM_MODES, get_backend, backend_name
+from modules.edge_detection.calibration_bundle import is_bundle, load_bundle
+from .parameter_store import ParameterStore, apply_snapshot
+from .zones import ZoneSet, zone_key, zone_statistics, draw_zone
+from .band_matching import zone_bands, compute_band_disparity
+from .pyramid_matching import coarse_settings, strip_regions, compute_pyramid_disparity, compute_scaled_disparity
+from .disparity_predictor import DisparityRangePredictor
 
 
 class DepthMapProcessorSGBM:
     def __init__(self, window_name='Depth Map', config_file='./modules/depth_map/depth_map_params.json',
-                 q_file_path='Q.xml'):
+                 q_file_path='Q.xml', match_mode='full', band_margin=16, headless=False, pyramid_scale=2,
+                 pyramid_refine='zones', pyramid_margin=8, pyramid_strip_rows=96, adaptive_range=False,
+                 range_margin=8, range_history=8, zone_statistic='median', zone_percentiles=(10, 90),
+                 matcher_backend=None):
         self.window_name = window_name
+        self.headless = headless  # No windows or trackbars; visual products only on request
+        # 'full' for tuning/visualization, 'bands' to match only around the zones, 'pyramid' for coarse-to-fine
+        self.match_mode = match_mode
+        self.band_margin = band_margin
+        self.pyramid_scale = pyramid_scale  # Coarse level at 1/2 or 1/4 resolution
+        self.pyramid_refine = pyramid_refine  # Refine 'zones' (bands around the zone rows) or the 'full' frame
+        self.pyramid_margin = pyramid_margin  # Disparity pixels added on each side of the coarse range
+        self.pyramid_strip_rows = pyramid_strip_rows
+        # Narrow the disparity search to the range predicted from recent frames ('full' and 'bands' modes)
+        self.range_predictor = DisparityRangePredictor(range_margin, range_history) if adaptive_range else None
+        self.zone_statistic = zone_statistic  # Zone statistic published as the heights: 'median' or 'mean'
+        self.zone_percentiles = zone_percentiles
+        self.zone_sets = {}  # ZoneSet per (zone definitions, frame size); see get_zone_set
         self.config_file = config_file
         self.q_file_path = q_file_path
-        self.autotune_max = -10000000
-        self.autotune_min = 10000000
         self.stereo_vision = StereoVision()
-        self.params = {'numDisparities': 6,  # Multiplier for 16
+        self.params = ParameterStore({'numDisparities': 6,  # Multiplier for 16
             'blockSize': 5,  # Must be odd and at least 5
             'minDisparity': 0, 'uniquenessRatio': 10, 'speckleWindowSize': 100, 'speckleRange': 2, 'preFilterCap': 25,
             'P1': 600,  # Smoothness term for SGBM
             'P2': 2400,  # Larger smoothness term for SGBM
-            'disp12MaxDiff': 1, }
+            'disp12MaxDiff': 1,
+            'mode': cv.STEREO_SGBM_MODE_SGBM_3WAY, })  # See SGBM_MODES
         self.max_values = {'numDisparities': 10,  # Max multiplier (numDisparities = multiplier * 16)
             'blockSize': 25,  # Max value for (blockSize - 5) // 2
             'uniquenessRatio': 100, 'speckleWindowSize': 200, 'speckleRange': 32, 'preFilterCap': 63, 'P1': 1000,
-            'P2': 4000, 'disp12MaxDiff': 25}
+            'P2': 4000, 'disp12MaxDiff': 25, 'mode': max(SGBM_MODES.values())}
+        self.applied_params = None
+        # Quality level set by the frame-budget controller: parameter overrides and a matching scale
+        self.quality_overrides = {}
+        self.match_scale = 1
+        self.quality_version = 0
+        # Matcher backend (see matcher_backends.py); the default is SGBM in the mode of the 'mode' parameter
+        self.backend = get_backend('3way')
+        self.matcher_cache = MatcherCache(self.create_stereo_matcher)
+        self.scaled_cache = MatcherCache(self.create_stereo_matcher)
+        self.coarse_cache = MatcherCache(self.create_stereo_matcher)
+        self.refine_cache = MatcherCache(self.create_stereo_matcher)
+        self.stereo = None
+        self.last_disparity = None
+        self.last_zones = None
+        self.last_heights = None
+        self.last_zone_stats = None
+        self.last_render = None
         self.load_parameters()
-        self.create_trackbars()
+        if matcher_backend is not None:
+            self.set_backend(matcher_backend)
+        if not self.headless:
+            self.create_trackbars()
         self.Q = self.load_q_matrix(self.q_file_path)
 
-    # Load Q matrix from file (provided by stereo calibration) to reproject disparity to 3D points
+    # Load Q matrix from file (provided by stereo calibration) to reproject disparity to 3D points.
+    # Accepts Q.xml or a calibration bundle.
     def load_q_matrix(self, file_path):
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"Q matrix file not found at {file_path}")
+        if is_bundle(file_path):
+            return np.array(load_bundle(file_path, verify=False).get('Q'))
 
         cv_file = cv.FileStorage(file_path, cv.FILE_STORAGE_READ)
         Q = cv_file.getNode("Q").mat()
@@ -64,118 +110,264 @@ class DepthMapProcessorSGBM:
     def on_trackbar_change(self, param, val):
         self.params[param] = val
 
+    # Take over the changed values of a parameter snapshot (LiveParameters); the matcher follows on the next
+    # compute_disparity() through the parameter version
+    def apply_params(self, params):
+        self.applied_params = apply_snapshot(self.params, params, self.applied_params)
+
     # Get parameter value
     def get_param(self, param, default=None):
         return self.params.get(param, default)
 
-    # Create StereoSGBM matcher with the current parameters
-    def create_stereo_matcher(self):
-        # Configure parameters for StereoSGBM
-        numDisparities = self.params['numDisparities'] * 16  # Must be multiple of 16
-        blockSize = self.params['blockSize'] * 2 + 5  # Ensures odd number >= 5
-        minDisparity = self.params['minDisparity']
-        uniquenessRatio = self.params['uniquenessRatio']
-        speckleWindowSize = self.params['speckleWindowSize']
-        speckleRange = self.params['speckleRange']
-        preFilterCap = self.params['preFilterCap']
-        disp12MaxDiff = self.params['disp12MaxDiff']
-        P1 = self.params['P1']
-        P2 = self.params['P2']
-
-        # Create StereoSGBM matcher
-        stereo = cv.StereoSGBM_create(minDisparity=minDisparity, numDisparities=numDisparities, blockSize=blockSize,
-            P1=P1, P2=P2, disp12MaxDiff=disp12MaxDiff, uniquenessRatio=uniquenessRatio,
-            speckleWindowSize=speckleWindowSize, speckleRange=speckleRange, preFilterCap=preFilterCap,
-            mode=cv.STEREO_SGBM_MODE_SGBM_3WAY)
-        return stereo
-
-    # Compute disparity map and extract height information
-    def compute_disparity_map(self, left_image, right_image, zone1=40, zone2=200, zone3=400, min_distance=0,
-                              max_distance=5000, disparity_threshold=1.0):
+    # Degrade (or restore) the matching for a quality level: overrides of the trackbar parameters
+    # (numDisparities only ever lowers the configured value) and a scale of 2 or 4 to match at reduced
+    # resolution. The parameters themselves, and what save_parameters() writes, are left alone.
+    def set_quality(self, overrides, match_scale=1):
+        if overrides == self.quality_overrides and match_scale == self.match_scale:
+            return
+        self.quality_overrides = dict(overrides)
+        self.match_scale = match_scale
+        self.quality_version += 1
+
+    # Raise ValueError for matcher parameters a frame of the given (height, width) cannot be matched with: values
+    # beyond the trackbar ranges (max_values), a disparity search reaching the frame width (SGBM fails to allocate)
+    # or a block the backend rejects
+    def check_params(self, params, shape):
+        for key, value in params.items():
+            if key in self.max_values and value > self.max_values[key]:
+                raise ValueError(f"{key} above {self.max_values[key]}")
+        settings = self.backend.settings(params)
+        height, width = shape
+        if settings['minDisparity'] + settings['numDisparities'] >= width:
+            raise ValueError(f"minDisparity + numDisparities * 16 must stay below the frame width {width}")
+        max_block_size = min(height, width, self.backend.max_block_size or height)
+        if settings['blockSize'] > max_block_size:
+            raise ValueError(f"block size {settings['blockSize']} above {max_block_size}")
+
+    # Version of everything the matcher settings derive from
+    def settings_version(self):
+        return self.params.version, self.quality_version
+
+    # Switch to another matcher backend by name: its selecting parameters (an SGBM mode) are written into the
+    # parameters and every cached matcher is rebuilt on the next frame
+    def set_backend(self, name):
+        self.backend = get_backend(name)
+        self.params.update(self.backend.params)
+        for cache in (self.matcher_cache, self.scaled_cache, self.coarse_cache, self.refine_cache):
+            cache.rebuild_keys = self.backend.rebuild_keys
+            cache.reset()
+        if self.range_predictor is not None:
+            self.range_predictor.reset()
+
+    # Name of the backend the current settings select (an SGBM backend's mode can be changed live)
+    def backend_name(self):
+        return backend_name(self.backend, self.matcher_settings())
+
+    # Translate the trackbar parameters into the backend's matcher settings
+    def matcher_settings(self):
+        params = dict(self.params)
+        for key, value in self.quality_overrides.items():
+            params[key] = min(params[key], value) if key == 'numDisparities' else value
+        return self.backend.settings(params)
+
+    # Create the backend's matcher with the current parameters
+    def create_stereo_matcher(self, settings=None):
+        settings = settings if settings is not None else self.matcher_settings()
+        return self.backend.create(settings)
+
+    # Return the cached matcher, updated or rebuilt only if the parameters changed since the last frame
+    def get_stereo_matcher(self):
+        return self.matcher_cache.get(self.settings_version(), self.matcher_settings)
+
+    # Coarse and full-resolution matchers for pyramid mode; the refine matcher's disparity window is
+    # set per region, so it is kept apart from the full-frame matcher
+    def get_pyramid_matchers(self):
+        coarse = self.coarse_cache.get(self.settings_version(),
+                                       lambda: coarse_settings(self.matcher_settings(), self.pyramid_scale,
+                                                               min_block_size=self.backend.min_block_size))
+        return coarse, self.refine_cache.get(self.settings_version(), self.matcher_settings)
+
+    # Matcher for reduced-resolution matching: the block and penalties scaled down like the pyramid's
+    # coarse level, but with the configured uniqueness ratio since its output is used directly
+    def get_scaled_matcher(self):
+        def settings():
+            full = self.matcher_settings()
+            return coarse_settings(full, self.match_scale, full['uniquenessRatio'], self.backend.min_block_size)
+        return self.scaled_cache.get(self.settings_version(), settings)
+
+    # Regions refined at full resolution as (y0, y1, match_y0, match_y1)
+    def pyramid_regions(self, zones, height, block_size):
+        if self.pyramid_refine == 'zones' and zones:
+            return [(y0, y1, y0, y1) for y0, y1 in zone_bands(zones, height, block_size, self.band_margin)]
+        return strip_regions(height, self.pyramid_strip_rows, block_size // 2 + self.band_margin)
+
+    # Matcher rebuild/update/reuse counters
+    def matcher_stats(self):
+        if self.match_mode == 'pyramid':
+            stats = {'coarse': self.coarse_cache.stats(), 'refine': self.refine_cache.stats()}
+        else:
+            stats = self.matcher_cache.stats()
+        if self.scaled_cache.matcher is not None:
+            stats = {'matcher': stats, 'scaled': self.scaled_cache.stats()}
+        return stats
+
+    # Label image and pixel index of the zones, built once per zone definitions and frame size. The pipeline
+    # calls this from the disparity and the reprojection stage, which may be on different zones during a change:
+    # each call returns the set it looked up or built itself, and a full cache is replaced, never changed in place.
+    def get_zone_set(self, zones, shape, max_cached=8):
+        key = (zone_key(zones), tuple(shape[:2]))
+        zone_set = self.zone_sets.get(key)
+        if zone_set is None:
+            zone_set = ZoneSet(zones, shape)
+            if len(self.zone_sets) >= max_cached:
+                self.zone_sets = {key: zone_set}
+            else:
+                self.zone_sets[key] = zone_set
+        return zone_set
+
+    # Compute the raw disparity map (int16, fixed-point with 4 fractional bits). In 'bands' mode only the
+    # rows around the given zones are matched; 'pyramid' mode narrows the disparity search from a coarse pass.
+    def compute_disparity(self, left_image, right_image, zones=None):
         # Ensure images are grayscale (required for SGBM)
         if left_image.ndim == 3:
             left_image = cv.cvtColor(left_image, cv.COLOR_BGR2GRAY)
         if right_image.ndim == 3:
             right_image = cv.cvtColor(right_image, cv.COLOR_BGR2GRAY)
 
-        self.stereo = self.create_stereo_matcher()
-
-        # Compute disparity map
-        disparity = self.stereo.compute(left_image, right_image).astype(np.float32) / 16.0
+        # Matching only needs the image rows the zones cover
+        if zones:
+            zones = self.get_zone_set(zones, left_image.shape).rows
+
+        if self.match_scale > 1:
+            self.stereo = self.get_scaled_matcher()
+            invalid = (self.matcher_settings()['minDisparity'] - 1) * 16
+            return compute_scaled_disparity(self.stereo, left_image, right_image, self.match_scale, invalid)
+
+        if self.match_mode == 'pyramid':
+            coarse, self.stereo = self.get_pyramid_matchers()
+            regions = self.pyramid_regions(zones, left_image.shape[0], self.stereo.getBlockSize())
+            return compute_pyramid_disparity(coarse, self.stereo, left_image, right_image, self.pyramid_scale,
+                                             regions, self.refine_cache.settings, self.pyramid_margin)
+
+        self.stereo = self.get_stereo_matcher()
+        if self.range_predictor is not None and zones:
+            return self.compute_predicted_disparity(left_image, right_image, zones)
+        return self.match(left_image, right_image, zones)
+
+    def match(self, left_image, right_image, zones=None):
+        if self.match_mode == 'bands' and zones:
+            bands = zone_bands(zones, left_image.shape[0], self.stereo.getBlockSize(), self.band_margin)
+            return compute_band_disparity(self.stereo, left_image, right_image, bands)
+        return self.stereo.compute(left_image, right_image)
+
+    # Match with the window predicted from the previous frames, then let the predictor learn from the result
+    # (a failed window costs one extra full-range match on that frame, never a wrong height).
+    # Pixels below the narrowed window get the full-range invalid value so zone_statistics masks them as before.
+    def compute_predicted_disparity(self, left_image, right_image, zones):
+        settings = self.matcher_cache.settings
+        low, count = self.range_predictor.window(settings['minDisparity'], settings['numDisparities'])
+        apply_settings(self.stereo, {'minDisparity': low, 'numDisparities': count})
+        disparity = self.match(left_image, right_image, zones)
+        if low != settings['minDisparity']:
+            disparity[disparity < low * 16] = (settings['minDisparity'] - 1) * 16
+        if not self.range_predictor.update(disparity, zones):
+            # The scene left the window: match this frame again over the full range
+            apply_settings(self.stereo, {'minDisparity': settings['minDisparity'],
+                                         'numDisparities': settings['numDisparities']})
+            disparity = self.match(left_image, right_image, zones)
+            self.range_predictor.update(disparity, zones)
+        return disparity
+
+    # Frames matched with a reduced vs the full disparity range
+    def range_stats(self):
+        return self.range_predictor.stats() if self.range_predictor is not None else None
+
+    # Distance statistics for every zone (see zone_statistics); 'height' is the one published as the heights
+    def measure_zones(self, disparity_raw, zones, min_distance=0, max_distance=5000, disparity_threshold=1.0):
+        stats = zone_statistics(disparity_raw, self.get_zone_set(zones, disparity_raw.shape), self.Q, min_distance,
+                                max_distance, disparity_threshold, self.zone_percentiles)
+        stats['height'] = stats[self.zone_statistic]
+        return stats
+
+    # One height per zone
+    def measure_heights(self, disparity_raw, zones, min_distance=0, max_distance=5000, disparity_threshold=1.0):
+        stats = self.measure_zones(disparity_raw, zones, min_distance, max_distance, disparity_threshold)
+        return stats['height'].tolist()
+
+    # Compute only the numeric outputs; the visualization is built later by render_depth_map() if requested
+    def compute_heights(self, left_image, right_image, zones=(40, 200, 400), min_distance=0, max_distance=5000,
+                        disparity_threshold=1.0):
+        zones = list(zones)
+        disparity_raw = self.compute_disparity(left_image, right_image, zones)
+        return self.compute_heights_from_disparity(disparity_raw, zones, min_distance, max_distance,
+                                                   disparity_threshold)
+
+    # Heights for an already computed disparity map, kept for render_depth_map()
+    def compute_heights_from_disparity(self, disparity_raw, zones=(40, 200, 400), min_distance=0, max_distance=5000,
+                                       disparity_threshold=1.0):
+        zones = list(zones)
+        stats = self.measure_zones(disparity_raw, zones, min_distance, max_distance, disparity_threshold)
+        avg_heights = stats['height'].tolist()
+
+        # Keep what the visualization needs; nothing is drawn until a display or snapshot asks for it
+        self.last_disparity = disparity_raw
+        self.last_zones = zones
+        self.last_heights = avg_heights
+        self.last_zone_stats = stats
+        self.last_render = None
+        return avg_heights
+
+    # Build the colored depth map with zone and parameter overlays for the last computed frame
+    def render_depth_map(self):
+        if self.last_disparity is None:
+            return None
+        if self.last_render is not None:
+            return self.last_render
 
         # Normalize disparity for visualization
+        disparity = self.last_disparity.astype(np.float32) / 16.0
         min_disp, max_disp = cv.minMaxLoc(disparity)[:2]
-        disparity_visual = cv.convertScaleAbs(disparity, alpha=255 / (max_disp - min_disp),
-                                              beta=-min_disp * (255 / (max_disp - min_disp)))
-
-        # Create an object mask based on the disparity threshold
-        object_mask = (disparity > disparity_threshold) & (disparity_visual > 0)
-
-        # Reproject disparity to 3D points
-        points_3D = cv.reprojectImageTo3D(disparity, self.Q, ddepth=cv.CV_32F)
-
-        # Compute distances from the camera to each point
-        distances = np.linalg.norm(points_3D, axis=2)
-
-        # Create zones for height computation
-        zones = [zone1, zone2, zone3]
-
-        # Set default average heights to NaN to indicate no data
-        avg_heights = [np.nan, np.nan, np.nan]
-
-        # For each zone (specified row), compute the average distance
-        for idx, zone_row in enumerate(zones):
-            # Ensure the zone_row is within the image bounds
-            if zone_row < 0 or zone_row >= distances.shape[0]:
-                continue  # Skip if the row index is out of bounds
-
-            # Get the object_mask and distances at the specified row
-            object_mask_row = object_mask[zone_row, :]
-            distances_row = distances[zone_row, :]
-
-            # Filter distances where object_mask is True and distances are within min and max
-            valid_distances = distances_row[object_mask_row]
-            valid_distances = valid_distances[
-                np.isfinite(valid_distances) & (valid_distances >= min_distance) & (valid_distances <= max_distance)]
-
-            # Compute average distance
-            avg_distance = valid_distances.mean() if valid_distances.size > 0 else np.nan
-
-            # Assign the average distance to the corresponding variable
-            avg_heights[idx] = avg_distance
-
-        # Assign the average distance to the corresponding variable
-        avg_height1, avg_height2, avg_height3 = avg_heights
+        scale = 255 / (max_disp - min_disp) if max_disp > min_disp else 0
+        disparity_visual = cv.convertScaleAbs(disparity, alpha=scale, beta=-min_disp * scale)
 
         # Apply color map for visualization
         depth_visual_colormap = cv.applyColorMap(disparity_visual, cv.COLORMAP_JET)
 
         # Overlay zones and average heights on the depth map
-        depth_visual_colormap = self.overlay_zones(depth_visual_colormap, zones, avg_heights)
+        depth_visual_colormap = self.overlay_zones(depth_visual_colormap, self.last_zones, self.last_heights)
 
         # Overlay parameters on the depth map
-        output_image = self.overlay_parameters(depth_visual_colormap)
-        
-        # Return the output image, average heights for each zone
-        return output_image, avg_height1, avg_height2, avg_height3
+        self.last_render = self.overlay_parameters(depth_visual_colormap)
+        return self.last_render
+
+    # Compute disparity map and extract height information; zones (any zone definitions) replace zone1..3
+    def compute_disparity_map(self, left_image, right_image, zone1=40, zone2=200, zone3=400, min_distance=0,
+                              max_distance=5000, disparity_threshold=1.0, zones=None):
+        zones = zones if zones is not None else (zone1, zone2, zone3)
+        heights = self.compute_heights(left_image, right_image, zones, min_distance, max_distance,
+                                       disparity_threshold)
 
+        # Return the output image, height for each zone
+        return (self.render_depth_map(), *heights)
 
-    # Overlay zones and average heights on the depth map
+    # Overlay zones and their heights on the depth map
     def overlay_zones(self, image, zones, avg_heights):
-        for idx, zone_row in enumerate(zones):
-            if 0 <= zone_row < image.shape[0]:
-                # Draw the zone line
-                cv.line(image, (0, zone_row), (image.shape[1], zone_row), (0, 255, 0), 1)
-                # Prepare the text to display
-                avg_distance = avg_heights[idx]
-                if np.isnan(avg_distance):
-                    text = "No data"
-                else:
-                    text = f"Height: {avg_distance:.2f}"
-                # Determine text position (a bit above the line)
-                text_position = (10, max(0, zone_row - 10))
-                # Put the text on the image
-                cv.putText(image, text, text_position, cv.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        zone_set = self.get_zone_set(zones, image.shape)
+        for idx, anchor in enumerate(zone_set.anchors()):
+            if anchor is None:
+                continue
+            # Draw the zone outline
+            draw_zone(image, zone_set.zones[idx], (0, 255, 0), outline=True)
+            # Prepare the text to display
+            avg_distance = avg_heights[idx]
+            if np.isnan(avg_distance):
+                text = "No data"
+            else:
+                text = f"Height: {avg_distance:.2f}"
+            # Determine text position (a bit above the zone)
+            text_position = (max(10, anchor[0]), max(10, anchor[1] - 10))
+            # Put the text on the image
+            cv.putText(image, text, text_position, cv.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
         return image
 
     # Overlay parameters on the depth map
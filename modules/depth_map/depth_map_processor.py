@@ -2,21 +2,24 @@
 import cv2 as cv
 import numpy as np
 from modules.edge_detection.stereo_vision import StereoVision
+from .parameter_store import ParameterStore
 
 
 class DepthMapProcessor:
-    def __init__(self, window_name='Depth Map'):
+    def __init__(self, window_name='Depth Map', headless=False):
         self.window_name = window_name
+        self.headless = headless
         self.stereo_vision = StereoVision()
-        self.params = {'numDisparities': 32,  # Multiplier for 16
+        self.params = ParameterStore({'numDisparities': 32,  # Multiplier for 16
             'blockSize': 5,  # Adjusted in code to be odd and at least 5
             'minDisparity': 0, 'textureThreshold': 0, 'uniquenessRatio': 15, 'speckleWindowSize': 0, 'speckleRange': 2,
-            'disp12MaxDiff': 1}
+            'disp12MaxDiff': 1})
         self.max_values = {'numDisparities': 10,  # Max multiplier (numDisparities = multiplier * 16)
             'blockSize': 25,  # Max value for (blockSize - 5) // 2
             'uniquenessRatio': 100, 'speckleWindowSize': 200, 'speckleRange': 10, 'disp12MaxDiff': 25,
             'textureThreshold': 100}
-        self.create_trackbars()
+        if not self.headless:
+            self.create_trackbars()
 
     def create_trackbars(self):
         cv.namedWindow(self.window_name)
@@ -0,0 +1,111 @@
+# disparity_predictor.py
+import collections
+import math
+
+import numpy as np
+
+
+# Predicts the disparity window for the next frame from the disparities seen around the zones in recent
+# frames. The cable moves slowly, so the next frame only needs the recent range (plus its trend and a
+# safety margin) instead of the full minDisparity..minDisparity + numDisparities search.
+# Any sign that the window is too narrow (fewer valid pixels than in full-range frames, or many matches
+# piling up at a window edge) switches straight back to the full range.
+class DisparityRangePredictor:
+    def __init__(self, margin=8, history=8, min_history=3, coverage=0.98, min_valid_ratio=0.8,
+                 edge_fraction=0.02):
+        self.margin = margin  # Disparity pixels added on each side of the predicted range
+        self.history = collections.deque(maxlen=history)  # Recent (low, high) disparity ranges
+        self.min_history = min_history  # Full-range frames needed before the window is narrowed
+        self.coverage = coverage  # Fraction of valid zone pixels each frame's range has to hold
+        self.min_valid_ratio = min_valid_ratio  # Fall back below this share of the full-range valid ratio
+        self.edge_fraction = edge_fraction  # Fall back when this share of matches sits on a window edge
+        self.full_range = None
+        self.current = None
+        self.baseline_ratio = None  # Valid-pixel ratio of recent full-range frames
+        self.valid_ratio = math.nan
+        self.reduced_frames = 0
+        self.full_frames = 0
+        self.fallbacks = 0
+
+    # (minDisparity, numDisparities) to match the next frame with
+    def window(self, min_disparity, num_disparities):
+        if self.full_range != (min_disparity, num_disparities):
+            # Parameters changed (e.g. trackbars): start over on the new full range
+            self.reset()
+            self.full_range = (min_disparity, num_disparities)
+
+        if len(self.history) < self.min_history:
+            self.current = self.full_range
+            return self.current
+
+        lows, highs = [low for low, _ in self.history], [high for _, high in self.history]
+        # Envelope of the recent ranges, extended by the latest frame-to-frame movement of its bounds
+        trend_low = min(0.0, lows[-1] - lows[-2]) if len(lows) > 1 else 0.0
+        trend_high = max(0.0, highs[-1] - highs[-2]) if len(highs) > 1 else 0.0
+        low = max(min_disparity, int(math.floor(min(lows) + trend_low)) - self.margin)
+        high = min(min_disparity + num_disparities, int(math.ceil(max(highs) + trend_high)) + self.margin)
+        count = max(16, int(math.ceil((high - low) / 16)) * 16)
+        low = max(min_disparity, min(low, min_disparity + num_disparities - count))
+        self.current = (low, count)
+        return self.current
+
+    def is_reduced(self):
+        return self.current is not None and self.current != self.full_range
+
+    # Learn from the disparity computed with the current window; zone rows are the ones measured.
+    # Columns left of the full search range are ignored so full and reduced frames are compared alike.
+    # Returns False when the reduced window failed and the frame should be matched again at full range.
+    def update(self, disparity_raw, zones):
+        min_disparity, num_disparities = self.full_range
+        low, count = self.current
+        rows = [row for row in zones if 0 <= row < disparity_raw.shape[0]]
+        if not rows:
+            return True
+        values = disparity_raw[rows, min_disparity + num_disparities:]
+        valid = values[values >= low * 16]
+        self.valid_ratio = valid.size / values.size if values.size else 0.0
+
+        reduced = self.is_reduced()
+        if reduced:
+            self.reduced_frames += 1
+        else:
+            self.full_frames += 1
+            self.baseline_ratio = self.valid_ratio if self.baseline_ratio is None else \
+                0.8 * self.baseline_ratio + 0.2 * self.valid_ratio
+
+        if reduced and self.window_failed(valid, low, count):
+            self.fallbacks += 1
+            self.history.clear()
+            self.current = self.full_range
+            return False
+        if valid.size == 0:
+            return True
+
+        # Range holding `coverage` of the valid pixels, in disparity pixels
+        tail = (1.0 - self.coverage) / 2.0 * 100.0
+        frame_low, frame_high = np.percentile(valid, (tail, 100.0 - tail)) / 16.0
+        self.history.append((float(frame_low), float(frame_high)))
+        return True
+
+    def window_failed(self, valid, low, count):
+        if self.baseline_ratio is not None and self.valid_ratio < self.min_valid_ratio * self.baseline_ratio:
+            return True
+        if valid.size == 0:
+            return True
+        # Matches on a window edge that is not also a bound of the full range mean the scene moved out
+        min_disparity, num_disparities = self.full_range
+        at_edge = 0
+        if low > min_disparity:
+            at_edge += np.count_nonzero(valid < (low + 1) * 16)
+        if low + count < min_disparity + num_disparities:
+            at_edge += np.count_nonzero(valid > (low + count - 2) * 16)
+        return at_edge > self.edge_fraction * valid.size
+
+    def reset(self):
+        self.history.clear()
+        self.current = None
+        self.baseline_ratio = None
+
+    def stats(self):
+        return {'reduced_frames': self.reduced_frames, 'full_frames': self.full_frames, 'fallbacks': self.fallbacks,
+                'window': self.current, 'valid_ratio': self.valid_ratio, 'baseline_valid_ratio': self.baseline_ratio}
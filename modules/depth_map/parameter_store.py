@@ -0,0 +1,48 @@
+# parameter_store.py
+
+
+# Parameter dictionary that bumps a version number on every change, so consumers
+# can tell cheaply whether anything they derived from it is out of date
+class ParameterStore(dict):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+    def __setitem__(self, key, value):
+        if key in self and self[key] == value:
+            return  # Trackbars fire callbacks with unchanged values; do not invalidate anything
+        super().__setitem__(key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.version += 1
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key in self:
+            self.version += 1
+        return super().pop(key, *default)
+
+    def clear(self):
+        super().clear()
+        self.version += 1
+
+
+# Apply a parameter snapshot to params, but only the keys whose value differs from the previously applied
+# snapshot, so local edits (trackbars) of other keys survive. Returns the snapshot to pass as previous next time.
+def apply_snapshot(params, snapshot, previous=None):
+    if snapshot is previous:
+        return snapshot
+    for key, value in snapshot.items():
+        if previous is None or previous.get(key) != value:
+            params[key] = value
+    return snapshot
@@ -0,0 +1,185 @@
+# point_cloud_export.py
+import collections
+import os
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+
+# Chunk layout: binary little-endian PLY with one vertex list for all frames of the chunk; each vertex carries
+# the number of the frame it belongs to. The vertex count in the header is fixed-width and rewritten after every
+# frame, so a chunk cut off mid-write still opens with every complete frame. The index sidecar (<chunk>.idx)
+# gives each frame's wall-clock time, first vertex and vertex count.
+VERTEX_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('intensity', 'u1'), ('frame', '<u4')])
+INDEX_DTYPE = np.dtype([('frame', '<u4'), ('timestamp', '<f8'), ('first_vertex', '<u8'), ('vertices', '<u4')])
+COUNT_WIDTH = 10
+
+
+def ply_header(vertices):
+    return (f"ply\nformat binary_little_endian 1.0\ncomment cable-lay point cloud, Q.xml units\n"
+            f"element vertex {vertices:0{COUNT_WIDTH}d}\nproperty float x\nproperty float y\nproperty float z\n"
+            f"property uchar intensity\nproperty uint frame\nend_header\n").encode('ascii')
+
+
+# Points (and their intensities) of the valid pixels of a raw (x16 fixed-point) disparity map, reprojected
+# like compute_disparity_map() used to; points that are not finite or outside the distance range are dropped
+def reproject_valid(disparity_raw, Q, image=None, min_distance=0, max_distance=5000, disparity_threshold=1.0):
+    mask = disparity_raw > disparity_threshold * 16
+    points = cv.reprojectImageTo3D(disparity_raw.astype(np.float32) / 16.0, Q)[mask]
+    with np.errstate(invalid='ignore', over='ignore'):
+        distances = np.sqrt(np.einsum('ij,ij->i', points, points))
+    keep = np.isfinite(distances) & (distances >= min_distance) & (distances <= max_distance)
+    intensities = image[mask][keep] if image is not None else np.zeros(np.count_nonzero(keep), np.uint8)
+    return points[keep], intensities
+
+
+# One point per occupied voxel: the centroid of its points and their mean intensity. The voxel coordinates are
+# packed into one int64 key so a single 1-D sort groups them.
+def voxel_downsample(points, voxel_size, intensities=None):
+    if points.shape[0] == 0 or not voxel_size:
+        return points, intensities
+    keys = np.zeros(points.shape[0], dtype=np.int64)
+    for i in range(3):  # Per column: reductions along axis 0 of an (N, 3) array are several times slower
+        cells = np.floor(points[:, i] / voxel_size).astype(np.int64)
+        low = cells.min()
+        keys = keys * (cells.max() - low + 1) + (cells - low)
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    downsampled = np.empty((counts.shape[0], 3), dtype=np.float32)
+    for i in range(3):
+        downsampled[:, i] = np.bincount(inverse, points[:, i], counts.shape[0]) / counts
+    if intensities is not None:
+        intensities = np.round(np.bincount(inverse, intensities, counts.shape[0]) / counts).astype(np.uint8)
+    return downsampled, intensities
+
+
+# Exports voxel-downsampled point clouds of the measured frames for offline cable-profile analysis.
+# record() runs on the measurement thread: it keeps at most max_fps frames per second, copies the disparity
+# (and image) and hands them to a background writer; a full queue drops the frame instead of waiting.
+# Reprojection, downsampling and writing all happen on the writer thread, into chunks of chunk_frames frames.
+class PointCloudExporter:
+    def __init__(self, directory, Q, voxel_size=0.01, max_fps=1.0, queue_size=2, chunk_frames=100,
+                 min_distance=0, max_distance=5000, disparity_threshold=1.0):
+        self.directory = directory
+        self.Q = np.asarray(Q, dtype=np.float64)
+        self.voxel_size = voxel_size
+        self.interval = 1.0 / max_fps if max_fps else 0.0
+        self.chunk_frames = chunk_frames
+        self.min_distance = min_distance
+        self.max_distance = max_distance
+        self.disparity_threshold = disparity_threshold
+        os.makedirs(directory, exist_ok=True)
+
+        self.prefix = os.path.join(directory, time.strftime('cloud_%Y%m%d_%H%M%S'))
+        self.chunk = 0
+        self.chunk_file = None
+        self.index_file = None
+        self.chunk_vertices = 0
+        self.last_record = None
+        self.frames = 0
+        self.points = 0
+        self.input_points = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self.write_time = 0.0
+
+        self.queue = collections.deque()
+        self.queue_size = queue_size
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+    def start(self):
+        self.thread = threading.Thread(target=self.update, name="point-cloud-export", daemon=True)
+        self.thread.start()
+        return self
+
+    # Queue a frame for export if one is due; returns whether it was queued
+    def record(self, disparity_raw, image=None, timestamp=None):
+        now = time.monotonic()
+        if self.last_record is not None and now - self.last_record < self.interval:
+            return False
+        self.last_record = now
+        with self.condition:
+            if len(self.queue) >= self.queue_size:
+                self.dropped += 1
+                return False
+            image = image.copy() if image is not None and image.ndim == 2 else None
+            self.queue.append((disparity_raw.copy(), image, time.time() if timestamp is None else timestamp))
+            self.condition.notify()
+        return True
+
+    # Reproject, downsample and append one frame to the current chunk
+    def write(self, disparity_raw, image, timestamp):
+        start = time.perf_counter()
+        points, intensities = reproject_valid(disparity_raw, self.Q, image, self.min_distance, self.max_distance,
+                                              self.disparity_threshold)
+        self.input_points += points.shape[0]
+        points, intensities = voxel_downsample(points, self.voxel_size, intensities)
+
+        if self.chunk_file is None or self.frames % self.chunk_frames == 0:
+            self.open_chunk()
+        vertices = np.empty(points.shape[0], VERTEX_DTYPE)
+        vertices['x'], vertices['y'], vertices['z'] = points[:, 0], points[:, 1], points[:, 2]
+        vertices['intensity'] = intensities
+        vertices['frame'] = self.frames
+        self.chunk_file.write(vertices.tobytes())
+
+        # Make the header count the complete frames written so far, then index the frame
+        self.chunk_file.seek(0)
+        self.chunk_file.write(ply_header(self.chunk_vertices + vertices.shape[0]))
+        self.chunk_file.seek(0, os.SEEK_END)
+        self.chunk_file.flush()
+        entry = np.zeros(1, INDEX_DTYPE)
+        entry['frame'], entry['timestamp'] = self.frames, timestamp
+        entry['first_vertex'], entry['vertices'] = self.chunk_vertices, vertices.shape[0]
+        self.index_file.write(entry.tobytes())
+        self.index_file.flush()
+        self.chunk_vertices += vertices.shape[0]
+
+        self.frames += 1
+        self.points += vertices.shape[0]
+        self.bytes_written += vertices.nbytes + entry.nbytes
+        self.write_time += time.perf_counter() - start
+
+    def open_chunk(self):
+        self.close_chunk()
+        path = f"{self.prefix}_{self.chunk:05d}.ply"
+        self.chunk_file = open(path, 'wb')
+        self.chunk_file.write(ply_header(0))
+        self.index_file = open(path + '.idx', 'wb')
+        self.chunk_vertices = 0
+        self.chunk += 1
+
+    def close_chunk(self):
+        if self.chunk_file is not None:
+            self.chunk_file.close()
+            self.index_file.close()
+            self.chunk_file = self.index_file = None
+
+    def update(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.stopped:
+                    self.condition.wait()
+                if not self.queue:
+                    break
+                frame = self.queue.popleft()
+            self.write(*frame)
+
+    def stats(self):
+        return {'frames': self.frames, 'dropped': self.dropped, 'queued': len(self.queue), 'chunks': self.chunk,
+                'points_per_frame': self.points / self.frames if self.frames else 0.0,
+                'reduction': self.input_points / self.points if self.points else 0.0,
+                'megabytes': self.bytes_written / 2 ** 20,
+                'write_ms': self.write_time * 1000.0 / self.frames if self.frames else 0.0}
+
+    # Write the queued frames and close the chunk
+    def close(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        self.close_chunk()
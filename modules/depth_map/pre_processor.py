@@ -2,19 +2,25 @@
 import cv2 as cv
 import json
 import os
-from modules.preprocessing import reduce_noise, normalize_lighting, enhance_contrast
+from modules.preprocessing import PreprocessingEngine
+from .parameter_store import apply_snapshot
 
 
 class Preprocessor:
-    def __init__(self, window_name='Preprocessing', config_file='./modules/depth_map/preprocess_params.json'):
+    def __init__(self, window_name='Preprocessing', config_file='./modules/depth_map/preprocess_params.json',
+                 ring_size=2, headless=False):
         self.window_name = window_name
+        self.headless = headless
+        self.engine = PreprocessingEngine(ring_size=ring_size)
         self.config_file = config_file
         self.params = {'NOISE_THRESHOLD': 0, 'GAMMA': 1.0, 'CONTRAST_LEVEL': 1.0, }
         self.scaling_factors = {'NOISE_THRESHOLD': 100, 'GAMMA': 100, 'CONTRAST_LEVEL': 100, }
         self.max_values = {'NOISE_THRESHOLD': 1000,  # Adjust as needed
             'GAMMA': 500, 'CONTRAST_LEVEL': 500, }
+        self.applied_params = None
         self.load_parameters()
-        self.create_trackbars()
+        if not self.headless:
+            self.create_trackbars()
 
     def load_parameters(self):
         if os.path.exists(self.config_file):
@@ -35,8 +41,22 @@ class Preprocessor:
     def on_trackbar_change(self, param, val):
         self.params[param] = val / self.scaling_factors[param]
 
+    # Raise ValueError for filter values beyond the trackbar ranges (max_values / scaling_factors): a large
+    # NOISE_THRESHOLD blows up the blur kernel and stalls the frame loop, a gamma of 0 turns every frame white
+    def check_params(self, params):
+        for key, value in params.items():
+            if key in self.max_values and not 0 <= value <= self.max_values[key] / self.scaling_factors[key]:
+                raise ValueError(f"{key} outside 0..{self.max_values[key] / self.scaling_factors[key]:g}")
+        if params.get('GAMMA', 1.0) <= 0:
+            raise ValueError("GAMMA must be positive")
+
+    # Take over the changed values of a parameter snapshot (LiveParameters) before processing a frame
+    def apply_params(self, params):
+        self.applied_params = apply_snapshot(self.params, params, self.applied_params)
+
     def preprocess(self, image):
-        image = reduce_noise(image, self.params['NOISE_THRESHOLD'])
-        image = normalize_lighting(image, self.params['GAMMA'])
-        image = enhance_contrast(image, self.params['CONTRAST_LEVEL'])
-        return image
+        return self.engine.process(image, self.params)
+
+    # Preprocess both stereo images in one call so they share the cached engine state
+    def preprocess_pair(self, left_image, right_image):
+        return self.engine.process_pair(left_image, right_image, self.params)
@@ -0,0 +1,119 @@
+# pyramid_matching.py
+import math
+
+import cv2 as cv
+import numpy as np
+
+from modules.edge_detection.matcher_cache import apply_settings
+
+
+# Matcher settings for the coarse level: the full disparity range and the block scaled down by the
+# pyramid factor. P1/P2 follow the block area so the smoothness penalties keep their relative weight.
+# The coarse level only bounds the search, so it uses a relaxed uniqueness ratio to keep enough pixels.
+# min_block_size is the smallest block the matcher backend accepts; matchers without P1/P2 (StereoBM) skip them.
+def coarse_settings(settings, scale, uniqueness_ratio=10, min_block_size=3):
+    coarse = dict(settings)
+    coarse['uniquenessRatio'] = min(settings['uniquenessRatio'], uniqueness_ratio)
+    block_size = max(min_block_size, (settings['blockSize'] // scale) | 1)
+    area = (block_size / settings['blockSize']) ** 2
+    coarse['blockSize'] = block_size
+    coarse['minDisparity'] = settings['minDisparity'] // scale
+    coarse['numDisparities'] = max(16, math.ceil(settings['numDisparities'] / scale / 16) * 16)
+    if 'P1' in settings:
+        coarse['P1'] = int(settings['P1'] * area)
+        coarse['P2'] = max(coarse['P1'] + 1, int(settings['P2'] * area))
+    coarse['speckleWindowSize'] = settings['speckleWindowSize'] // (scale * scale)
+    return coarse
+
+
+# Halve the image log2(scale) times with Gaussian smoothing
+def downsample(image, scale):
+    while scale > 1:
+        image = cv.pyrDown(image)
+        scale //= 2
+    return image
+
+
+# Disparity matched at 1/scale resolution and scaled back up to the full resolution (nearest neighbour) in
+# full-resolution disparity units. Pixels the matcher rejects get the given invalid value.
+def compute_scaled_disparity(matcher, left_image, right_image, scale, invalid):
+    disparity = matcher.compute(downsample(left_image, scale), downsample(right_image, scale))
+    rejected = disparity <= (matcher.getMinDisparity() - 1) * 16
+    disparity *= scale
+    disparity[rejected] = invalid
+    height, width = left_image.shape[:2]
+    return cv.resize(disparity, (width, height), interpolation=cv.INTER_NEAREST)
+
+
+# Full-frame refinement regions: strips of strip_rows output rows, each matched with overlap extra rows
+# above and below so SGBM path aggregation settles. Returns (y0, y1, match_y0, match_y1) tuples.
+def strip_regions(height, strip_rows=96, overlap=16):
+    regions = []
+    for y0 in range(0, height, strip_rows):
+        y1 = min(height, y0 + strip_rows)
+        regions.append((y0, y1, max(0, y0 - overlap), min(height, y1 + overlap)))
+    return regions
+
+
+# Full-resolution (minDisparity, numDisparities) window for one region from the coarse disparities of its
+# rows: the narrowest disparity interval holding `coverage` of the valid coarse pixels, widened by margin.
+# Returns None (use the full range) when too few coarse pixels are valid to trust.
+def region_window(coarse_raw, coarse_invalid, rows, scale, min_disparity, num_disparities, margin=8,
+                  coverage=0.9, min_valid=0.02):
+    y0, y1 = rows[0] // scale, max(rows[0] // scale + 1, -(-rows[1] // scale))
+    values = coarse_raw[y0:y1]
+    values = np.sort(values[values > coarse_invalid])
+    if values.size < max(16, min_valid * (y1 - y0) * coarse_raw.shape[1]):
+        return None
+
+    count = max(1, int(math.ceil(coverage * values.size)))
+    widths = values[count - 1:] - values[:values.size - count + 1]
+    start = int(np.argmin(widths))
+    low = values[start] * scale / 16.0
+    high = values[start + count - 1] * scale / 16.0
+    low = max(min_disparity, int(math.floor(low)) - margin)
+    high = min(min_disparity + num_disparities, int(math.ceil(high)) + margin)
+    return low, max(16, int(math.ceil((high - low) / 16)) * 16)
+
+
+# Merge neighbouring regions whose windows are close enough that one matcher call over the union is cheaper
+# (rows x disparities) than two calls with their own windows
+def merge_regions(plans):
+    merged = []
+    for region, (low, count) in plans:
+        if merged:
+            (y0, _, match_y0, match_y1), (previous_low, previous_count) = merged[-1]
+            union_low = min(low, previous_low)
+            union_count = int(math.ceil((max(low + count, previous_low + previous_count) - union_low) / 16)) * 16
+            separate = previous_count * (match_y1 - match_y0) + count * (region[3] - region[2])
+            if union_count * (region[3] - match_y0) <= separate:
+                merged[-1] = ((y0, region[1], match_y0, region[3]), (union_low, union_count))
+                continue
+        merged.append((region, (low, count)))
+    return merged
+
+
+# Coarse-to-fine disparity: SGBM over the full range at 1/scale resolution, then SGBM at full resolution on
+# each region with the disparity window narrowed to what the coarse level saw there. Output rows outside
+# the regions, and pixels the narrowed matcher rejects, get the full matcher's invalid value.
+def compute_pyramid_disparity(coarse_matcher, refine_matcher, left_image, right_image, scale, regions, settings,
+                              margin=8, coverage=0.9):
+    min_disparity, num_disparities = settings['minDisparity'], settings['numDisparities']
+    invalid = (min_disparity - 1) * 16
+    coarse_raw = coarse_matcher.compute(downsample(left_image, scale), downsample(right_image, scale))
+    coarse_invalid = (coarse_matcher.getMinDisparity() - 1) * 16
+
+    plans = []
+    for region in regions:
+        window = region_window(coarse_raw, coarse_invalid, region[2:], scale, min_disparity, num_disparities,
+                               margin, coverage)
+        plans.append((region, window if window is not None else (min_disparity, num_disparities)))
+
+    disparity = np.full(left_image.shape[:2], invalid, dtype=np.int16)
+    for (y0, y1, match_y0, match_y1), (low, count) in merge_regions(plans):
+        apply_settings(refine_matcher, {'minDisparity': low, 'numDisparities': count})
+        region = refine_matcher.compute(left_image[match_y0:match_y1], right_image[match_y0:match_y1])
+        region = region[y0 - match_y0:y1 - match_y0]
+        region[region < low * 16] = invalid
+        disparity[y0:y1] = region
+    return disparity
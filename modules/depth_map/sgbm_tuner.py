@@ -0,0 +1,345 @@
+# sgbm_tuner.py
+# Offline SGBM parameter search. Candidates are scored in a process pool on recorded or synthetic stereo pairs,
+# on frame time and on zone height error/coverage; the Pareto front is printed and the most accurate candidate
+# within a frame-time budget is written as a depth_map_params.json. Run from the repository root:
+#   python -m modules.depth_map.sgbm_tuner --synthetic 6 --budget-ms 33 --output tuned_params.json
+#   python -m modules.depth_map.sgbm_tuner --recording run.stereo --calibration calibration.bin \
+#       --preprocess modules/depth_map/preprocess_params.json --budget-ms 33 --output tuned_params.json
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2 as cv
+import numpy as np
+
+from modules.edge_detection.calibration_bundle import is_bundle, load_bundle
+from modules.edge_detection.matcher_backends import SGBM_MODES, sgbm_settings
+from modules.preprocessing import PreprocessingEngine
+from .band_matching import zone_bands, compute_band_disparity
+from .synthetic import synthetic_stereo_pair
+from .zones import ZoneSet, parse_zones, zone_statistics
+
+# Values tried per parameter, in the trackbar encoding of depth_map_params.json except P1 (multiples of the
+# block area, OpenCV suggests 8 * channels * blockSize^2) and P2 (multiples of P1)
+SEARCH_SPACE = {'numDisparities': (4, 6, 8, 10), 'blockSize': (0, 1, 2, 3, 5), 'P1': (2, 4, 8, 16), 'P2': (2, 4, 8),
+                'uniquenessRatio': (0, 5, 10, 15, 30), 'speckleWindowSize': (0, 50, 100, 200),
+                'speckleRange': (1, 2, 8, 32), 'mode': tuple(SGBM_MODES.values())}
+MAX_P1, MAX_P2 = 1000, 4000  # Trackbar limits of DepthMapProcessorSGBM, so the result loads into the trackbars
+
+# Objectives of the Pareto front: (result key, 1 to minimize / -1 to maximize)
+OBJECTIVES = (('frame_ms', 1), ('height_error', 1), ('coverage', -1))
+
+DEFAULT_PARAMS = './modules/depth_map/depth_map_params.json'
+
+
+# Candidate parameters from one index per SEARCH_SPACE entry, on top of the base parameters
+def decode(genes, base):
+    params = dict(base)
+    values = {name: SEARCH_SPACE[name][index] for name, index in zip(SEARCH_SPACE, genes)}
+    for name, value in values.items():
+        if name not in ('P1', 'P2'):
+            params[name] = value
+    block_size = params['blockSize'] * 2 + 5
+    params['P1'] = min(MAX_P1, values['P1'] * block_size * block_size)
+    params['P2'] = min(MAX_P2, max(params['P1'] + 1, values['P2'] * params['P1']))
+    return params
+
+
+def random_genes(rng):
+    return tuple(rng.randrange(len(values)) for values in SEARCH_SPACE.values())
+
+
+# Candidates one step away from genes in a single parameter
+def neighbours(genes):
+    for position, values in enumerate(SEARCH_SPACE.values()):
+        for step in (-1, 1):
+            index = genes[position] + step
+            if 0 <= index < len(values):
+                yield genes[:position] + (index,) + genes[position + 1:]
+
+
+# Q matrix from a calibration bundle or Q.xml
+def load_q(path):
+    if is_bundle(path):
+        return np.array(load_bundle(path, verify=False).get('Q'))
+    cv_file = cv.FileStorage(path, cv.FILE_STORAGE_READ)
+    Q = cv_file.getNode('Q').mat()
+    cv_file.release()
+    if Q is None:
+        raise ValueError(f"No Q matrix in {path}")
+    return Q
+
+
+# Q of an ideal rectified pair (focal length and baseline in pixels/metres) for synthetic data without Q.xml
+def synthetic_q(shape, focal=500.0, baseline=0.06):
+    height, width = shape
+    return np.float64([[1, 0, 0, -width / 2.0], [0, 1, 0, -height / 2.0], [0, 0, 0, focal], [0, 0, 1 / baseline, 0]])
+
+
+# Per-zone statistic of the distance for a float disparity map without invalid pixels (the ground truth)
+def reference_heights(disparity, zone_set, Q, statistic='median'):
+    q = np.asarray(Q, dtype=np.float64)
+    count = len(zone_set)
+    labels = zone_set.pixel_labels
+    counts = np.bincount(labels, minlength=count)
+    radius = np.bincount(labels, zone_set.pixel_radii(q), count) / np.maximum(counts, 1)
+    with np.errstate(divide='ignore'):
+        distance = radius[labels] / np.abs(q[3, 2] * disparity.ravel()[zone_set.pixels] + q[3, 3])
+    reduce = np.median if statistic == 'median' else np.mean
+    return np.array([reduce(distance[labels == i]) if counts[i] else np.nan for i in range(count)])
+
+
+# Relative height error per zone with a reference height; a zone without a height counts as 100 %
+def zone_errors(heights, reference):
+    known = np.isfinite(reference)
+    error = np.abs(heights[known] - reference[known]) / np.abs(reference[known])
+    return np.where(np.isfinite(error), error, 1.0).tolist()
+
+
+# Synthetic pairs with known disparity: the background and cable distances vary between pairs
+def synthetic_dataset(count, shape=(480, 640), seed=0):
+    rng = np.random.default_rng(seed)
+    pairs = []
+    for i in range(count):
+        background = float(rng.uniform(12.0, 32.0))
+        left, right, disparity = synthetic_stereo_pair(shape, background, background + float(rng.uniform(8.0, 40.0)),
+                                                       seed=seed + i)
+        pairs.append((left, right, disparity))
+    return pairs
+
+
+# Evenly spaced pairs of a stereo recording, rectified if a calibration is given. No ground truth.
+def recorded_dataset(path, count, calibration=None):
+    from modules.camera import StereoRecording
+    from modules.edge_detection.calibration import Rectification
+    recording = StereoRecording(path)
+    rectification = Rectification(calibration, fixed_point=True) if calibration else None
+    pairs = []
+    for i in np.linspace(0, len(recording) - 1, min(count, len(recording))).astype(int):
+        left, right = recording[int(i)][:2]
+        if rectification is not None:
+            left, right = rectification.undistortrectify(left, right)  # Same call as main.py
+        pairs.append((np.ascontiguousarray(left), np.ascontiguousarray(right), None))
+    return pairs
+
+
+# Run the production preprocessing (preprocess_params.json values) on every pair
+def preprocess_dataset(pairs, params):
+    engine = PreprocessingEngine()
+    processed = []
+    for left, right, disparity in pairs:
+        left, right = engine.process_pair(left, right, params)
+        processed.append((left.copy(), right.copy(), disparity))
+    return processed
+
+
+# Reference heights per pair: from the ground truth, or else from a slow full-DP (HH) match with the base
+# parameters, so recorded data is scored against the best the matcher can do rather than against itself
+def reference_data(pairs, zones, Q, base, statistic='median', disparity_threshold=1.0):
+    reference = []
+    matcher = None
+    for left, right, disparity in pairs:
+        zone_set = ZoneSet(zones, left.shape)
+        if disparity is not None:
+            heights = reference_heights(disparity, zone_set, Q, statistic)
+        else:
+            if matcher is None:
+                settings = sgbm_settings(dict(base, mode=SGBM_MODES['hh']))
+                matcher = cv.StereoSGBM_create(**settings)
+            heights = zone_statistics(matcher.compute(left, right), zone_set, Q,
+                                      disparity_threshold=disparity_threshold)[statistic]
+        reference.append((left, right, heights))
+    return reference
+
+
+# Worker process state, set once per process by init_worker
+_worker = {}
+
+
+def init_worker(dataset, Q, zones, statistic, match_mode, band_margin, threads, repeat):
+    cv.setNumThreads(threads)
+    zone_sets = [ZoneSet(zones, left.shape) for left, _, _ in dataset]
+    _worker.update(dataset=dataset, Q=Q, zone_sets=zone_sets, statistic=statistic, match_mode=match_mode,
+                   band_margin=band_margin, repeat=repeat)
+
+
+# Score one candidate on every pair: frame time (fastest of `repeat` runs, averaged over the pairs), relative
+# height error against the reference (a zone without a height counts as 100 %) and zone coverage
+def evaluate(params):
+    matcher = cv.StereoSGBM_create(**sgbm_settings(params))
+    frame_ms, errors, coverage = [], [], []
+    try:
+        for (left, right, reference), zone_set in zip(_worker['dataset'], _worker['zone_sets']):
+            if _worker['match_mode'] == 'bands':
+                bands = zone_bands(zone_set.rows, left.shape[0], matcher.getBlockSize(), _worker['band_margin'])
+                match = lambda: compute_band_disparity(matcher, left, right, bands)
+            else:
+                match = lambda: matcher.compute(left, right)
+            match()  # Warm-up: buffers are allocated on the first frame
+            fastest = float('inf')
+            for _ in range(_worker['repeat']):
+                start = time.perf_counter()
+                disparity = match()
+                fastest = min(fastest, time.perf_counter() - start)
+            frame_ms.append(fastest * 1000.0)
+
+            stats = zone_statistics(disparity, zone_set, _worker['Q'])
+            errors.extend(zone_errors(stats[_worker['statistic']], reference))
+            coverage.extend(stats['coverage'].tolist())
+    except cv.error as e:
+        return {'params': params, 'frame_ms': float('inf'), 'height_error': float('inf'), 'coverage': 0.0,
+                'error': str(e).strip()}
+    return {'params': params, 'frame_ms': float(np.mean(frame_ms)),
+            'height_error': float(np.mean(errors)) if errors else float('inf'),
+            'coverage': float(np.mean(coverage)) if coverage else 0.0}
+
+
+def dominates(a, b):
+    better = False
+    for key, sign in OBJECTIVES:
+        if sign * a[key] > sign * b[key]:
+            return False
+        better = better or sign * a[key] < sign * b[key]
+    return better
+
+
+# Results no other result is at least as good as in every objective and better in one, fastest first
+def pareto_front(results):
+    results = [r for r in results if np.isfinite(r['frame_ms']) and np.isfinite(r['height_error'])]
+    front = [r for r in results if not any(dominates(other, r) for other in results)]
+    return sorted(front, key=lambda r: r['frame_ms'])
+
+
+# Most accurate result within the frame-time budget (then best coverage, then fastest); None if none fits
+def select(results, budget_ms):
+    feasible = [r for r in pareto_front(results) if r['frame_ms'] <= budget_ms]
+    if not feasible:
+        return None
+    return min(feasible, key=lambda r: (r['height_error'], -r['coverage'], r['frame_ms']))
+
+
+# Search: a random sample of the space plus the base parameters, then `rounds` rounds of the untried
+# single-parameter neighbours of the current front. Returns every result.
+def tune(dataset, Q, zones, base, candidates=48, rounds=2, workers=None, threads=1, repeat=3, seed=0,
+         statistic='median', match_mode='full', band_margin=16):
+    rng = random.Random(seed)
+    initargs = (dataset, Q, zones, statistic, match_mode, band_margin, threads, repeat)
+    tried = set()
+    batch = [(None, dict(base))]
+    while len(batch) < candidates + 1 and len(tried) < 10 * candidates:
+        genes = random_genes(rng)
+        if genes not in tried:
+            tried.add(genes)
+            batch.append((genes, decode(genes, base)))
+
+    results = []
+    pool = None
+    if workers == 1:
+        init_worker(*initargs)
+        run = lambda params: list(map(evaluate, params))
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs)
+        run = lambda params: list(pool.map(evaluate, params))
+    try:
+        for round_ in range(rounds + 1):
+            start = time.perf_counter()
+            for (genes, _), result in zip(batch, run([params for _, params in batch])):
+                result['genes'] = genes
+                results.append(result)
+            front = pareto_front(results)
+            print(f"Round {round_}: {len(batch)} candidates in {time.perf_counter() - start:.1f} s, "
+                  f"front {len(front)}")
+
+            neighbourhood = [genes for r in front if r['genes'] is not None for genes in neighbours(r['genes'])
+                             if genes not in tried]
+            neighbourhood = list(dict.fromkeys(neighbourhood))
+            rng.shuffle(neighbourhood)
+            tried.update(neighbourhood[:candidates])
+            batch = [(genes, decode(genes, base)) for genes in neighbourhood[:candidates]]
+            if not batch:
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return results
+
+
+def describe(result):
+    params = result['params']
+    mode = {value: name for name, value in SGBM_MODES.items()}.get(params.get('mode'), params.get('mode'))
+    return (f"{result['frame_ms']:8.1f} ms  error {result['height_error'] * 100:6.2f} %  coverage "
+            f"{result['coverage'] * 100:5.1f} %  numDisparities {params['numDisparities'] * 16:3d}  blockSize "
+            f"{params['blockSize'] * 2 + 5:2d}  P1 {params['P1']:4d}  P2 {params['P2']:4d}  uniqueness "
+            f"{params['uniquenessRatio']:2d}  speckle {params['speckleWindowSize']:3d}/{params['speckleRange']:2d}  "
+            f"{mode}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search SGBM parameters for frame time and height accuracy.")
+    parser.add_argument('--synthetic', type=int, default=6, help="Synthetic pairs with ground truth")
+    parser.add_argument('--recording', help="Stereo recording to tune on instead (main.py --record)")
+    parser.add_argument('--frames', type=int, default=8, help="Pairs taken from the recording")
+    parser.add_argument('--calibration', help="Rectify the recorded pairs with this bundle or stereoMap.xml")
+    parser.add_argument('--q', help="Q matrix (calibration bundle or Q.xml; default: --calibration, Q.xml)")
+    parser.add_argument('--preprocess', help="Preprocess the pairs with this preprocess_params.json")
+    parser.add_argument('--zones', default='[40, 200, 400]', help="Zone definitions as JSON (see config.ZONES)")
+    parser.add_argument('--statistic', default='median', choices=('median', 'mean'))
+    parser.add_argument('--match-mode', default='full', choices=('full', 'bands'))
+    parser.add_argument('--params', default=DEFAULT_PARAMS, help="Base parameters; also the baseline candidate")
+    parser.add_argument('--candidates', type=int, default=48, help="Candidates per round")
+    parser.add_argument('--rounds', type=int, default=2, help="Neighbourhood rounds after the random sample")
+    parser.add_argument('--workers', type=int, help="Evaluation processes (default: CPU count)")
+    parser.add_argument('--threads', type=int, default=1,
+                        help="OpenCV threads per worker; frame times are for this many threads")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per pair (the fastest counts)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--budget-ms', type=float, default=1000.0 / 30, help="Frame-time budget for the result")
+    parser.add_argument('--output', default='tuned_params.json', help="Where the selected parameters are written")
+    parser.add_argument('--front', help="Also write every Pareto-front candidate with its scores to this JSON")
+    args = parser.parse_args(argv)
+
+    base = {}
+    if os.path.exists(args.params):
+        with open(args.params, 'r') as file:
+            base.update(json.load(file))
+    base.setdefault('mode', SGBM_MODES['3way'])
+    zones = parse_zones(args.zones)
+
+    if args.recording:
+        pairs = recorded_dataset(args.recording, args.frames, args.calibration)
+    else:
+        pairs = synthetic_dataset(args.synthetic)
+    q_file = args.q or args.calibration or 'Q.xml'
+    Q = load_q(q_file) if os.path.exists(q_file) else synthetic_q(pairs[0][0].shape)
+    if args.preprocess:
+        with open(args.preprocess, 'r') as file:
+            pairs = preprocess_dataset(pairs, json.load(file))
+    dataset = reference_data(pairs, zones, Q, base, args.statistic)
+
+    results = tune(dataset, Q, zones, base, args.candidates, args.rounds, args.workers, args.threads, args.repeat,
+                   args.seed, args.statistic, args.match_mode)
+    front = pareto_front(results)
+    print(f"Pareto front ({len(front)} of {len(results)} candidates):")
+    for result in front:
+        print("  " + describe(result))
+    print("Baseline: " + describe(results[0]))
+    if args.front:
+        with open(args.front, 'w') as file:
+            json.dump([{key: value for key, value in r.items() if key != 'genes'} for r in front], file, indent=4)
+
+    best = select(results, args.budget_ms)
+    if best is None:
+        print(f"No candidate meets the {args.budget_ms:.1f} ms budget.")
+        return 1
+    with open(args.output, 'w') as file:
+        json.dump(best['params'], file, indent=4)
+    print(f"Within {args.budget_ms:.1f} ms: " + describe(best))
+    print(f"Saved to {args.output} (load it as DepthMapProcessorSGBM's config_file or copy it to {DEFAULT_PARAMS})")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,28 @@
+# synthetic.py
+import cv2 as cv
+import numpy as np
+
+
+# Textured stereo pair with known disparity: a background plane plus a horizontal "cable" band
+# closer to the camera. Returns (left, right, ground-truth disparity in pixels for the left image).
+def synthetic_stereo_pair(shape=(480, 640), background_disparity=24.0, cable_disparity=48.0, cable_rows=None,
+                          seed=0):
+    height, width = shape
+    rng = np.random.default_rng(seed)
+
+    # Band-limited noise gives SGBM texture to lock onto at every scale
+    texture = rng.integers(0, 256, (height, width + 128), dtype=np.uint8)
+    texture = cv.GaussianBlur(texture, (5, 5), 1.2)
+    texture = cv.addWeighted(texture, 0.7, rng.integers(0, 256, texture.shape, dtype=np.uint8), 0.3, 0)
+
+    disparity = np.full(shape, background_disparity, dtype=np.float32)
+    if cable_rows is None:
+        cable_rows = (height * 2 // 5, height * 3 // 5)
+    disparity[cable_rows[0]:cable_rows[1]] = cable_disparity
+
+    # Left pixel x sees the same scene point as right pixel x - d, so right(x) = left(x + d)
+    left = np.ascontiguousarray(texture[:, :width])
+    map_x = np.tile(np.arange(width, dtype=np.float32), (height, 1)) + disparity
+    map_y = np.repeat(np.arange(height, dtype=np.float32)[:, None], width, axis=1)
+    right = cv.remap(texture, map_x, map_y, cv.INTER_LINEAR, borderMode=cv.BORDER_REFLECT)
+    return left, right, disparity
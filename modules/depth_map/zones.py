@@ -0,0 +1,192 @@
+# zones.py
+import json
+
+import cv2 as cv
+import numpy as np
+
+# A zone is given as an image row (int, the old zone1..3), an (x, y, w, h) rectangle, or a dict:
+# {'row': y}, {'rect': [x, y, w, h]}, {'polyline': [[x, y], ...], 'thickness': 5, 'closed': False}
+# or {'polygon': [[x, y], ...]} (filled). Returns the dict form.
+def normalize_zone(zone):
+    if isinstance(zone, (int, np.integer)):
+        return {'row': int(zone)}
+    if isinstance(zone, (list, tuple)) and len(zone) == 4 and all(isinstance(v, (int, np.integer)) for v in zone):
+        return {'rect': [int(v) for v in zone]}
+    if isinstance(zone, dict):
+        if 'row' in zone:
+            return {'row': int(zone['row'])}
+        if 'rect' in zone and len(zone['rect']) == 4:
+            return {'rect': [int(v) for v in zone['rect']]}
+        if 'polyline' in zone and len(zone['polyline']) >= 2:
+            return {'polyline': [[int(x), int(y)] for x, y in zone['polyline']],
+                    'thickness': max(1, int(zone.get('thickness', 1))), 'closed': bool(zone.get('closed', False))}
+        if 'polygon' in zone and len(zone['polygon']) >= 3:
+            return {'polygon': [[int(x), int(y)] for x, y in zone['polygon']]}
+    raise ValueError(f"Invalid zone definition: {zone!r}")
+
+
+# Zones from their JSON text (as written to the OPC UA Zones object); raises ValueError if invalid
+def parse_zones(text):
+    try:
+        zones = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid zone definitions: {e}")
+    if not isinstance(zones, list):
+        raise ValueError("Zone definitions must be a JSON list")
+    return [normalize_zone(zone) for zone in zones]
+
+
+def format_zones(zones):
+    return json.dumps([normalize_zone(zone) for zone in zones])
+
+
+# Draw one zone with the given value: filled for the label image, outlined for overlays
+def draw_zone(image, zone, value, outline=False):
+    zone = normalize_zone(zone)
+    if 'row' in zone:
+        zone = {'rect': [0, zone['row'], image.shape[1], 1]}
+    if 'rect' in zone:
+        x, y, w, h = zone['rect']
+        if w > 0 and h > 0:
+            cv.rectangle(image, (x, y), (x + w - 1, y + h - 1), value, 1 if outline else cv.FILLED)
+    elif 'polyline' in zone:
+        points = np.array(zone['polyline'], dtype=np.int32)
+        cv.polylines(image, [points], zone['closed'], value, zone['thickness'])
+    else:
+        points = np.array(zone['polygon'], dtype=np.int32)
+        if outline:
+            cv.polylines(image, [points], True, value, 1)
+        else:
+            cv.fillPoly(image, [points], value)
+    return image
+
+
+# Zones rasterized once into a label image (0 = no zone, i + 1 = zone i; where zones overlap the later one
+# wins). Only the labelled pixels are gathered per frame, so all zones are reduced in a single pass.
+class ZoneSet:
+    def __init__(self, zones, shape):
+        self.zones = [normalize_zone(zone) for zone in zones]
+        self.shape = tuple(shape[:2])
+        self.labels = np.zeros(self.shape, dtype=np.int32)
+        for index, zone in enumerate(self.zones):
+            draw_zone(self.labels, zone, index + 1)
+
+        flat = self.labels.ravel()
+        self.pixels = np.flatnonzero(flat)
+        self.pixel_labels = flat[self.pixels] - 1
+        self.pixel_counts = np.bincount(self.pixel_labels, minlength=len(self.zones))
+        self.rows = np.unique(self.pixels // self.shape[1]).tolist()  # Image rows the matcher has to cover
+        self.radii = None
+        self.radii_q = None
+
+    def __len__(self):
+        return len(self.zones)
+
+    # Distance-independent part of each labelled pixel's reprojection, |(x - cx, y - cy, f)| for a Q from
+    # stereoRectify, whose 3D point is that vector divided by w(d). Computed once per Q.
+    def pixel_radii(self, Q):
+        q = np.asarray(Q, dtype=np.float64)
+        if self.radii is None or not np.array_equal(self.radii_q, q):
+            rows, cols = np.divmod(self.pixels, self.shape[1])
+            self.radii = np.sqrt(sum((q[i, 0] * cols + q[i, 1] * rows + q[i, 3]) ** 2 for i in range(3)))
+            self.radii_q = q
+        return self.radii
+
+    # Top-left corner of each zone, for labels in overlays
+    def anchors(self):
+        rows, cols = np.divmod(self.pixels, self.shape[1])
+        anchors = []
+        for index in range(len(self.zones)):
+            mask = self.pixel_labels == index
+            anchors.append((int(cols[mask].min()), int(rows[mask].min())) if mask.any() else None)
+        return anchors
+
+
+# Cache key for a zone list, so a ZoneSet is only rebuilt when the definitions change
+def zone_key(zones):
+    return format_zones(zones)
+
+
+# Robust distance statistics for every zone of a raw (x16 fixed-point) disparity map in one vectorized pass.
+# Valid pixels (above the threshold and not black in the visualization) are counted into one histogram per zone over the quantized
+# disparity with a single bincount, and their pixel radii summed into the same (zone, bin) cells with a second;
+# percentiles come from the cumulative histograms. Nothing is reprojected per pixel: the distance of a cell is
+# the mean radius of its pixels over w(d) of the bin, so the mean is exact at the 1/16 pixel quantization.
+# Returns arrays with one value per zone: median, mean, p<percentile>, valid (pixels) and coverage.
+def zone_statistics(disparity_raw, zone_set, Q, min_distance=0, max_distance=5000, disparity_threshold=1.0,
+                    percentiles=(10, 90), step=1):
+    count = len(zone_set)
+    names = ('median', 'mean') + tuple(f"p{p:g}" for p in percentiles)
+    stats = {name: np.full(count, np.nan) for name in names}
+    stats['valid'] = np.zeros(count, dtype=np.int64)
+    stats['coverage'] = np.zeros(count)
+
+    # The object mask also excludes pixels black in the visualization (within 1/510 of the range of the minimum)
+    min_raw, max_raw = cv.minMaxLoc(disparity_raw)[:2]
+    if max_raw == min_raw or zone_set.pixels.size == 0:
+        return stats
+    values = disparity_raw.ravel()[zone_set.pixels].astype(np.int64)
+    valid = (values > disparity_threshold * 16.0) & (values > min_raw + (max_raw - min_raw) / 510.0)
+    values, labels = values[valid], zone_set.pixel_labels[valid]
+    if values.size == 0:
+        return stats
+
+    q = np.asarray(Q, dtype=np.float64)
+    low = int(values.min())
+    bins = (int(values.max()) - low) // step + 1
+    cells = labels * bins + (values - low) // step
+    histogram = np.bincount(cells, minlength=count * bins).reshape(count, bins)
+    radius = np.bincount(cells, zone_set.pixel_radii(q)[valid], count * bins).reshape(count, bins)
+
+    # Distance of every (zone, bin) cell: mean radius of its pixels / |w(d)| at the bin centre
+    disparity = (low + np.arange(bins) * step + (step - 1) / 2.0) / 16.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distance = radius / histogram / np.abs(q[3, 2] * disparity + q[3, 3])
+    histogram[~(np.isfinite(distance) & (distance >= min_distance) & (distance <= max_distance))] = 0
+
+    # Cells of one disparity bin differ in distance between zones; order each zone's cells by distance
+    order = np.argsort(np.where(histogram > 0, distance, np.inf), axis=1)
+    histogram = np.take_along_axis(histogram, order, axis=1)
+    distance = np.take_along_axis(distance, order, axis=1)
+
+    totals = histogram.sum(axis=1)
+    stats['valid'] = totals
+    stats['coverage'] = totals / np.maximum(zone_set.pixel_counts, 1)
+    measured = totals > 0
+    if not measured.any():
+        return stats
+    cumulative = np.cumsum(histogram[measured], axis=1)
+    distance = distance[measured]
+    rows = np.arange(distance.shape[0])
+    counts = histogram[measured]
+    stats['mean'][measured] = (np.where(counts > 0, distance, 0.0) * counts).sum(axis=1) / totals[measured]
+    for name, p in (('median', 50),) + tuple(zip(names[2:], percentiles)):
+        # Nearest-rank percentile: the first bin holding the ceil(p% * n)-th pixel
+        rank = np.maximum(1, np.ceil(totals[measured] * p / 100.0))
+        index = (cumulative < rank[:, None]).sum(axis=1)
+        stats[name][measured] = distance[rows, np.minimum(index, distance.shape[1] - 1)]
+    return stats
+
+
+# Zone definitions in effect, e.g. written by a client through the OPC UA Zones object. The list is replaced
+# as a whole, never changed in place, so a frame that took zones once sees one consistent set.
+class ZoneDefinitions:
+    def __init__(self, zones):
+        self.zones = [normalize_zone(zone) for zone in zones]
+        self.version = 0
+
+    # Replace all zones from a list or its JSON text; raises ValueError and keeps the old zones if invalid
+    def set(self, zones):
+        zones = parse_zones(zones) if isinstance(zones, str) else [normalize_zone(zone) for zone in zones]
+        if zones != self.zones:
+            self.zones = zones
+            self.version += 1
+        return self.zones
+
+    # zone1..3 shortcut: make zone index a row zone (negative rows are ignored)
+    def set_row(self, index, row):
+        if row < 0 or index >= len(self.zones) or self.zones[index] == {'row': row}:
+            return self.zones
+        zones = list(self.zones)
+        zones[index] = {'row': int(row)}
+        return self.set(zones)
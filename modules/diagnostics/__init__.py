@@ -0,0 +1,5 @@
+# diagnostics/__init__.py
+
+from .instrumentation import Instrumentation, NullInstrumentation, LatencyHistogram, create_instrumentation
+
+__all__ = ['Instrumentation', 'NullInstrumentation', 'LatencyHistogram', 'create_instrumentation']
@@ -0,0 +1,138 @@
+# instrumentation.py
+import bisect
+import math
+import time
+
+# Bucket upper bounds in ms, log-spaced from 0.05 ms to ~2.6 s (about 12% resolution per bucket)
+BUCKET_BOUNDS_MS = tuple(0.05 * 1.12 ** i for i in range(97))
+
+STAGES = ('capture', 'rectify', 'preprocess', 'disparity', 'reprojection', 'publish')
+EVENTS = ('parameter_apply',)  # Latencies recorded per event instead of per frame
+COUNTERS = ('frames', 'dropped_frames', 'nan_heights')
+
+
+# Fixed-memory latency histogram: recording is one bisect and a few integer updates, never an allocation
+class LatencyHistogram:
+    def __init__(self, bounds=BUCKET_BOUNDS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Last bucket collects everything above the largest bound
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms):
+        self.counts[bisect.bisect_left(self.bounds, elapsed_ms)] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+
+    # Upper bound of the bucket holding the given percentile, capped at the largest recorded value
+    def percentile(self, percent):
+        counts = list(self.counts)  # Copy so a concurrent record() cannot shift the walk
+        total = sum(counts)
+        if total == 0:
+            return math.nan
+        rank = math.ceil(total * percent / 100.0)
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bounds[index], self.max_ms) if index < len(self.bounds) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self):
+        return {'count': self.count, 'mean_ms': self.total_ms / self.count if self.count else math.nan,
+                'p50_ms': self.percentile(50), 'p95_ms': self.percentile(95), 'p99_ms': self.percentile(99),
+                'max_ms': self.max_ms}
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+
+# Stage timings and counters for the hot path. Each stage is recorded from one thread only, so the
+# histograms need no lock; snapshots are read from the OPC UA thread and may be one frame behind.
+class Instrumentation:
+    enabled = True
+
+    def __init__(self, stages=STAGES + EVENTS, counters=COUNTERS):
+        self.histograms = {stage: LatencyHistogram() for stage in stages}
+        self.counters = dict.fromkeys(counters, 0)
+        self.gauges = {}
+
+    # Start time for a stage; pass it to record() when the stage is done
+    def now(self):
+        return time.perf_counter()
+
+    def record(self, stage, start):
+        self.histograms[stage].record((time.perf_counter() - start) * 1000.0)
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    # Counter whose value is read from fn() at snapshot time instead of being counted on the hot path
+    def gauge(self, name, fn):
+        self.gauges[name] = fn
+
+    # Wrap a stage function so every call is timed
+    def wrap(self, stage, fn):
+        histogram = self.histograms[stage]
+
+        def timed(*args):
+            start = time.perf_counter()
+            result = fn(*args)
+            histogram.record((time.perf_counter() - start) * 1000.0)
+            return result
+        return timed
+
+    # Count NaN entries in a sequence of heights
+    def count_nan(self, heights):
+        self.counters['nan_heights'] += sum(1 for height in heights if height != height)
+
+    def snapshot(self):
+        counters = dict(self.counters)
+        for name, fn in self.gauges.items():
+            counters[name] = fn()
+        return {'stages': {stage: histogram.snapshot() for stage, histogram in self.histograms.items()},
+                'counters': counters}
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+        self.counters = dict.fromkeys(self.counters, 0)
+
+
+# Drop-in replacement when instrumentation is switched off: every hook is a no-op
+class NullInstrumentation:
+    enabled = False
+
+    def now(self):
+        return 0.0
+
+    def record(self, stage, start):
+        pass
+
+    def count(self, name, amount=1):
+        pass
+
+    def gauge(self, name, fn):
+        pass
+
+    def wrap(self, stage, fn):
+        return fn
+
+    def count_nan(self, heights):
+        pass
+
+    def snapshot(self):
+        return {'stages': {}, 'counters': {}}
+
+    def reset(self):
+        pass
+
+
+def create_instrumentation(enabled=True):
+    return Instrumentation() if enabled else NullInstrumentation()
@@ -1,5 +1,7 @@
 # edge_detection/__init__.py
 
 from .stereo_vision import StereoVision
+from .matcher_cache import MatcherCache
+from .matcher_backends import MATCHER_BACKENDS, register_backend, get_backend
 
-__all__ = ['StereoVision']
+__all__ = ['StereoVision', 'MatcherCache', 'MATCHER_BACKENDS', 'register_backend', 'get_backend']
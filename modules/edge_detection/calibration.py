@@ -1,23 +1,135 @@
 import cv2
+import numpy as np
+
+from .calibration_bundle import is_bundle, load_bundle
+
+# Interpolation modes selectable per deployment, from cheapest to most expensive
+INTERPOLATIONS = {'nearest': cv2.INTER_NEAREST, 'linear': cv2.INTER_LINEAR, 'cubic': cv2.INTER_CUBIC,
+                  'lanczos': cv2.INTER_LANCZOS4}
 
 
 class Rectification:
-    def __init__(self):
-        # Camera parameters to undistort and rectify images
-        cv_file = cv2.FileStorage()
-        cv_file.open('stereoMap.xml', cv2.FileStorage_READ)
+    def __init__(self, map_file='stereoMap.xml', interpolation='lanczos', fixed_point=False, roi=None, maps=None):
+        if maps is not None:
+            # Maps given directly as (left_x, left_y, right_x, right_y), e.g. for offline benchmarks
+            self.stereoMapL_x, self.stereoMapL_y, self.stereoMapR_x, self.stereoMapR_y = maps
+            self.Q = None
+        elif is_bundle(map_file):
+            # Binary calibration bundle: the maps are memory-mapped, nothing is parsed
+            bundle = load_bundle(map_file)
+            self.stereoMapL_x, self.stereoMapL_y, self.stereoMapR_x, self.stereoMapR_y = (
+                bundle.get(name) for name in ('stereoMapL_x', 'stereoMapL_y', 'stereoMapR_x', 'stereoMapR_y'))
+            self.Q = bundle.get('Q')
+        else:
+            # Camera parameters to undistort and rectify images
+            cv_file = cv2.FileStorage()
+            cv_file.open(map_file, cv2.FileStorage_READ)
+
+            self.stereoMapL_x = cv_file.getNode('stereoMapL_x').mat()
+            self.stereoMapL_y = cv_file.getNode('stereoMapL_y').mat()
+            self.stereoMapR_x = cv_file.getNode('stereoMapR_x').mat()
+            self.stereoMapR_y = cv_file.getNode('stereoMapR_y').mat()
+            self.Q = cv_file.getNode('Q').mat()
+            cv_file.release()
+
+        self.fixed_point = False
+        self.interpolation = INTERPOLATIONS[interpolation]
+        if fixed_point:
+            self.convert_to_fixed_point()
+        self.roi = None
+        self.set_roi(roi)
+
+    # Convert the maps once to OpenCV's fixed-point form (CV_16SC2 + CV_16UC1 interpolation table)
+    def convert_to_fixed_point(self):
+        self.stereoMapL_x, self.stereoMapL_y = to_fixed_point(self.stereoMapL_x, self.stereoMapL_y)
+        self.stereoMapR_x, self.stereoMapR_y = to_fixed_point(self.stereoMapR_x, self.stereoMapR_y)
+        self.fixed_point = True
 
-        self.stereoMapL_x = cv_file.getNode('stereoMapL_x').mat()
-        self.stereoMapL_y = cv_file.getNode('stereoMapL_y').mat()
-        self.stereoMapR_x = cv_file.getNode('stereoMapR_x').mat()
-        self.stereoMapR_y = cv_file.getNode('stereoMapR_y').mat()
-        self.Q = cv_file.getNode('Q').mat()
+        # Nearest-neighbour ignores the interpolation table and would truncate; keep rounded maps for it
+        self.nearestMapL = to_nearest(self.stereoMapL_x, self.stereoMapL_y)
+        self.nearestMapR = to_nearest(self.stereoMapR_x, self.stereoMapR_y)
+        self.set_roi(getattr(self, 'roi', None))
+
+    def set_interpolation(self, interpolation):
+        interpolation = INTERPOLATIONS[interpolation]
+        if interpolation == self.interpolation:
+            return
+        self.interpolation = interpolation
+        self.set_roi(self.roi)
+
+    # Maps to use for the current interpolation: (left_x, left_y, right_x, right_y)
+    def active_maps(self):
+        if self.fixed_point and self.interpolation == cv2.INTER_NEAREST:
+            return self.nearestMapL, None, self.nearestMapR, None
+        return self.stereoMapL_x, self.stereoMapL_y, self.stereoMapR_x, self.stereoMapR_y
+
+    # Restrict rectification to a row band (y0, y1) or a rectangle (x, y, w, h); None rectifies the full frame
+    def set_roi(self, roi):
+        if roi is None:
+            self.roi = None
+            self.maps = self.active_maps()
+            return
+        height, width = self.stereoMapL_x.shape[:2]
+        if len(roi) == 2:
+            roi = (0, roi[0], width, roi[1] - roi[0])
+        x, y, w, h = roi
+        x, y = max(0, x), max(0, y)
+        w, h = min(w, width - x), min(h, height - y)
+        self.roi = (x, y, w, h)
+
+        # Slice the maps once so every frame only remaps the requested pixels
+        self.maps = tuple(crop_map(map_, self.roi) for map_ in self.active_maps())
 
     def undistortrectify(self, frame_r, frame_l):
-        undistorted_l = cv2.remap(frame_l, self.stereoMapL_x, self.stereoMapL_y, cv2.INTER_LANCZOS4,
-                                  cv2.BORDER_CONSTANT, 0)
-        undistorted_r = cv2.remap(frame_r, self.stereoMapR_x, self.stereoMapR_y, cv2.INTER_LANCZOS4,
-                                  cv2.BORDER_CONSTANT, 0)
+        if self.roi is not None:
+            return self.undistortrectify_roi(frame_r, frame_l)
+
+        map_l_x, map_l_y, map_r_x, map_r_y = self.maps
+        undistorted_l = cv2.remap(frame_l, map_l_x, map_l_y, self.interpolation, cv2.BORDER_CONSTANT, 0)
+        undistorted_r = cv2.remap(frame_r, map_r_x, map_r_y, self.interpolation, cv2.BORDER_CONSTANT, 0)
 
         # Return undistorted and rectified images
         return undistorted_r, undistorted_l
+
+    # Rectify only the ROI; pixels outside it are left black so row/column coordinates stay valid
+    def undistortrectify_roi(self, frame_r, frame_l):
+        x, y, w, h = self.roi
+        map_l_x, map_l_y, map_r_x, map_r_y = self.maps
+        undistorted_l = np.zeros(self.stereoMapL_x.shape[:2] + frame_l.shape[2:], dtype=frame_l.dtype)
+        undistorted_r = np.zeros(self.stereoMapR_x.shape[:2] + frame_r.shape[2:], dtype=frame_r.dtype)
+        undistorted_l[y:y + h, x:x + w] = cv2.remap(frame_l, map_l_x, map_l_y, self.interpolation,
+                                                    borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+        undistorted_r[y:y + h, x:x + w] = cv2.remap(frame_r, map_r_x, map_r_y, self.interpolation,
+                                                    borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+        return undistorted_r, undistorted_l
+
+
+# Float maps that leave an image of the given (height, width) unchanged
+def identity_maps(shape):
+    height, width = shape
+    map_x = np.tile(np.arange(width, dtype=np.float32), (height, 1))
+    map_y = np.repeat(np.arange(height, dtype=np.float32)[:, None], width, axis=1)
+    return map_x, map_y, map_x.copy(), map_y.copy()
+
+
+# Convert a map pair to fixed point; maps that already are CV_16SC2 are returned unchanged
+def to_fixed_point(map_x, map_y):
+    if map_x.dtype == np.int16 and map_x.ndim == 3:
+        return map_x, map_y
+    if map_y is not None and map_y.size == 0:
+        map_y = None
+    return cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+
+# Rounded integer map (CV_16SC2 without interpolation table) for nearest-neighbour remapping
+def to_nearest(map_x, map_y):
+    float_x, float_y = cv2.convertMaps(map_x, map_y, cv2.CV_32FC1)
+    return cv2.convertMaps(float_x, float_y, cv2.CV_16SC2, nninterpolation=True)[0]
+
+
+def crop_map(map_, roi):
+    # The second map is empty for two-channel float maps and nearest-neighbour maps
+    if map_ is None or map_.size == 0:
+        return map_
+    x, y, w, h = roi
+    return np.ascontiguousarray(map_[y:y + h, x:x + w])
@@ -0,0 +1,141 @@
+# calibration_bundle.py
+# One binary file holding everything calibration produces: the four rectification maps, Q, the camera
+# intrinsics/extrinsics, the resolution and a CRC32 of the array data. Arrays are stored raw and aligned,
+# so loading is a memory map plus a small JSON header instead of parsing XML text.
+# Convert existing XML files once from the repository root:
+#   python -m modules.edge_detection.calibration_bundle --map-file stereoMap.xml --q-file Q.xml
+import argparse
+import json
+import os
+import time
+import zlib
+
+import cv2 as cv
+import numpy as np
+
+MAGIC = b'CLAYCAL\0'
+VERSION = 1
+HEADER_SIZE = 4096  # Magic, version, JSON length, JSON; array data starts on the next page
+ALIGNMENT = 64
+BUNDLE_FILE = 'calibration.bin'
+
+MAP_NAMES = ('stereoMapL_x', 'stereoMapL_y', 'stereoMapR_x', 'stereoMapR_y')
+
+
+class CalibrationBundle:
+    def __init__(self, path, arrays, metadata):
+        self.path = path
+        self.arrays = arrays  # Read-only views into the memory-mapped file
+        self.metadata = metadata
+        self.resolution = tuple(metadata['resolution'])  # (width, height)
+
+    def get(self, name, default=None):
+        return self.arrays.get(name, default)
+
+    def maps(self):
+        return tuple(self.arrays[name] for name in MAP_NAMES)
+
+
+# True if the file starts with the bundle magic (XML files and missing files are not bundles)
+def is_bundle(path):
+    if not path or not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def save_bundle(path, arrays, metadata=None):
+    entries, offset = {}, HEADER_SIZE
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        entries[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+
+    checksum = 0
+    for name, array in arrays.items():
+        checksum = zlib.crc32(np.ascontiguousarray(array).data, checksum)
+    header = dict(metadata or {})
+    header.update({'version': VERSION, 'arrays': entries, 'crc32': checksum})
+    header.setdefault('created', time.strftime('%Y-%m-%dT%H:%M:%S'))
+    header_bytes = json.dumps(header).encode()
+    if len(MAGIC) + 8 + len(header_bytes) > HEADER_SIZE:
+        raise ValueError("Calibration bundle header does not fit in the header page")
+
+    with open(path, 'wb') as file:
+        file.write(MAGIC + np.uint32(VERSION).tobytes() + np.uint32(len(header_bytes)).tobytes() + header_bytes)
+        for name, array in arrays.items():
+            file.seek(entries[name]['offset'])
+            file.write(np.ascontiguousarray(array).data)
+
+
+# Memory-map a bundle. verify checks the CRC32, which touches every page once.
+def load_bundle(path, verify=True):
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f"{path} is not a calibration bundle")
+    version, length = np.frombuffer(data[len(MAGIC):len(MAGIC) + 8], dtype=np.uint32)
+    if version > VERSION:
+        raise ValueError(f"Calibration bundle version {version} is newer than supported ({VERSION})")
+    header = json.loads(bytes(data[len(MAGIC) + 8:len(MAGIC) + 8 + length]))
+
+    arrays, checksum = {}, 0
+    for name, entry in header['arrays'].items():
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        array = np.frombuffer(data, dtype=dtype, count=count, offset=entry['offset']).reshape(entry['shape'])
+        if verify:
+            checksum = zlib.crc32(array.data, checksum)
+        arrays[name] = array
+    if verify and checksum != header['crc32']:
+        raise ValueError(f"Calibration bundle {path} is corrupt (checksum mismatch)")
+    return CalibrationBundle(path, arrays, header)
+
+
+# Bundle from the results of stereo_calibrator.calibrate()
+def bundle_from_calibration(result):
+    arrays = dict(zip(MAP_NAMES, result['stereoMapL'] + result['stereoMapR']))
+    arrays['Q'] = result['Q']
+    for name in ('cameraMatrixL', 'distL', 'cameraMatrixR', 'distR', 'R', 'T', 'R1', 'R2', 'P1', 'P2'):
+        if name in result:
+            arrays[name] = result[name]
+    metadata = {'resolution': list(result['frame_size']), 'rms': result.get('rms'), 'source': 'stereo_calibrator'}
+    return arrays, metadata
+
+
+# One-time import of the stereoMap.xml / Q.xml pair
+def convert_xml(map_file='stereoMap.xml', q_file='Q.xml', output=BUNDLE_FILE):
+    cv_file = cv.FileStorage(map_file, cv.FILE_STORAGE_READ)
+    arrays = {name: cv_file.getNode(name).mat() for name in MAP_NAMES}
+    cv_file.release()
+    cv_file = cv.FileStorage(q_file, cv.FILE_STORAGE_READ)
+    arrays['Q'] = cv_file.getNode('Q').mat()
+    cv_file.release()
+
+    missing = [name for name, array in arrays.items() if array is None]
+    if missing:
+        raise ValueError(f"Missing calibration data: {missing}")
+    # Empty second maps (float two-channel maps) are not stored; Rectification treats None the same
+    arrays = {name: array for name, array in arrays.items() if array.size}
+    height, width = arrays['stereoMapL_x'].shape[:2]
+    save_bundle(output, arrays, {'resolution': [width, height], 'source': f"{map_file}, {q_file}"})
+    return output
+
+
+# Where to load calibration from: the bundle if it exists, otherwise the XML files
+def calibration_sources(bundle_file=BUNDLE_FILE, map_file='stereoMap.xml', q_file='Q.xml'):
+    if is_bundle(bundle_file):
+        return bundle_file, bundle_file
+    return map_file, q_file
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert stereoMap.xml and Q.xml into a calibration bundle.")
+    parser.add_argument('--map-file', default='stereoMap.xml')
+    parser.add_argument('--q-file', default='Q.xml')
+    parser.add_argument('--output', default=BUNDLE_FILE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    convert_xml(args.map_file, args.q_file, args.output)
+    print(f"Wrote {args.output} in {(time.perf_counter() - start) * 1000:.0f} ms")
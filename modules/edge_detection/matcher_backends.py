@@ -0,0 +1,99 @@
+# matcher_backends.py
+import cv2 as cv
+
+from .matcher_cache import apply_settings
+
+# Matcher modes selectable through the 'mode' parameter (the values are OpenCV's mode constants)
+SGBM_MODES = {'sgbm': cv.STEREO_SGBM_MODE_SGBM, 'hh': cv.STEREO_SGBM_MODE_HH, '3way': cv.STEREO_SGBM_MODE_SGBM_3WAY,
+              'hh4': cv.STEREO_SGBM_MODE_HH4}
+
+
+# Translate the trackbar parameters (depth_map_params.json) into StereoSGBM settings
+def sgbm_settings(params):
+    return {'numDisparities': params['numDisparities'] * 16,  # Must be multiple of 16
+        'blockSize': params['blockSize'] * 2 + 5,  # Ensures odd number >= 5
+        'minDisparity': params['minDisparity'], 'uniquenessRatio': params['uniquenessRatio'],
+        'speckleWindowSize': params['speckleWindowSize'], 'speckleRange': params['speckleRange'],
+        'preFilterCap': params['preFilterCap'], 'disp12MaxDiff': params['disp12MaxDiff'], 'P1': params['P1'],
+        'P2': params['P2'], 'mode': params.get('mode', cv.STEREO_SGBM_MODE_SGBM_3WAY)}
+
+
+# A stereo matcher family behind the interface every matching path uses: settings(params) translates the trackbar
+# parameters (depth_map_params.json encoding) into matcher settings and create(settings) builds the matcher. A
+# matcher has OpenCV's StereoMatcher interface: compute() returns int16 disparity in 1/16 pixel with
+# (minDisparity - 1) * 16 where nothing matched, and band, pyramid and adaptive-range matching and MatcherCache
+# change it through its setters (getBlockSize, setMinDisparity, ...); added backends wrap their matcher to match.
+# `params` are the parameter values that select the backend (an SGBM mode), written into the parameters when it
+# is chosen so the trackbars, OPC UA and the quality ladder keep working on them. max_block_size is the largest
+# block the matcher accepts (None: only the image size limits it).
+class SGBMBackend:
+    min_block_size = 3
+    max_block_size = None
+    rebuild_keys = ('numDisparities', 'blockSize')
+
+    def __init__(self, name, mode):
+        self.name = name
+        self.params = {'mode': mode}
+
+    def settings(self, params):
+        return sgbm_settings(params)
+
+    def create(self, settings):
+        return cv.StereoSGBM_create(**settings)
+
+
+# StereoBM: block matching without the smoothness terms (P1, P2 and the mode are ignored), several times faster
+# than SGBM but with holes in weak texture. Parameters missing from a parameter set get StereoVision's defaults.
+class BMBackend:
+    name = 'bm'
+    params = {}
+    min_block_size = 5
+    max_block_size = 255
+    rebuild_keys = ('numDisparities', 'blockSize')
+
+    def settings(self, params):
+        settings = {'numDisparities': int(params['numDisparities'] * 16),
+                    'blockSize': int(params['blockSize'] * 2 + 5),
+                    'minDisparity': int(params.get('minDisparity', 0)),
+                    'textureThreshold': int(params.get('textureThreshold', 0)),
+                    'uniquenessRatio': int(params.get('uniquenessRatio', 15)),
+                    'speckleWindowSize': int(params.get('speckleWindowSize', 0)),
+                    'speckleRange': int(params.get('speckleRange', 2)),
+                    'disp12MaxDiff': int(params.get('disp12MaxDiff', 1))}
+        if 'preFilterCap' in params:
+            settings['preFilterCap'] = min(63, max(1, int(params['preFilterCap'])))  # StereoBM accepts 1..63
+        return settings
+
+    def create(self, settings):
+        stereo = cv.StereoBM_create(numDisparities=settings['numDisparities'], blockSize=settings['blockSize'])
+        apply_settings(stereo, {key: value for key, value in settings.items()
+                                if key not in ('numDisparities', 'blockSize')})
+        return stereo
+
+
+# Backends by name. Further matchers are added with register_backend() and are then selectable through
+# config.MATCHER_BACKEND and included in the startup selection.
+MATCHER_BACKENDS = {}
+
+
+def register_backend(backend):
+    MATCHER_BACKENDS[backend.name] = backend
+    return backend
+
+
+register_backend(BMBackend())
+for _name, _mode in SGBM_MODES.items():
+    register_backend(SGBMBackend(_name, _mode))
+
+
+def get_backend(name):
+    if name not in MATCHER_BACKENDS:
+        raise ValueError(f"Unknown matcher backend {name!r}, expected one of {sorted(MATCHER_BACKENDS)}")
+    return MATCHER_BACKENDS[name]
+
+
+# Name of the backend that produces a settings dict's matcher (SGBM backends differ only by mode)
+def backend_name(backend, settings):
+    if isinstance(backend, SGBMBackend):
+        return {mode: name for name, mode in SGBM_MODES.items()}.get(settings.get('mode'), backend.name)
+    return backend.name
@@ -0,0 +1,52 @@
+# matcher_cache.py
+
+
+# Keeps one stereo matcher per parameter version. Parameters that size the matcher's
+# internal buffers trigger a rebuild, everything else is pushed through the setters.
+class MatcherCache:
+    def __init__(self, create, rebuild_keys=('numDisparities', 'blockSize')):
+        self.create = create  # Callable building a new matcher from a settings dict
+        self.rebuild_keys = rebuild_keys
+        self.matcher = None
+        self.version = None
+        self.settings = {}
+        self.rebuilds = 0
+        self.updates = 0
+        self.reuses = 0
+
+    # Return the matcher for the given parameter version; settings_fn is only called when the version changed
+    def get(self, version, settings_fn):
+        if self.matcher is not None and version == self.version:
+            self.reuses += 1
+            return self.matcher
+
+        settings = settings_fn()
+        if self.matcher is None or any(settings.get(key) != self.settings.get(key) for key in self.rebuild_keys):
+            self.matcher = self.create(settings)
+            self.rebuilds += 1
+        else:
+            changed = {key: value for key, value in settings.items() if self.settings.get(key) != value}
+            if changed:
+                apply_settings(self.matcher, changed)
+                self.updates += 1
+            else:
+                self.reuses += 1
+
+        self.version = version
+        self.settings = settings
+        return self.matcher
+
+    # Drop the matcher, so the next get() builds a new one (e.g. of another backend)
+    def reset(self):
+        self.matcher = None
+        self.version = None
+        self.settings = {}
+
+    def stats(self):
+        return {'rebuilds': self.rebuilds, 'updates': self.updates, 'reuses': self.reuses}
+
+
+# Apply settings through the matcher's setters (e.g. 'uniquenessRatio' -> setUniquenessRatio)
+def apply_settings(matcher, settings):
+    for key, value in settings.items():
+        getattr(matcher, 'set' + key[0].upper() + key[1:])(value)
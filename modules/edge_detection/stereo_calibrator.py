@@ -0,0 +1,246 @@
+# stereo_calibrator.py
+# Stereo calibration from chessboard image pairs. Corner detection runs in a process pool and is cached on
+# disk by image content, so adding pairs only detects the new ones. Run from the repository root:
+#   python -m modules.edge_detection.stereo_calibrator --images <RectificationImages dir> --output .
+import argparse
+import glob
+import hashlib
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2 as cv
+import numpy as np
+
+from .calibration_bundle import BUNDLE_FILE, bundle_from_calibration, save_bundle
+
+# Chessboard parameters
+CHESSBOARD_SIZE = (8, 5)  # Number of internal corners on the chessboard
+SQUARE_SIZE = 0.03  # Size of a square in meters (30mm)
+
+# Termination criteria for corner refinement and stereo calibration
+CRITERIA = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+
+CACHE_FILE = 'corner_cache.npz'
+
+
+# Sort imageL0, imageL1, ..., imageL10 numerically
+def image_number(path):
+    return int(re.findall(r'\d+', os.path.basename(path))[-1])
+
+
+# (left, right) image paths from the stereoLeft/stereoRight folders
+def find_image_pairs(directory):
+    lefts = sorted(glob.glob(os.path.join(directory, 'stereoLeft', '*.png')), key=image_number)
+    rights = sorted(glob.glob(os.path.join(directory, 'stereoRight', '*.png')), key=image_number)
+    if len(lefts) != len(rights):
+        raise ValueError("Left and right image sets do not have the same number of images.")
+    return list(zip(lefts, rights))
+
+
+# Cache key: image content plus the board size the corners were searched for
+def corner_key(path, chessboard_size):
+    with open(path, 'rb') as file:
+        digest = hashlib.sha1(file.read()).hexdigest()
+    return f"{digest}_{chessboard_size[0]}x{chessboard_size[1]}"
+
+
+# Chessboard corners of one image, refined to sub-pixel accuracy; runs in a worker process.
+# Returns (corners or None, (width, height)).
+def detect_corners(path, chessboard_size=CHESSBOARD_SIZE):
+    image = cv.imread(path)
+    if image is None:
+        raise FileNotFoundError(f"Failed to load image {path}")
+    gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY)  # Same conversion as the original script, same corners
+    found, corners = cv.findChessboardCorners(gray, chessboard_size, None)
+    if found:
+        corners = cv.cornerSubPix(gray, corners, (11, 11), (-1, -1), CRITERIA)
+    return (corners if found else None), gray.shape[::-1]
+
+
+# Detected corners stored in one .npz file; an empty array records "no chessboard found"
+class CornerCache:
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file
+        self.entries = {}
+        if cache_file and os.path.exists(cache_file):
+            with np.load(cache_file) as data:
+                self.entries = {key: data[key] for key in data.files}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, corners, image_size):
+        # First row holds the image size so cached entries can be checked against the frame size
+        corners = np.zeros((0, 1, 2), np.float32) if corners is None else corners
+        self.entries[key] = np.concatenate([np.float32([[image_size]]), corners])
+
+    def save(self):
+        if self.cache_file:
+            np.savez(self.cache_file, **self.entries)
+
+
+# Corners for every image path, detecting only the ones not in the cache. Returns {path: (corners, size)}.
+def detect_all(paths, chessboard_size=CHESSBOARD_SIZE, cache=None, workers=None):
+    cache = cache or CornerCache()
+    keys = {path: corner_key(path, chessboard_size) for path in paths}
+    missing = [path for path in paths if cache.get(keys[path]) is None]
+
+    if missing:
+        if workers == 1 or len(missing) == 1:
+            detected = [detect_corners(path, chessboard_size) for path in missing]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                detected = list(pool.map(detect_corners, missing, [chessboard_size] * len(missing)))
+        for path, (corners, image_size) in zip(missing, detected):
+            cache.put(keys[path], corners, image_size)
+        cache.save()
+
+    results = {}
+    for path in paths:
+        entry = cache.entries[keys[path]]
+        image_size = tuple(int(v) for v in entry[0, 0])
+        results[path] = (entry[1:] if len(entry) > 1 else None, image_size)
+    return results
+
+
+# Draw the detected corners of each pair; display_ms is the pause per pair
+def show_corners(pairs, corners, chessboard_size, display_ms=300):
+    for left, right in pairs:
+        for path, title in ((left, 'Left Image Corners'), (right, 'Right Image Corners')):
+            image = cv.imread(path)
+            cv.drawChessboardCorners(image, chessboard_size, corners[path][0], True)
+            cv.imshow(title, image)
+        cv.waitKey(display_ms)
+    cv.destroyAllWindows()
+
+
+# Full stereo calibration. Returns the stereo maps, Q, RMS errors and the time spent in each step.
+def calibrate(pairs, chessboard_size=CHESSBOARD_SIZE, square_size=SQUARE_SIZE, cache_file=CACHE_FILE,
+              workers=None, display=False, display_ms=300):
+    timings = {}
+
+    # Prepare object points for the chessboard
+    objp = np.zeros((chessboard_size[0] * chessboard_size[1], 3), np.float32)
+    objp[:, :2] = np.mgrid[0:chessboard_size[0], 0:chessboard_size[1]].T.reshape(-1, 2)
+    objp *= square_size
+
+    start = time.perf_counter()
+    cache = CornerCache(cache_file)
+    corners = detect_all([path for pair in pairs for path in pair], chessboard_size, cache, workers)
+    timings['detection'] = time.perf_counter() - start
+
+    used = []
+    for left, right in pairs:
+        if corners[left][0] is None or corners[right][0] is None:
+            print(f"Chessboard corners not found in {left} or {right}")
+        else:
+            used.append((left, right))
+    if not used:
+        raise ValueError("Not enough data for calibration. Ensure chessboard corners were detected.")
+
+    frame_size = corners[used[0][0]][1]
+    objpoints = [objp] * len(used)
+    imgpointsL = [corners[left][0] for left, _ in used]
+    imgpointsR = [corners[right][0] for _, right in used]
+    if display:
+        show_corners(used, corners, chessboard_size, display_ms)
+
+    # Intrinsic calibration for each camera
+    start = time.perf_counter()
+    rmsL, cameraMatrixL, distL, _, _ = cv.calibrateCamera(objpoints, imgpointsL, frame_size, None, None)
+    rmsR, cameraMatrixR, distR, _, _ = cv.calibrateCamera(objpoints, imgpointsR, frame_size, None, None)
+    timings['calibrate_camera'] = time.perf_counter() - start
+
+    # Stereo calibration
+    start = time.perf_counter()
+    flags = 0  # cv.CALIB_FIX_INTRINSIC  # Keep intrinsic parameters fixed
+    rmsStereo, _, _, _, _, R, T, E, F = cv.stereoCalibrate(objpoints, imgpointsL, imgpointsR, cameraMatrixL, distL,
+                                                           cameraMatrixR, distR, frame_size, CRITERIA, flags)
+    timings['stereo_calibrate'] = time.perf_counter() - start
+    if rmsStereo > 1.0:  # Adjust threshold as needed
+        print(f"Warning: High RMS error {rmsStereo}. Calibration may be inaccurate.")
+
+    # Stereo rectification and the remap tables
+    start = time.perf_counter()
+    rectifyScale = 1  # 1 for all pixels, 0 for valid pixels only
+    R1, R2, P1, P2, Q, _, _ = cv.stereoRectify(cameraMatrixL, distL, cameraMatrixR, distR, frame_size, R, T,
+                                               alpha=rectifyScale)
+    stereoMapL = cv.initUndistortRectifyMap(cameraMatrixL, distL, R1, P1, frame_size, cv.CV_16SC2)
+    stereoMapR = cv.initUndistortRectifyMap(cameraMatrixR, distR, R2, P2, frame_size, cv.CV_16SC2)
+    timings['map_generation'] = time.perf_counter() - start
+
+    return {'stereoMapL': stereoMapL, 'stereoMapR': stereoMapR, 'Q': Q, 'frame_size': frame_size,
+            'cameraMatrixL': cameraMatrixL, 'distL': distL, 'cameraMatrixR': cameraMatrixR, 'distR': distR,
+            'R': R, 'T': T, 'R1': R1, 'R2': R2, 'P1': P1, 'P2': P2,
+            'rms': {'left': rmsL, 'right': rmsR, 'stereo': rmsStereo}, 'pairs_used': len(used),
+            'pairs_total': len(pairs), 'cache': {'hits': cache.hits, 'misses': cache.misses}, 'timings': timings}
+
+
+# Write the binary calibration bundle, plus stereoMap.xml and Q.xml for older tools
+def save_calibration(result, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+
+    bundle_file = os.path.join(output_dir, BUNDLE_FILE)
+    print(f"Saving calibration bundle to: {bundle_file}")
+    save_bundle(bundle_file, *bundle_from_calibration(result))
+
+    stereo_map_file = os.path.join(output_dir, "stereoMap.xml")
+    print(f"Saving stereo map to: {stereo_map_file}")
+    cv_file = cv.FileStorage(stereo_map_file, cv.FILE_STORAGE_WRITE)
+    cv_file.write('stereoMapL_x', result['stereoMapL'][0])
+    cv_file.write('stereoMapL_y', result['stereoMapL'][1])
+    cv_file.write('stereoMapR_x', result['stereoMapR'][0])
+    cv_file.write('stereoMapR_y', result['stereoMapR'][1])
+    cv_file.release()
+
+    q_file = os.path.join(output_dir, "Q.xml")
+    print(f"Saving Q matrix to: {q_file}")
+    cv_file = cv.FileStorage(q_file, cv.FILE_STORAGE_WRITE)
+    cv_file.write('Q', result['Q'])
+    cv_file.release()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stereo calibration from chessboard image pairs.")
+    parser.add_argument('--images', default='RectificationImages', help="Folder with stereoLeft/ and stereoRight/")
+    parser.add_argument('--output', default='.', help="Where calibration.bin, stereoMap.xml and Q.xml are written")
+    parser.add_argument('--board', default=f"{CHESSBOARD_SIZE[0]}x{CHESSBOARD_SIZE[1]}",
+                        help="Internal corners as COLSxROWS")
+    parser.add_argument('--square', type=float, default=SQUARE_SIZE, help="Square size in meters")
+    parser.add_argument('--workers', type=int, help="Corner detection processes (default: CPU count)")
+    parser.add_argument('--cache', default=None, help=f"Corner cache file (default: <images>/{CACHE_FILE})")
+    parser.add_argument('--no-cache', action='store_true', help="Detect every image again")
+    parser.add_argument('--display', action='store_true', help="Show the detected corners")
+    parser.add_argument('--display-ms', type=int, default=300, help="Pause per pair when displaying")
+    args = parser.parse_args(argv)
+
+    pairs = find_image_pairs(args.images)
+    if not pairs:
+        print("No images found. Check your file paths.")
+        return 1
+    cache_file = None if args.no_cache else (args.cache or os.path.join(args.images, CACHE_FILE))
+    chessboard_size = tuple(int(v) for v in args.board.split('x'))
+
+    print("Calibrating...")
+    result = calibrate(pairs, chessboard_size, args.square, cache_file, args.workers, args.display,
+                       args.display_ms)
+    save_calibration(result, args.output)
+
+    print(f"Pairs used: {result['pairs_used']}/{result['pairs_total']}  corner cache: {result['cache']}")
+    print(f"RMS: {result['rms']}")
+    print("Timings: " + ", ".join(f"{step} {seconds * 1000:.1f} ms" for step, seconds in result['timings'].items()))
+    print("Calibration complete. Parameters saved.")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
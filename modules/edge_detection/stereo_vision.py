@@ -1,31 +1,36 @@
 # stereo_vision.py
-import cv2 as cv
 import numpy as np
 
+from .matcher_cache import MatcherCache
+from .matcher_backends import get_backend
+
 
 class StereoVision:
-    def __init__(self):
+    def __init__(self, backend='bm'):
+        self.backend = get_backend(backend)
         self.stereo = None  # Initialize stereo matcher only when needed
+        self.matcher_cache = MatcherCache(self.create_stereo_matcher, self.backend.rebuild_keys)
+
+    # Retrieve the depth map parameters from param_manager as settings of the backend's matcher
+    def matcher_settings(self, param_manager):
+        return self.backend.settings(param_manager.params)
+
+    # Configure stereo depth map generation with the given settings
+    def create_stereo_matcher(self, settings):
+        return self.backend.create(settings)
 
     def update_stereo_matcher(self, param_manager):
-        # Retrieve updated depth map parameters from param_manager
-        num_disparities = int(param_manager.get_param("numDisparities") * 16)
-        block_size = int(param_manager.get_param("blockSize") * 2 + 5)
-        min_disparity = int(param_manager.get_param("minDisparity", default=0))
-        texture_threshold = int(param_manager.get_param("textureThreshold", default=0))
-        uniqueness_ratio = int(param_manager.get_param("uniquenessRatio", default=15))
-        speckle_window_size = int(param_manager.get_param("speckleWindowSize", default=0))
-        speckle_range = int(param_manager.get_param("speckleRange", default=2))
-        disp12_max_diff = int(param_manager.get_param("disp12MaxDiff", default=1))
-
-        # Configure and apply stereo depth map generation with updated parameters
-        self.stereo = cv.StereoBM_create(numDisparities=num_disparities, blockSize=block_size)
-        self.stereo.setMinDisparity(min_disparity)
-        self.stereo.setTextureThreshold(texture_threshold)
-        self.stereo.setUniquenessRatio(uniqueness_ratio)
-        self.stereo.setSpeckleWindowSize(speckle_window_size)
-        self.stereo.setSpeckleRange(speckle_range)
-        self.stereo.setDisp12MaxDiff(disp12_max_diff)
+        # Reuse the matcher while the parameter version is unchanged
+        version = getattr(param_manager.params, 'version', None)
+        if version is None:
+            self.stereo = self.create_stereo_matcher(self.matcher_settings(param_manager))
+            self.matcher_cache.rebuilds += 1
+            return
+        self.stereo = self.matcher_cache.get(version, lambda: self.matcher_settings(param_manager))
+
+    # Matcher rebuild/update/reuse counters
+    def matcher_stats(self):
+        return self.matcher_cache.stats()
 
     def process(self, left_frame, right_frame, param_manager):
         # Ensure stereo matcher is updated with current parameters
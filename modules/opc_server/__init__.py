@@ -1,5 +1,5 @@
 # opc_server/__init__.py
 
-from .opc_server import OpcuaServer
+from .opc_server import OpcuaServer, HeightPublisher
 
-__all__ = ['OpcuaServer']
+__all__ = ['OpcuaServer', 'HeightPublisher']
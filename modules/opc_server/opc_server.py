@@ -1,18 +1,38 @@
 # opc_server.py
 
+import math
 import time
+from datetime import datetime
+
 from opcua import Server, ua
 
+from modules.depth_map.zones import format_zones
+
+# Per-zone statistics published as arrays under Height Data (zone_<name>, one element per zone)
+ZONE_ARRAYS = {'height': ua.VariantType.Float, 'median': ua.VariantType.Float, 'mean': ua.VariantType.Float,
+               'p10': ua.VariantType.Float, 'p90': ua.VariantType.Float, 'coverage': ua.VariantType.Float,
+               'valid': ua.VariantType.UInt32}
+
 
 class OpcuaServer:
-    def __init__(self, endpoint, uri, callback=None):
+    def __init__(self, endpoint, uri, callback=None, publish_deadband=0.0, publish_max_rate=None,
+                 publish_keepalive=1.0, instrumentation=None, diagnostics_interval=1.0, parameters=None,
+                 subscription_period=1000, quality=None):
         self.server = Server()
         self.server.set_endpoint(endpoint)
         self.server.set_server_name("CablelayServer")
         self.callback = callback
+        self.subscription_period = subscription_period  # ms between data change notifications
+        # LiveParameters fed by client writes to the Filters, Stereo Matcher and Zones objects
+        self.parameters = parameters
+        initial = parameters.node_values() if parameters is not None else {}
         idx = self.server.register_namespace(uri)
 
         top_obj = self.server.nodes.objects.add_object(idx, "Cablelay")
+        self.idx = idx
+        self.top_obj = top_obj
+        self.publish_settings = (publish_deadband, publish_max_rate, publish_keepalive)
+        self.rig_variables = {}
         self.filter_obj = top_obj.add_object(idx, "Filters")
         self.zone_obj = top_obj.add_object(idx, "Zones")
         self.height_obj = top_obj.add_object(idx, "Height Data")
@@ -21,28 +41,128 @@ class OpcuaServer:
             'height1': self.height_obj.add_variable(idx, "height1", ua.Variant(0.0, ua.VariantType.Float)),
             'height2': self.height_obj.add_variable(idx, "height2", ua.Variant(0.0, ua.VariantType.Float)),
             'height3': self.height_obj.add_variable(idx, "height3", ua.Variant(0.0, ua.VariantType.Float)),
-            'noisefilter': self.filter_obj.add_variable(idx, "noisefilter", ua.Variant(0, ua.VariantType.Int32)),
-            'gamma': self.filter_obj.add_variable(idx, "gamma", ua.Variant(0, ua.VariantType.Int32)),
-            'contrast': self.filter_obj.add_variable(idx, "contrast", ua.Variant(0, ua.VariantType.Int32)),
-            'zone1': self.zone_obj.add_variable(idx, "zone1", ua.Variant(0, ua.VariantType.Int32)),
-            'zone2': self.zone_obj.add_variable(idx, "zone2", ua.Variant(0, ua.VariantType.Int32)),
-            'zone3': self.zone_obj.add_variable(idx, "zone3", ua.Variant(0, ua.VariantType.Int32))}
+            'noisefilter': self.filter_obj.add_variable(
+                idx, "noisefilter", ua.Variant(initial.get('noisefilter', 0), ua.VariantType.Int32)),
+            'gamma': self.filter_obj.add_variable(
+                idx, "gamma", ua.Variant(initial.get('gamma', 0), ua.VariantType.Int32)),
+            'contrast': self.filter_obj.add_variable(
+                idx, "contrast", ua.Variant(initial.get('contrast', 0), ua.VariantType.Int32)),
+            # Row shortcuts for the first three zones (-1 when that zone is not a row)
+            'zone1': self.zone_obj.add_variable(idx, "zone1", ua.Variant(-1, ua.VariantType.Int32)),
+            'zone2': self.zone_obj.add_variable(idx, "zone2", ua.Variant(-1, ua.VariantType.Int32)),
+            'zone3': self.zone_obj.add_variable(idx, "zone3", ua.Variant(-1, ua.VariantType.Int32)),
+            # All zone definitions as JSON (see modules/depth_map/zones.py)
+            'zones': self.zone_obj.add_variable(idx, "definitions", ua.Variant("[]", ua.VariantType.String))}
+        if parameters is not None:
+            # SGBM parameters in trackbar units (as in depth_map_params.json)
+            self.matcher_obj = top_obj.add_object(idx, "Stereo Matcher")
+            for name in parameters.snapshot.sgbm:
+                self.variables[name] = self.matcher_obj.add_variable(
+                    idx, name, ua.Variant(initial[name], ua.VariantType.Int32))
         for var in self.variables.values():
             var.set_writable()
 
+        self.shown_zones = None
+        self.shown_rejected = 0
+        self.show_zones()
+
+        # Read-only per-zone statistics, written as arrays at most publish_max_rate times per second
+        self.zone_variables = {name: self.height_obj.add_variable(idx, f"zone_{name}", ua.Variant([], variant_type))
+                               for name, variant_type in ZONE_ARRAYS.items()}
+        self.zone_min_interval = 1.0 / publish_max_rate if publish_max_rate else 0.0
+        self.last_zone_publish = 0.0
+
+        # Read-only quality level of the frame-budget controller (FrameBudgetController), if one is running
+        self.quality = quality
+        self.quality_variables = {}
+        if quality is not None:
+            quality_obj = top_obj.add_object(idx, "Quality")
+            self.quality_variables = {
+                'level': quality_obj.add_variable(idx, "level", ua.Variant(0, ua.VariantType.UInt32)),
+                'name': quality_obj.add_variable(idx, "name", ua.Variant("", ua.VariantType.String)),
+                'levels': quality_obj.add_variable(idx, "levels", ua.Variant(0, ua.VariantType.UInt32)),
+                'target_ms': quality_obj.add_variable(idx, "target_ms", ua.Variant(0.0, ua.VariantType.Float)),
+                'frame_ms': quality_obj.add_variable(idx, "frame_ms", ua.Variant(0.0, ua.VariantType.Float)),
+                'changes': quality_obj.add_variable(idx, "changes", ua.Variant(0, ua.VariantType.UInt32))}
+            self.show_quality()
+
+        # Read-only stage timings and counters; not created at all when instrumentation is off
+        self.instrumentation = instrumentation
+        self.diagnostics_interval = diagnostics_interval
+        self.diagnostic_variables = {}
+        if instrumentation is not None and instrumentation.enabled:
+            self.diagnostics_obj = top_obj.add_object(idx, "Diagnostics")
+            self.create_diagnostics(idx, instrumentation.snapshot())
+
         self.server.start()
 
+        self.parameter_nodes = set(parameters.nodes()) if parameters is not None else set()
         self.subscriptions = {}
         self.create_subscriptions()
+        self.height_publisher = HeightPublisher(self, ['height1', 'height2', 'height3'], publish_deadband,
+                                                publish_max_rate, publish_keepalive)
 
     def create_subscriptions(self):
         # Pass reverse mapping of nodes to variable names
-        handler = SubscriptionHandler(self.callback, {var: name for name, var in self.variables.items()})
-        subscription = self.server.create_subscription(1000, handler)
+        handler = SubscriptionHandler(self.on_data_change, {var: name for name, var in self.variables.items()})
+        subscription = self.server.create_subscription(self.subscription_period, handler)
         for var_name, variable in self.variables.items():
             handle = subscription.subscribe_data_change(variable)
             self.subscriptions[var_name] = handle
 
+    # One Float per stage percentile and one UInt64 per counter, named like rectify_p99_ms and frames
+    def create_diagnostics(self, idx, snapshot):
+        for stage in snapshot['stages']:
+            for stat in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms'):
+                name = f"{stage}_{stat}"
+                self.diagnostic_variables[name] = self.diagnostics_obj.add_variable(
+                    idx, name, ua.Variant(0.0, ua.VariantType.Float))
+        for counter in snapshot['counters']:
+            self.diagnostic_variables[counter] = self.diagnostics_obj.add_variable(
+                idx, counter, ua.Variant(0, ua.VariantType.UInt64))
+
+    # Write the current instrumentation snapshot as one batch (runs on the server thread, not the hot path)
+    def publish_diagnostics(self):
+        if not self.diagnostic_variables:
+            return
+        snapshot = self.instrumentation.snapshot()
+        values = {}
+        for stage, stats in snapshot['stages'].items():
+            for stat in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms'):
+                value = stats[stat]
+                values[f"{stage}_{stat}"] = ua.Variant(0.0 if math.isnan(value) else value, ua.VariantType.Float)
+        for counter, value in snapshot['counters'].items():
+            if counter in self.diagnostic_variables:
+                values[counter] = ua.Variant(int(value), ua.VariantType.UInt64)
+        self.write_batch(values, variables=self.diagnostic_variables)
+
+    # Subtree for one stereo rig: Cablelay/<rig>/Height Data/height1..N and Cablelay/<rig>/Status.
+    # Returns the rig's height publisher; its variables are named '<rig>.height<i>'.
+    def add_rig(self, rig, zone_count=3):
+        rig_obj = self.top_obj.add_object(self.idx, rig)
+        height_obj = rig_obj.add_object(self.idx, "Height Data")
+        status_obj = rig_obj.add_object(self.idx, "Status")
+        names = []
+        for i in range(1, zone_count + 1):
+            name = f"{rig}.height{i}"
+            self.variables[name] = height_obj.add_variable(self.idx, f"height{i}",
+                                                           ua.Variant(0.0, ua.VariantType.Float))
+            names.append(name)
+        self.rig_variables[rig] = {
+            'frames': status_obj.add_variable(self.idx, "frames", ua.Variant(0, ua.VariantType.UInt64)),
+            'fps': status_obj.add_variable(self.idx, "fps", ua.Variant(0.0, ua.VariantType.Float)),
+            'restarts': status_obj.add_variable(self.idx, "restarts", ua.Variant(0, ua.VariantType.UInt32)),
+            'running': status_obj.add_variable(self.idx, "running", ua.Variant(False, ua.VariantType.Boolean))}
+        return HeightPublisher(self, names, *self.publish_settings)
+
+    # Write a rig's worker status (frames, fps, restarts, running) as one batch
+    def publish_rig_status(self, rig, status):
+        values = {'frames': ua.Variant(int(status['frames']), ua.VariantType.UInt64),
+                  'fps': ua.Variant(float(status['fps']), ua.VariantType.Float),
+                  'restarts': ua.Variant(int(status['restarts']), ua.VariantType.UInt32),
+                  'running': ua.Variant(bool(status['running']), ua.VariantType.Boolean)}
+        self.write_batch(values, variables=self.rig_variables[rig])
+
     def update_variable(self, var_name, value):
         if var_name in self.variables:
             try:
@@ -53,10 +173,107 @@ class OpcuaServer:
         else:
             print(f"Variable {var_name} not found")
 
+    # Write several Float variables in one batch sharing a source timestamp, so readers never see a
+    # half-updated set. Values may be given as ua.Variants for other types. Returns the names that were written;
+    # values the server rejected (or a failed batch) are logged and left out.
+    def write_batch(self, values, timestamp=None, variables=None):
+        variables = variables or self.variables
+        timestamp = timestamp or datetime.utcnow()
+        names = list(values)
+        params = ua.WriteParameters()
+        for var_name in names:
+            value = values[var_name]
+            write_value = ua.WriteValue()
+            write_value.NodeId = variables[var_name].nodeid
+            write_value.AttributeId = ua.AttributeIds.Value
+            if not isinstance(value, ua.Variant):
+                value = ua.Variant(value, ua.VariantType.Float)
+            write_value.Value = ua.DataValue(value)
+            write_value.Value.SourceTimestamp = timestamp
+            write_value.Value.ServerTimestamp = timestamp
+            params.NodesToWrite.append(write_value)
+        try:
+            results = self.write_locked(params)
+        except Exception as e:
+            print(f"Error writing batch {names}: {e}")
+            return []
+        written = [name for name, status in zip(names, results) if status.is_good()]
+        if len(written) < len(names):
+            print("Error writing batch: " + ", ".join(f"{name} {status.name}" for name, status in zip(names, results)
+                                                      if not status.is_good()))
+        return written
+
+    # All python-opcua internals the batch write depends on (checked against python-opcua 0.98.13): the
+    # address space's private _lock, held so the batch is applied atomically, and the internal session's
+    # write(), which returns one StatusCode per node. Update both together when upgrading the library.
+    def write_locked(self, params):
+        with self.server.iserver.aspace._lock:
+            return self.server.iserver.isession.write(params)
+
+    # Publish height1..3 through the deadband/rate-limited publisher
+    def publish_heights(self, heights):
+        return self.height_publisher.publish(heights)
+
+    # Write the per-zone statistics (ZoneSet order) as one batch of arrays
+    def publish_zones(self, stats):
+        now = time.monotonic()
+        if now - self.last_zone_publish < self.zone_min_interval:
+            return False
+        values = {}
+        for name, variant_type in ZONE_ARRAYS.items():
+            if name in stats:
+                cast = int if variant_type == ua.VariantType.UInt32 else float
+                values[name] = ua.Variant([cast(value) for value in stats[name]], variant_type)
+        self.write_batch(values, variables=self.zone_variables)
+        self.last_zone_publish = now
+        return True
+
+    # Runs on the subscription thread: parameter writes are only queued (LiveParameters validates and applies
+    # them on its own thread), then every change is passed on to the callback
+    def on_data_change(self, var_name, value, data=None):
+        if self.parameters is not None and var_name in self.parameter_nodes:
+            self.parameters.stage(var_name, value, notification_age(data))
+        if self.callback:
+            self.callback(var_name, value)
+
+    # Show the zones in effect on the Zones object: the JSON definitions, and zone1..3 for row zones.
+    # Runs on the server thread whenever the zones changed or a zone write was rejected.
+    def show_zones(self):
+        if self.parameters is None:
+            return
+        zones, rejected = self.parameters.snapshot.zones, self.parameters.rejected
+        if zones is self.shown_zones and rejected == self.shown_rejected:
+            return
+        values = {'zones': ua.Variant(format_zones(zones), ua.VariantType.String)}
+        for index in range(3):
+            row = zones[index].get('row', -1) if index < len(zones) else -1
+            values[f'zone{index + 1}'] = ua.Variant(row, ua.VariantType.Int32)
+        self.write_batch(values)
+        if self.shown_zones is not None and zones is not self.shown_zones:
+            print(f"Zones in use: {zones}")
+        self.shown_zones, self.shown_rejected = zones, rejected
+
+    # Show the current quality level and the frame time it was chosen on (runs on the server thread)
+    def show_quality(self):
+        if self.quality is None:
+            return
+        stats = self.quality.stats()
+        frame_ms = stats['frame_ms']
+        values = {'level': ua.Variant(stats['level'], ua.VariantType.UInt32),
+                  'name': ua.Variant(stats['name'], ua.VariantType.String),
+                  'levels': ua.Variant(stats['levels'], ua.VariantType.UInt32),
+                  'target_ms': ua.Variant(float(stats['target_ms'] or 0.0), ua.VariantType.Float),
+                  'frame_ms': ua.Variant(0.0 if math.isnan(frame_ms) else float(frame_ms), ua.VariantType.Float),
+                  'changes': ua.Variant(stats['changes'], ua.VariantType.UInt32)}
+        self.write_batch(values, variables=self.quality_variables)
+
     def run(self):
         try:
             while True:
-                time.sleep(1)
+                time.sleep(self.diagnostics_interval if self.diagnostic_variables else 1)
+                self.publish_diagnostics()
+                self.show_zones()
+                self.show_quality()
         except KeyboardInterrupt:
             self.stop()
 
@@ -65,6 +282,92 @@ class OpcuaServer:
         print("Server stopped")
 
 
+# Publishes a fixed set of values as one batch, suppressing changes inside a deadband and capping the
+# publish rate independently of the frame rate. NaN values are skipped and keep their last value.
+class HeightPublisher:
+    def __init__(self, server, names, deadband=0.0, max_rate=None, keepalive=1.0):
+        self.server = server
+        self.names = names
+        self.deadband = deadband  # Minimum change (same unit as the heights) worth publishing
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        self.keepalive = keepalive  # Republish at least this often (s) even inside the deadband
+        self.last_values = {}
+        self.last_publish = 0.0
+        self.sent_batches = 0
+        self.sent_values = 0
+        self.suppressed_deadband = 0
+        self.suppressed_rate = 0
+        self.skipped_nan = 0
+        self.failed_values = 0
+
+    def configure(self, deadband=None, max_rate=None, keepalive=None):
+        if deadband is not None:
+            self.deadband = deadband
+        if max_rate is not None:
+            self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        if keepalive is not None:
+            self.keepalive = keepalive
+
+    # Returns True if a batch was written
+    def publish(self, values):
+        now = time.monotonic()
+        if now - self.last_publish < self.min_interval:
+            self.suppressed_rate += 1
+            return False
+
+        batch = {}
+        changed = False
+        for name, value in zip(self.names, values):
+            if value is None or math.isnan(value):
+                self.skipped_nan += 1
+                continue
+            value = float(value)
+            batch[name] = value
+            last = self.last_values.get(name)
+            if last is None or abs(value - last) >= self.deadband:
+                changed = True
+
+        if not batch:
+            return False
+        if not changed and now - self.last_publish < self.keepalive:
+            self.suppressed_deadband += 1
+            return False
+
+        # Only values the server took count for the deadband; failed ones go out again with the next batch
+        written = self.server.write_batch(batch)
+        self.failed_values += len(batch) - len(written)
+        if not written:
+            return False
+        self.last_values.update((name, batch[name]) for name in written)
+        self.last_publish = now
+        self.sent_batches += 1
+        self.sent_values += len(written)
+        return True
+
+    def stats(self):
+        return {'sent_batches': self.sent_batches, 'sent_values': self.sent_values,
+                'suppressed_deadband': self.suppressed_deadband, 'suppressed_rate': self.suppressed_rate,
+                'skipped_nan': self.skipped_nan, 'failed_values': self.failed_values}
+
+
+# Seconds since the value of a data change notification was written (0 if unknown), so apply latency is
+# measured from the client's write rather than from the notification. Client writes usually carry only the
+# client's SourceTimestamp; ages beyond MAX_NOTIFICATION_AGE are taken as clock skew and ignored.
+MAX_NOTIFICATION_AGE = 60.0
+
+
+def notification_age(data):
+    try:
+        value = data.monitored_item.Value
+        written = value.ServerTimestamp or value.SourceTimestamp
+    except AttributeError:
+        return 0.0
+    if written is None:
+        return 0.0
+    age = (datetime.utcnow() - written).total_seconds()
+    return age if 0.0 <= age <= MAX_NOTIFICATION_AGE else 0.0
+
+
 class SubscriptionHandler:
     def __init__(self, callback, node_to_var_map):
         self.callback = callback
@@ -74,7 +377,7 @@ class SubscriptionHandler:
         # Get the variable name from the node
         var_name = self.node_to_var_map.get(node, None)
         if self.callback and var_name:
-            self.callback(var_name, val)
+            self.callback(var_name, val, data)
 
     def event_notification(self, event):
         print("Event Notification", event)
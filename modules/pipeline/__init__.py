@@ -0,0 +1,8 @@
+# pipeline/__init__.py
+
+from .pipeline_executor import PipelineExecutor, Stage, LatestQueue, PipelineFrame
+from .live_parameters import LiveParameters, ParameterSnapshot
+from .frame_budget import FrameBudgetController, QualityLevel, build_ladder
+
+__all__ = ['PipelineExecutor', 'Stage', 'LatestQueue', 'PipelineFrame', 'LiveParameters', 'ParameterSnapshot',
+           'FrameBudgetController', 'QualityLevel', 'build_ladder']
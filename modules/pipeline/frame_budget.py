@@ -0,0 +1,131 @@
+# frame_budget.py
+import collections
+import time
+
+from modules.depth_map.depth_map_SGBM import SGBM_MODES
+from modules.edge_detection.calibration import INTERPOLATIONS
+
+# Settings a ladder rung may change: matcher parameters (trackbar units), rectification and matching scale
+SGBM_KEYS = ('numDisparities', 'blockSize', 'mode')
+RUNG_KEYS = ('name', 'interpolation', 'match_scale') + SGBM_KEYS
+
+
+# One rung of the quality ladder with everything the rungs above it changed as well
+class QualityLevel:
+    __slots__ = ('index', 'name', 'sgbm', 'interpolation', 'match_scale')
+
+    def __init__(self, index, name, sgbm, interpolation, match_scale=1):
+        self.index = index
+        self.name = name
+        self.sgbm = sgbm  # Overrides for DepthMapProcessorSGBM.set_quality()
+        self.interpolation = interpolation
+        self.match_scale = match_scale
+
+    def __repr__(self):
+        return f"{self.index}:{self.name}"
+
+
+# Quality levels from a ladder of rungs (dicts with RUNG_KEYS), best quality first. Each rung adds its
+# changes to those of the rungs above it; interpolation falls back to the configured one.
+def build_ladder(rungs, interpolation='lanczos'):
+    levels, settings = [], {}
+    for index, rung in enumerate(rungs):
+        unknown = set(rung) - set(RUNG_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown quality ladder settings {sorted(unknown)}")
+        settings = dict(settings, **{key: value for key, value in rung.items() if key != 'name'})
+        sgbm = {key: settings[key] for key in SGBM_KEYS if key in settings}
+        if 'mode' in sgbm:
+            sgbm['mode'] = SGBM_MODES[sgbm['mode']] if isinstance(sgbm['mode'], str) else int(sgbm['mode'])
+        level_interpolation = settings.get('interpolation', interpolation)
+        if level_interpolation not in INTERPOLATIONS:
+            raise ValueError(f"Unknown interpolation {level_interpolation!r}")
+        match_scale = int(settings.get('match_scale', 1))
+        if match_scale not in (1, 2, 4):
+            raise ValueError("match_scale must be 1, 2 or 4")
+        levels.append(QualityLevel(index, rung.get('name', f"level{index}"), sgbm, level_interpolation,
+                                   match_scale))
+    if not levels:
+        levels.append(QualityLevel(0, 'full', {}, interpolation))
+    return levels
+
+
+# Keeps the frame time under a target by stepping down a ladder of cheaper settings when frames take too
+# long and back up when there is headroom again. observe() gets every frame's cost; the capture stage reads
+# `level` once per frame and the stages apply its settings on their own threads, like parameter snapshots.
+# Decisions use a percentile over the last `window` frames, and the window restarts after every change so
+# the next decision only sees frames of the new level. A level that was over budget is only tried again
+# after retry_after seconds.
+class FrameBudgetController:
+    def __init__(self, target_ms, ladder=(), interpolation='lanczos', headroom=0.7, window=30, percentile=90,
+                 retry_after=30.0):
+        self.target_ms = target_ms  # None: never leave the first level
+        self.levels = build_ladder(ladder, interpolation)
+        self.level = self.levels[0]
+        self.headroom = headroom
+        self.percentile = percentile
+        self.retry_after = retry_after
+        self.recent = collections.deque(maxlen=window)
+        self.over_budget_at = {}  # Level index -> (frame time estimate, monotonic time) when it was left
+        self.estimate = float('nan')
+        self.frames = 0
+        self.frames_over_budget = 0
+        self.changes = 0
+        self.last_change = None
+        self.warned = False
+
+    @property
+    def enabled(self):
+        return self.target_ms is not None
+
+    # Record the cost (ms) of one frame and change the level if the recent frames call for it
+    def observe(self, frame_ms):
+        if self.target_ms is None:
+            return
+        self.frames += 1
+        if frame_ms > self.target_ms:
+            self.frames_over_budget += 1
+        self.recent.append(frame_ms)
+        if len(self.recent) < self.recent.maxlen:
+            return
+
+        ordered = sorted(self.recent)
+        self.estimate = estimate = ordered[int(round((len(ordered) - 1) * self.percentile / 100.0))]
+        index = self.level.index
+        if estimate > self.target_ms:
+            if index + 1 < len(self.levels):
+                self.over_budget_at[index] = (estimate, time.monotonic())
+                self.change(index + 1, estimate)
+            elif not self.warned:
+                print(f"Frame budget: lowest quality level {self.level} still takes {estimate:.1f} ms "
+                      f"(target {self.target_ms:.1f} ms)")
+                self.warned = True
+        elif index > 0 and estimate < self.target_ms * self.headroom:
+            previous = self.over_budget_at.get(index - 1)
+            if previous is None or time.monotonic() - previous[1] > self.retry_after:
+                self.change(index - 1, estimate)
+
+    def change(self, index, estimate):
+        previous, self.level = self.level, self.levels[index]
+        self.recent.clear()
+        self.changes += 1
+        self.warned = False
+        self.last_change = {'from': previous.name, 'to': self.level.name, 'frame_ms': estimate,
+                            'time': time.time()}
+        print(f"Frame budget: quality level {previous} -> {self.level} (p{self.percentile:g} frame time "
+              f"{estimate:.1f} ms, target {self.target_ms:.1f} ms)")
+
+    # Apply a frame's level to the components; each call runs on the thread that owns the component
+    @staticmethod
+    def apply_rectification(rectification, level):
+        rectification.set_interpolation(level.interpolation)
+
+    @staticmethod
+    def apply_matcher(depth_map_processor, level):
+        depth_map_processor.set_quality(level.sgbm, level.match_scale)
+
+    def stats(self):
+        return {'level': self.level.index, 'name': self.level.name, 'levels': len(self.levels),
+                'target_ms': self.target_ms, 'frame_ms': self.estimate, 'frames': self.frames,
+                'frames_over_budget': self.frames_over_budget, 'changes': self.changes,
+                'last_change': self.last_change}
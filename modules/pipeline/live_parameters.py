@@ -0,0 +1,163 @@
+# live_parameters.py
+import collections
+import threading
+import time
+from types import MappingProxyType
+
+from modules.depth_map.depth_map_SGBM import SGBM_MODES
+from modules.depth_map.zones import ZoneDefinitions
+from modules.diagnostics import LatencyHistogram
+
+# OPC UA Filters nodes -> Preprocessor parameters; the Int32 nodes use the trackbar units (value * 100)
+PREPROCESS_NODES = {'noisefilter': 'NOISE_THRESHOLD', 'gamma': 'GAMMA', 'contrast': 'CONTRAST_LEVEL'}
+PREPROCESS_SCALE = 100
+ZONE_NODES = ('zones', 'zone1', 'zone2', 'zone3')
+
+
+# The parameters one frame runs with. Snapshots are never changed after they are published: every stage
+# of a frame reads the same one, so a frame can never see half of an update.
+class ParameterSnapshot:
+    __slots__ = ('version', 'preprocess', 'sgbm', 'zones', 'written')
+
+    def __init__(self, version, preprocess, sgbm, zones, written=None):
+        self.version = version
+        self.preprocess = preprocess  # Read-only mappings, shared with the previous snapshot when unchanged
+        self.sgbm = sgbm
+        self.zones = zones
+        self.written = written  # perf_counter() of the oldest write this snapshot applies
+
+
+# Double-buffered parameters fed by OPC UA writes (or anything else calling stage()).
+# The subscription thread only appends the raw write to a queue. A builder thread validates the writes,
+# builds the next snapshot off to the side and publishes it with a single reference swap. The frame loop
+# calls acquire() once per frame: one attribute read, no lock, and the apply latency (write -> first frame
+# using it) is recorded when a new snapshot is picked up. check_preprocess and check_sgbm, if given, raise
+# ValueError for filter or matcher parameters the frame loop cannot run with (Preprocessor.check_params,
+# DepthMapProcessorSGBM.check_params), so such writes are rejected.
+class LiveParameters:
+    def __init__(self, preprocess, sgbm, zones, instrumentation=None, check_preprocess=None, check_sgbm=None):
+        self.snapshot = ParameterSnapshot(0, MappingProxyType(dict(preprocess)), MappingProxyType(dict(sgbm)),
+                                          ZoneDefinitions(zones).zones)
+        self.instrumentation = instrumentation
+        self.check_preprocess = check_preprocess
+        self.check_sgbm = check_sgbm
+        self.pending = collections.deque()  # (name, value, perf_counter) from the writer threads
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.thread = None
+        self.acquired_version = 0  # Only touched by the thread calling acquire()
+        self.apply_latency = LatencyHistogram()
+        self.build_latency = LatencyHistogram()
+        self.writes = 0
+        self.rejected = 0
+
+    # Names of the OPC UA nodes that feed parameters
+    def nodes(self):
+        return tuple(PREPROCESS_NODES) + tuple(self.snapshot.sgbm) + ZONE_NODES
+
+    # Current values in node units, to initialise the OPC UA variables with
+    def node_values(self):
+        snapshot = self.snapshot
+        values = {name: int(round(snapshot.preprocess[key] * PREPROCESS_SCALE))
+                  for name, key in PREPROCESS_NODES.items() if key in snapshot.preprocess}
+        values.update({name: int(value) for name, value in snapshot.sgbm.items()})
+        return values
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="live-parameters", daemon=True)
+        self.thread.start()
+        return self
+
+    # Called from the OPC UA subscription thread: queue the write and return immediately.
+    # age is how long ago (s) the value was written, when the notification arrives later than that.
+    def stage(self, name, value, age=0.0):
+        self.pending.append((name, value, time.perf_counter() - age))
+        self.wakeup.set()
+
+    # Hot path: the snapshot for the next frame. Call from one thread only (the capture stage or frame loop).
+    def acquire(self):
+        snapshot = self.snapshot
+        if snapshot.version != self.acquired_version:
+            self.acquired_version = snapshot.version
+            if snapshot.written is not None:
+                self.apply_latency.record((time.perf_counter() - snapshot.written) * 1000.0)
+                if self.instrumentation is not None:
+                    self.instrumentation.record('parameter_apply', snapshot.written)
+        return snapshot
+
+    def run(self):
+        while not self.stopped:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            changes = []
+            while self.pending:
+                changes.append(self.pending.popleft())
+            if changes:
+                self.build(changes)
+
+    # Build the back buffer from the front one plus the queued writes, then swap it in
+    def build(self, changes):
+        front = self.snapshot
+        preprocess, sgbm = dict(front.preprocess), dict(front.sgbm)
+        zones = ZoneDefinitions(front.zones)
+        written = None
+        for name, value, stamp in changes:
+            self.writes += 1
+            try:
+                changed = self.apply(name, value, preprocess, sgbm, zones)
+            except (ValueError, TypeError) as e:
+                self.rejected += 1
+                print(f"Rejected parameter {name}={value!r}: {e}")
+                continue
+            if changed:
+                written = stamp if written is None else min(written, stamp)
+        if written is None:
+            return  # Only unchanged values (e.g. the initial subscription notifications) or rejected writes
+
+        self.snapshot = ParameterSnapshot(
+            front.version + 1,
+            front.preprocess if preprocess == front.preprocess else MappingProxyType(preprocess),
+            front.sgbm if sgbm == front.sgbm else MappingProxyType(sgbm),
+            front.zones if zones.zones == front.zones else zones.zones, written)
+        self.build_latency.record((time.perf_counter() - written) * 1000.0)
+
+    # Validate one write into the back buffer; returns True if it changed anything
+    def apply(self, name, value, preprocess, sgbm, zones):
+        if name in PREPROCESS_NODES:
+            key = PREPROCESS_NODES[name]
+            value = float(value) / PREPROCESS_SCALE
+            if value < 0:
+                raise ValueError("must not be negative")
+            if self.check_preprocess is not None:
+                self.check_preprocess(dict(preprocess, **{key: value}))
+            changed = preprocess.get(key) != value
+            preprocess[key] = value
+            return changed
+        if name in sgbm:
+            value = int(value)
+            if value < 0 or (name == 'numDisparities' and value < 1) or (
+                    name == 'mode' and value not in SGBM_MODES.values()):
+                raise ValueError("out of range")
+            if self.check_sgbm is not None:
+                self.check_sgbm(dict(sgbm, **{name: value}))
+            changed = sgbm[name] != value
+            sgbm[name] = value
+            return changed
+        if name in ZONE_NODES:
+            version = zones.version
+            if name == 'zones':
+                zones.set(value)
+            else:
+                zones.set_row(int(name[len('zone'):]) - 1, int(value))
+            return zones.version != version
+        raise ValueError("unknown parameter")
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+
+    def stats(self):
+        return {'version': self.snapshot.version, 'writes': self.writes, 'rejected': self.rejected,
+                'apply_latency': self.apply_latency.snapshot(), 'build_latency': self.build_latency.snapshot()}
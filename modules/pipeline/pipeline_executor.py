@@ -0,0 +1,183 @@
+# pipeline_executor.py
+import collections
+import threading
+import time
+
+
+# A frame travelling through the pipeline, keeping its sequence number, capture time and the longest
+# service time any stage spent on it (what bounds the frame rate once every stage runs in parallel)
+class PipelineFrame:
+    __slots__ = ('sequence', 'created', 'data', 'busiest_ms')
+
+    def __init__(self, sequence, created, data):
+        self.sequence = sequence
+        self.created = created
+        self.data = data
+        self.busiest_ms = 0.0
+
+
+# Bounded queue with a latest-frame-wins policy: putting into a full queue drops the oldest item
+class LatestQueue:
+    def __init__(self, maxsize=1):
+        self.items = collections.deque()
+        self.maxsize = maxsize
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item):
+        with self.condition:
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.condition.notify()
+
+    # Return the next item, or None once the queue is closed and empty
+    def get(self):
+        with self.condition:
+            while not self.items and not self.closed:
+                self.condition.wait()
+            return self.items.popleft() if self.items else None
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+
+# One pipeline stage: a worker thread applying fn to each frame's data and passing the result on.
+# A stage returning None filters the frame out; with pass_frame, fn gets the whole PipelineFrame.
+# Stages keep running while downstream stages are busy (the queues drop instead of blocking), so a stage must
+# not hand on buffers it reuses: a later frame would overwrite them while the next stage still reads them.
+class Stage:
+    def __init__(self, name, fn, queue_size=1, pass_frame=False):
+        self.name = name
+        self.fn = fn
+        self.pass_frame = pass_frame
+        self.input = LatestQueue(queue_size)
+        self.output = None  # Next stage's queue, or None for the last stage
+        self.thread = None
+        self.processed = 0
+        self.errors = 0
+        self.service_ms_avg = 0.0
+        self.service_ms_max = 0.0
+        self.queue_max = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=f"stage-{self.name}", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            frame = self.input.get()
+            if frame is None:
+                break
+            self.queue_max = max(self.queue_max, len(self.input) + 1)
+
+            start = time.perf_counter()
+            try:
+                frame.data = self.fn(frame if self.pass_frame else frame.data)
+            except Exception as e:
+                self.errors += 1
+                print(f"Pipeline stage {self.name} failed on frame {frame.sequence}: {e}")
+                continue
+            elapsed = (time.perf_counter() - start) * 1000.0
+            if elapsed > frame.busiest_ms:
+                frame.busiest_ms = elapsed
+
+            self.processed += 1
+            self.service_ms_avg += (elapsed - self.service_ms_avg) * (0.05 if self.processed > 1 else 1.0)
+            self.service_ms_max = max(self.service_ms_max, elapsed)
+
+            if frame.data is not None and self.output is not None:
+                self.output.put(frame)
+        if self.output is not None:
+            self.output.close()
+
+    def stats(self):
+        return {'queue_depth': len(self.input), 'queue_max': self.queue_max, 'dropped': self.input.dropped,
+                'processed': self.processed, 'errors': self.errors, 'service_ms_avg': self.service_ms_avg,
+                'service_ms_max': self.service_ms_max}
+
+
+# Runs a source and a chain of stages, each on its own worker, joined by bounded latest-wins queues.
+# The sink (last stage) only sees frames in increasing sequence order; monitor, if given, gets every
+# delivered PipelineFrame before the sink does.
+class PipelineExecutor:
+    def __init__(self, source, stages, sink, queue_size=1, monitor=None):
+        self.source = source  # Callable returning the next input, or None to stop
+        self.monitor = monitor
+        self.stages = [Stage(name, fn, queue_size) for name, fn in stages]
+        self.stages.append(Stage('sink', self.deliver, queue_size, pass_frame=True))
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.output = next_stage.input
+        self.sink = sink
+        self.source_thread = None
+        self.stopped = threading.Event()
+        self.sequence = 0
+        self.source_ms_avg = 0.0
+        self.last_delivered = -1
+        self.delivered = 0
+        self.out_of_order = 0
+        self.latency_ms_avg = 0.0
+        self.latency_ms_max = 0.0
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        self.source_thread = threading.Thread(target=self.produce, name="stage-source", daemon=True)
+        self.source_thread.start()
+        return self
+
+    def produce(self):
+        first_queue = self.stages[0].input
+        while not self.stopped.is_set():
+            start = time.perf_counter()
+            data = self.source()
+            if data is None:
+                break
+            elapsed = (time.perf_counter() - start) * 1000.0
+            self.source_ms_avg += (elapsed - self.source_ms_avg) * (0.05 if self.sequence else 1.0)
+            first_queue.put(PipelineFrame(self.sequence, time.monotonic(), data))
+            self.sequence += 1
+        self.stopped.set()
+        first_queue.close()
+
+    # Final stage: enforce ordering, track end-to-end latency and hand the result to the sink
+    def deliver(self, frame):
+        if frame.sequence <= self.last_delivered:
+            self.out_of_order += 1
+            return None
+        self.last_delivered = frame.sequence
+        latency = (time.monotonic() - frame.created) * 1000.0
+        self.delivered += 1
+        self.latency_ms_avg += (latency - self.latency_ms_avg) * (0.05 if self.delivered > 1 else 1.0)
+        self.latency_ms_max = max(self.latency_ms_max, latency)
+        if self.monitor is not None:
+            self.monitor(frame)
+        self.sink(frame.sequence, frame.data)
+        return None
+
+    # Block until the source stops (or timeout seconds pass); returns True if stopped
+    def wait(self, timeout=None):
+        return self.stopped.wait(timeout)
+
+    def stop(self):
+        self.stopped.set()
+        if self.source_thread is not None:
+            self.source_thread.join(timeout=2.0)
+        for stage in self.stages:
+            stage.input.close()
+            if stage.thread is not None:
+                stage.thread.join(timeout=2.0)
+
+    def stats(self):
+        stats = {stage.name: stage.stats() for stage in self.stages}
+        stats['source'] = {'frames': self.sequence, 'service_ms_avg': self.source_ms_avg}
+        stats['end_to_end'] = {'delivered': self.delivered, 'out_of_order': self.out_of_order,
+                               'latency_ms_avg': self.latency_ms_avg, 'latency_ms_max': self.latency_ms_max}
+        return stats
@@ -1,5 +1,6 @@
 from .contrast_enhancement import enhance_contrast
 from .noise_reduction import reduce_noise
 from .lighting_normalization import normalize_lighting
+from .preprocessing_engine import PreprocessingEngine
 
-__all__ = ['enhance_contrast', 'reduce_noise', 'normalize_lighting']
+__all__ = ['enhance_contrast', 'reduce_noise', 'normalize_lighting', 'PreprocessingEngine']
@@ -11,3 +11,8 @@ def normalize_lighting(image, gamma):
 
     # Rescale back to 0-255
     return np.uint8(corrected_image * 255)
+
+
+# 256-entry table giving the same result as normalize_lighting for every 8-bit value
+def gamma_lut(gamma):
+    return normalize_lighting(np.arange(256, dtype=np.uint8), gamma)
@@ -1,8 +1,18 @@
 # noise_reduction.py
+import math
+
 import cv2 as cv
 
 
+# Smallest odd Gaussian kernel covering +-3 sigma
+def gaussian_kernel_size(sigma):
+    return 2 * math.ceil(3 * sigma) + 1
+
+
 def reduce_noise(image, threshold):
-    # Placeholder for noise reduction logic
-    image_Gausian_blur = cv.GaussianBlur(image, (21, 21), threshold)
-    return image_Gausian_blur  # Simulate noise reduction
+    # A threshold of 0 disables the blur
+    if threshold <= 0:
+        return image.copy()
+    ksize = gaussian_kernel_size(threshold)
+    image_Gausian_blur = cv.GaussianBlur(image, (ksize, ksize), threshold)
+    return image_Gausian_blur
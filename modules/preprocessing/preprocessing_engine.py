@@ -0,0 +1,71 @@
+# preprocessing_engine.py
+import cv2 as cv
+import numpy as np
+
+from .contrast_enhancement import enhance_contrast
+from .lighting_normalization import gamma_lut, normalize_lighting
+from .noise_reduction import gaussian_kernel_size, reduce_noise
+
+
+# Fused noise reduction -> gamma -> CLAHE on preallocated buffers. Gamma tables and CLAHE
+# objects are cached per value, output buffers per resolution and stereo side. Outputs stay
+# valid for ring_size calls on the same side before their buffer is reused.
+class PreprocessingEngine:
+    def __init__(self, ring_size=2, tile_grid_size=(8, 8), max_cached=64):
+        self.ring_size = ring_size
+        self.tile_grid_size = tile_grid_size
+        self.max_cached = max_cached  # Bound the caches while someone drags a trackbar
+        self.buffers = {}
+        self.cursors = {}
+        self.gamma_luts = {}
+        self.clahes = {}
+
+    def get_gamma_lut(self, gamma):
+        lut = self.gamma_luts.get(gamma)
+        if lut is None:
+            if len(self.gamma_luts) >= self.max_cached:
+                self.gamma_luts.clear()
+            lut = self.gamma_luts[gamma] = gamma_lut(gamma)
+        return lut
+
+    def get_clahe(self, level):
+        clahe = self.clahes.get(level)
+        if clahe is None:
+            if len(self.clahes) >= self.max_cached:
+                self.clahes.clear()
+            clahe = self.clahes[level] = cv.createCLAHE(clipLimit=level, tileGridSize=self.tile_grid_size)
+        return clahe
+
+    # Next (work, output) buffer pair for this resolution and side
+    def get_buffers(self, shape, side):
+        key = (shape, side)
+        ring = self.buffers.get(key)
+        if ring is None:
+            ring = self.buffers[key] = [(np.empty(shape, np.uint8), np.empty(shape, np.uint8))
+                                        for _ in range(self.ring_size)]
+            self.cursors[key] = 0
+        index = self.cursors[key]
+        self.cursors[key] = (index + 1) % self.ring_size
+        return ring[index]
+
+    def process(self, image, params, side=0):
+        # Color images take the original (allocating) path through the LAB conversion
+        if image.ndim != 2 or image.dtype != np.uint8:
+            image = reduce_noise(image, params['NOISE_THRESHOLD'])
+            image = normalize_lighting(image, params['GAMMA'])
+            return enhance_contrast(image, params['CONTRAST_LEVEL'])
+
+        work, output = self.get_buffers(image.shape, side)
+        sigma = params['NOISE_THRESHOLD']
+        source = image
+        if sigma > 0:
+            ksize = gaussian_kernel_size(sigma)
+            cv.GaussianBlur(image, (ksize, ksize), sigma, dst=work)
+            source = work
+        cv.LUT(source, self.get_gamma_lut(params['GAMMA']), dst=work)
+        self.get_clahe(params['CONTRAST_LEVEL']).apply(work, dst=output)
+        return output
+
+    # Left and right share the cached tables and CLAHE objects but use separate buffers
+    def process_pair(self, left_image, right_image, params):
+        return self.process(left_image, params, side=0), self.process(right_image, params, side=1)
@@ -0,0 +1,6 @@
+# rig/__init__.py
+
+from .rig import Rig, run_rig
+from .supervisor import RigSupervisor
+
+__all__ = ['Rig', 'run_rig', 'RigSupervisor']
@@ -0,0 +1,95 @@
+# rig.py
+import queue
+import time
+
+import cv2 as cv
+
+from config import config
+from modules.camera import CameraInterface, ReplayCapture
+from modules.depth_map import Preprocessor, DepthMapProcessorSGBM
+from modules.edge_detection.calibration import Rectification
+from modules.edge_detection.calibration_bundle import calibration_sources
+
+
+# One stereo rig: its own cameras (or a recording), calibration, processors and zones. Settings is a
+# plain dict from config.RIGS; anything left out falls back to the single-rig config values.
+class Rig:
+    def __init__(self, name, settings):
+        self.name = name
+        self.settings = settings
+        self.zones = list(settings.get('zones', config.ZONES))
+        self.capture = None
+        self.rectification = None
+        self.preprocessor = None
+        self.depth_map_processor = None
+        self.frames = 0
+
+    def open(self):
+        settings = self.settings
+        if settings.get('replay'):
+            self.capture = ReplayCapture(settings['replay'], speed=settings.get('replay_speed', 1.0),
+                                         loop=settings.get('replay_loop', False)).start()
+        else:
+            camera = CameraInterface(settings.get('resolution', config.CAMERA_RESOLUTION), settings['left'],
+                                     settings['right'], stream_timeout=config.STREAM_TIMEOUT,
+                                     reconnect_delay=config.STREAM_RECONNECT_DELAY,
+                                     max_reconnect_delay=config.STREAM_MAX_RECONNECT_DELAY)
+            self.capture = camera.start_capture(max_skew=config.CAPTURE_MAX_SKEW, ring_size=config.CAPTURE_RING_SIZE,
+                                                max_age=config.CAPTURE_MAX_AGE)
+
+        map_file, q_file = calibration_sources(settings.get('calibration', config.CALIBRATION_BUNDLE),
+                                               settings.get('map_file', 'stereoMap.xml'),
+                                               settings.get('q_file', 'Q.xml'))
+        self.rectification = Rectification(map_file, interpolation=config.RECTIFICATION_INTERPOLATION,
+                                           fixed_point=config.RECTIFICATION_FIXED_POINT,
+                                           roi=settings.get('roi', config.RECTIFICATION_ROI))
+        self.preprocessor = Preprocessor(window_name=f"Preprocessing {self.name}", headless=True,
+                                         config_file=settings.get('preprocess_params',
+                                                                  './modules/depth_map/preprocess_params.json'))
+        self.depth_map_processor = DepthMapProcessorSGBM(
+            window_name=f"Depth Map {self.name}", q_file_path=q_file, headless=True,
+            config_file=settings.get('depth_map_params', './modules/depth_map/depth_map_params.json'),
+            match_mode=settings.get('match_mode', config.MATCH_MODE), band_margin=config.BAND_MARGIN,
+            zone_statistic=config.ZONE_STATISTIC, zone_percentiles=config.ZONE_PERCENTILES,
+            matcher_backend=settings.get('matcher_backend'))
+        return self
+
+    # Heights for the next pair; None at the end of a recording. A camera that stops delivering raises,
+    # so the supervisor restarts the worker.
+    def process_frame(self):
+        pair = self.capture.read_pair(timeout=1.0)
+        if pair is None:
+            if isinstance(self.capture, ReplayCapture):
+                return None
+            raise RuntimeError(f"Rig {self.name}: error capturing frames")
+        frame_left, frame_right, _, _ = pair
+        gray_left = cv.cvtColor(frame_left, cv.COLOR_BGR2GRAY) if frame_left.ndim == 3 else frame_left
+        gray_right = cv.cvtColor(frame_right, cv.COLOR_BGR2GRAY) if frame_right.ndim == 3 else frame_right
+
+        gray_left, gray_right = self.rectification.undistortrectify(gray_left, gray_right)
+        preprocessed_left, preprocessed_right = self.preprocessor.preprocess_pair(gray_left, gray_right)
+        heights = self.depth_map_processor.compute_heights(preprocessed_left, preprocessed_right, self.zones)
+        self.frames += 1
+        return heights
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.stop()
+
+
+# Worker process entry point: run one rig until stopped and send (rig, sequence, time, heights) to the
+# supervisor. A full results queue drops the frame rather than stalling the rig.
+def run_rig(name, settings, results, stop):
+    cv.setNumThreads(settings.get('threads', 1))  # One core per rig; the supervisor scales by processes
+    rig = Rig(name, settings).open()
+    try:
+        while not stop.is_set():
+            heights = rig.process_frame()
+            if heights is None:
+                break
+            try:
+                results.put_nowait((name, rig.frames, time.time(), [float(height) for height in heights]))
+            except queue.Full:
+                pass
+    finally:
+        rig.close()
@@ -0,0 +1,144 @@
+# supervisor.py
+import multiprocessing
+import queue
+import time
+
+from config import config
+from .rig import run_rig
+
+
+# State of one rig's worker process
+class RigWorker:
+    def __init__(self, name, settings):
+        self.name = name
+        self.settings = settings
+        self.process = None
+        self.restarts = 0
+        self.failures = 0  # Consecutive crashes, for the restart backoff
+        self.started_at = 0.0
+        self.restart_at = 0.0
+        self.finished = False  # Exited cleanly (end of a recording); not restarted
+        self.frames = 0
+        self.first_result = None
+        self.last_result = None
+        self.last_heights = None
+        self.publisher = None
+
+    def fps(self):
+        if self.first_result is None or self.last_result <= self.first_result:
+            return 0.0
+        return (self.frames - 1) / (self.last_result - self.first_result)
+
+    def stats(self):
+        return {'frames': self.frames, 'fps': self.fps(), 'restarts': self.restarts,
+                'running': self.process is not None and self.process.is_alive(), 'finished': self.finished,
+                'exitcode': self.process.exitcode if self.process is not None else None}
+
+
+# Runs every rig in its own worker process, publishes their heights to the rig's OPC UA subtree and
+# restarts workers that crash, waiting restart_delay seconds (doubling up to max_restart_delay) in between
+class RigSupervisor:
+    def __init__(self, rigs, opcua_server=None, restart_delay=1.0, max_restart_delay=30.0, queue_size=64,
+                 status_interval=1.0):
+        # Spawned workers start clean instead of inheriting the parent's OPC UA and camera threads
+        self.context = multiprocessing.get_context('spawn')
+        self.results = self.context.Queue(queue_size)
+        self.stop_event = self.context.Event()
+        self.workers = {name: RigWorker(name, settings) for name, settings in rigs.items()}
+        self.opcua_server = opcua_server
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.status_interval = status_interval
+        self.last_status = 0.0
+        self.started = None
+
+        if opcua_server is not None:
+            for name, worker in self.workers.items():
+                # Same default as Rig, so there is one height variable per height the rig produces
+                zones = worker.settings.get('zones', config.ZONES)
+                worker.publisher = opcua_server.add_rig(name, len(zones))
+
+    def start(self):
+        self.started = time.monotonic()
+        for worker in self.workers.values():
+            self.start_worker(worker)
+        return self
+
+    def start_worker(self, worker):
+        worker.started_at = time.monotonic()
+        worker.process = self.context.Process(target=run_rig, name=f"rig-{worker.name}", daemon=True,
+                                              args=(worker.name, worker.settings, self.results, self.stop_event))
+        worker.process.start()
+
+    # Hand out results for up to timeout seconds, then restart crashed workers and publish their status
+    def poll(self, timeout=0.5):
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                name, sequence, timestamp, heights = self.results.get(timeout=remaining)
+            except queue.Empty:
+                break
+            self.deliver(self.workers[name], heights)
+
+        now = time.monotonic()
+        for worker in self.workers.values():
+            self.check_worker(worker, now)
+        if self.opcua_server is not None and now - self.last_status >= self.status_interval:
+            self.last_status = now
+            for worker in self.workers.values():
+                self.opcua_server.publish_rig_status(worker.name, worker.stats())
+
+    def deliver(self, worker, heights):
+        now = time.monotonic()
+        worker.frames += 1
+        worker.first_result = worker.first_result or now
+        worker.last_result = now
+        worker.last_heights = heights
+        if worker.publisher is not None:
+            worker.publisher.publish(heights)
+
+    def check_worker(self, worker, now):
+        if worker.finished or self.stop_event.is_set():
+            return
+        process = worker.process
+        if process is not None and process.is_alive():
+            return
+        if process is not None and process.exitcode == 0:
+            worker.finished = True
+            print(f"Rig {worker.name} finished")
+            return
+
+        if worker.restart_at == 0.0:
+            # A worker that ran for a while before crashing starts the backoff over
+            worker.failures = worker.failures + 1 if now - worker.started_at < self.max_restart_delay else 1
+            delay = min(self.max_restart_delay, self.restart_delay * 2 ** (worker.failures - 1))
+            worker.restart_at = now + delay
+            print(f"Rig {worker.name} exited with code {process.exitcode}; restarting in {delay:.1f} s")
+        elif now >= worker.restart_at:
+            worker.restart_at = 0.0
+            worker.restarts += 1
+            self.start_worker(worker)
+
+    # Supervise until every worker finished or duration seconds passed (None runs until interrupted)
+    def run(self, duration=None):
+        end = time.monotonic() + duration if duration is not None else None
+        while not all(worker.finished for worker in self.workers.values()):
+            if end is not None and time.monotonic() >= end:
+                break
+            self.poll()
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        for worker in self.workers.values():
+            if worker.process is not None:
+                worker.process.join(timeout)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+
+    def stats(self):
+        rigs = {name: worker.stats() for name, worker in self.workers.items()}
+        return {'rigs': rigs, 'aggregate_fps': sum(rig['fps'] for rig in rigs.values()),
+                'frames': sum(rig['frames'] for rig in rigs.values())}